@@ -0,0 +1,69 @@
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from collections import defaultdict
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from linux_log_parser import HourlyCounts
+
+def generate_events(hosts, patterns, days, files, events, seed=42):
+    # Each host has its own rotated files and each file covers a consecutive range of days,
+    # the way a real scan visits them
+    rng = random.Random(seed)
+    pattern_names = [fr'\bpattern number {i} .* matched\b' for i in range(patterns)]
+    date_hours = [f"2025-{day // 28 + 1:02d}-{day % 28 + 1:02d} {hour:02d}" for day in range(days) for hour in range(24)]
+    hours_per_file = max(1, len(date_hours) // files)
+    for host in range(hosts):
+        hostname = f"node{host}"
+        for index in range(files):
+            file_path = f"/var/log/sosreport-{hostname}/var/log/pacemaker/pacemaker.log-{index:04d}.gz"
+            file_hours = date_hours[index * hours_per_file:(index + 1) * hours_per_file] or date_hours[-1:]
+            for _ in range(events // (hosts * files)):
+                yield hostname, rng.choice(pattern_names), rng.choice(file_hours), file_path
+
+def fill_nested(events):
+    # The nested defaultdict used before HourlyCounts
+    counts = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {'total': 0, 'files': defaultdict(int)})))
+    for hostname, pattern, date_hour, file_path in events:
+        counts[hostname][pattern][date_hour]['total'] += 1
+        counts[hostname][pattern][date_hour]['files'][file_path] += 1
+    return counts
+
+def fill_hourly_counts(events):
+    counts = HourlyCounts()
+    for hostname, pattern, date_hour, file_path in events:
+        counts.add(hostname, pattern, date_hour, file_path)
+    return counts
+
+def measure(label, fill, events):
+    tracemalloc.start()
+    start = time.perf_counter()
+    counts = fill(events)
+    elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<14} {current / 1024 / 1024:>8.1f} MB {len(events) / elapsed:>12,.0f} adds/sec")
+    return counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory use of HourlyCounts and the nested defaultdict")
+    parser.add_argument('--hosts', type=int, default=4, help="Number of hostnames (default is 4)")
+    parser.add_argument('--patterns', type=int, default=40, help="Number of patterns (default is 40)")
+    parser.add_argument('--days', type=int, default=60, help="Number of days of hour buckets (default is 60)")
+    parser.add_argument('--files', type=int, default=30, help="Number of log files (default is 30)")
+    parser.add_argument('--events', type=int, default=2000000, help="Number of matched lines (default is 2000000)")
+    args = parser.parse_args()
+
+    events = list(generate_events(args.hosts, args.patterns, args.days, args.files, args.events))
+    # The strings are shared by both structures, so only the structures themselves are measured
+    measure("nested dicts", fill_nested, events)
+    counts = measure("HourlyCounts", fill_hourly_counts, events)
+    print(f"{len(counts):,} cells")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_DIR)
+
+from linux_log_parser import compile_patterns, PatternMatcher
+
+SAMPLE_MESSAGES = [
+    "kernel: [12345.678901] eth0: link up, 1000 Mbps, full duplex",
+    "systemd[1]: Started Session 42 of user root.",
+    "sshd[2211]: Accepted publickey for azureuser from 10.0.0.4 port 51234",
+    "pacemaker-controld[1850]: notice: State transition S_IDLE -> S_POLICY_ENGINE",
+    "pacemaker-based[1845]: notice: Local CIB 0.123.4 differs from node2",
+    "corosync[1501]: [KNET  ] host: host: 2 has no active links",
+    "chronyd[900]: Selected source 169.254.169.123",
+    "waagent[1300]: INFO ExtHandler Checking for agent updates",
+]
+
+SAMPLE_HITS = [
+    "pacemaker-fenced[1847]: notice: cluster node node2 will be fenced: peer is no longer part of the cluster",
+    "corosync[1501]: [TOTEM ] A processor failed, forming new configuration.",
+    "pacemaker-controld[1850]: notice: Node node2 state is now lost",
+    "pacemaker-schedulerd[1849]: notice: Forcing rsc_SAPHana_HDB03 away from node1 after 1000000 failures",
+    "SAPHana(rsc_SAPHana_HDB_HDB00)[21210]: INFO: DEC: Finally get_role_by_landscape_status returns SFAIL",
+    "kernel: watchdog: BUG: soft lockup - CPU#3 stuck for 22s! [ds_agent:4321]",
+]
+
+def generate_lines(count, hit_ratio, seed=42):
+    rng = random.Random(seed)
+    lines = []
+    for i in range(count):
+        message = rng.choice(SAMPLE_HITS) if rng.random() < hit_ratio else rng.choice(SAMPLE_MESSAGES)
+        lines.append(f"Feb 16 03:{i // 60 % 60:02d}:{i % 60:02d} node1 {message}\n")
+    return lines
+
+def match_sequential(patterns, line):
+    for pattern in patterns:
+        if pattern.search(line):
+            return pattern
+    return None
+
+def run(label, match, lines):
+    start = time.perf_counter()
+    results = [match(line) for line in lines]
+    elapsed = time.perf_counter() - start
+    print(f"{label:<12} {len(lines) / elapsed:>12,.0f} lines/sec ({elapsed:.3f}s)")
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the PatternMatcher against the per-pattern loop")
+    parser.add_argument('-t', '--type', default='pacemaker', help="Type of log patterns to use (default is pacemaker)")
+    parser.add_argument('-n', '--lines', type=int, default=200000, help="Number of synthetic lines (default is 200000)")
+    parser.add_argument('--hit-ratio', type=float, default=0.02, help="Fraction of lines that match a pattern (default is 0.02)")
+    args = parser.parse_args()
+
+    os.chdir(REPO_DIR)
+    patterns = compile_patterns(args.type)
+    matcher = PatternMatcher(patterns)
+    lines = generate_lines(args.lines, args.hit_ratio)
+
+    print(f"{len(patterns)} patterns, {len(lines)} lines, hit ratio {args.hit_ratio}")
+    before = run("sequential", lambda line: match_sequential(patterns, line), lines)
+    after = run("matcher", matcher.match, lines)
+
+    if before != after:
+        mismatches = sum(1 for a, b in zip(before, after) if a is not b)
+        print(f"ERROR: {mismatches} lines matched a different pattern")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, REPO_DIR)
+
+import linux_log_parser
+from linux_log_parser import (compile_patterns, PatternMatcher, ScanOutput, new_error_hourly_counts, find_target_files,
+                              read_target_keywords, parse_log, extract_timestamp_hostname, open_compressed_file,
+                              iter_decoded_lines, COMPRESSED_EXTENSIONS)
+from generate_logs import generate_tree
+
+CASES = ['parse_log', 'extract_timestamp_hostname', 'main']
+
+def peak_rss_mb():
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in KB elsewhere
+    return max_rss / 1024 / 1024 if sys.platform == 'darwin' else max_rss / 1024
+
+def read_lines(file_path):
+    if file_path.endswith(COMPRESSED_EXTENSIONS):
+        with open_compressed_file(file_path) as stream:
+            return list(iter_decoded_lines(stream))
+    with open(file_path, 'r', encoding='latin-1') as f:
+        return f.readlines()
+
+def run_parse_log(data_dir, pattern_type, days):
+    matcher = PatternMatcher(compile_patterns(pattern_type))
+    file_paths = find_target_files(data_dir, read_target_keywords(pattern_type))
+    error_hourly_counts = new_error_hourly_counts()
+    start = time.perf_counter()
+    for file_path in file_paths:
+        # No sinks, only the scan itself is measured
+        parse_log(file_path, matcher, error_hourly_counts, days, ScanOutput())
+    elapsed = time.perf_counter() - start
+    return elapsed, sum(count for *_, count in error_hourly_counts)
+
+def run_extract_timestamp_hostname(data_dir, pattern_type, days):
+    lines = []
+    for file_path in find_target_files(data_dir, read_target_keywords(pattern_type)):
+        lines.extend(read_lines(file_path))
+    start = time.perf_counter()
+    extracted = sum(1 for line in lines if extract_timestamp_hostname(line, days)[0] is not None)
+    elapsed = time.perf_counter() - start
+    return elapsed, extracted
+
+def run_main(data_dir, pattern_type, days):
+    # The report and timeline files are written to a scratch directory
+    with tempfile.TemporaryDirectory() as output_dir:
+        for file_name in (f"{pattern_type}_pattern.txt", f"{pattern_type}_filelist.txt"):
+            os.symlink(os.path.join(REPO_DIR, file_name), os.path.join(output_dir, file_name))
+        os.chdir(output_dir)
+        sys.argv = ['linux_log_parser.py', '-t', pattern_type, '-d', data_dir, '--days', str(days), '--quiet']
+        start = time.perf_counter()
+        linux_log_parser.main()
+        elapsed = time.perf_counter() - start
+        os.chdir(REPO_DIR)
+    return elapsed, None
+
+def run_case(case, data_dir, pattern_type, days):
+    """
+    Runs one benchmark case in this process and prints its result as JSON, so the peak
+    RSS only covers that case.
+    """
+    os.chdir(REPO_DIR)
+    runner = {'parse_log': run_parse_log, 'extract_timestamp_hostname': run_extract_timestamp_hostname,
+              'main': run_main}[case]
+    elapsed, matches = runner(data_dir, pattern_type, days)
+    print(json.dumps({'seconds': elapsed, 'matches': matches, 'peak_rss_mb': peak_rss_mb()}))
+
+def run_case_process(case, data_dir, pattern_type, days):
+    command = [sys.executable, os.path.abspath(__file__), '--case', case, '--data', data_dir, '-t', pattern_type,
+               '--days', str(days)]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def git_version():
+    try:
+        result = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+def print_results(results, previous=None):
+    print(f"{'case':<28} {'lines/sec':>12} {'matches/sec':>12} {'peak RSS':>10}" + ("  vs previous" if previous else ""))
+    for case, result in results.items():
+        line = (f"{case:<28} {result['lines_per_sec']:>12,.0f} {result['matches_per_sec'] or 0:>12,.0f}"
+                f" {result['peak_rss_mb']:>7.1f} MB")
+        if previous and case in previous:
+            line += f"  {result['lines_per_sec'] / previous[case]['lines_per_sec']:.2f}x lines/sec"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark linux_log_parser on generated logs")
+    parser.add_argument('-t', '--type', default='pacemaker', help="Type of log patterns to use (default is pacemaker)")
+    parser.add_argument('--data', help="Directory of logs written by generate_logs.py, generated in a temporary directory if not set")
+    parser.add_argument('-n', '--lines', type=int, default=100000, help="Lines per log file and host when generating (default is 100000)")
+    parser.add_argument('--hosts', type=int, default=2, help="Number of hosts when generating (default is 2)")
+    parser.add_argument('--hit-ratio', type=float, default=0.02, help="Fraction of lines that match a pattern when generating (default is 0.02)")
+    parser.add_argument('--days', type=int, default=8, help="--days passed to the scan, covers all generated logs by default (default is 8)")
+    parser.add_argument('--cases', nargs='+', choices=CASES, default=CASES, help="Cases to run (default is all)")
+    parser.add_argument('--save', help="File to save the results to (default is bench_results_{timestamp}.json)")
+    parser.add_argument('--compare', help="Results file of an earlier run to compare with")
+    parser.add_argument('--case', choices=CASES, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        run_case(args.case, args.data, args.type, args.days)
+        return
+
+    # The pattern and filelist files are read from the repository directory
+    save_path = os.path.abspath(args.save or f"bench_results_{datetime.now().strftime('%m-%d-%H%M%S')}.json")
+    compare_path = os.path.abspath(args.compare) if args.compare else None
+    given_data_dir = os.path.abspath(args.data) if args.data else None
+    os.chdir(REPO_DIR)
+
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        data_dir = given_data_dir or scratch_dir
+        if not args.data:
+            print(f"Generating {args.hosts} hosts x {args.lines:,} lines per log ...")
+            generate_tree(data_dir, args.type, hosts=args.hosts, lines=args.lines, hit_ratio=args.hit_ratio)
+        with open(os.path.join(data_dir, 'manifest.json')) as manifest_file:
+            manifest = json.load(manifest_file)
+        target_files = {os.path.relpath(path, data_dir) for path in find_target_files(data_dir, read_target_keywords(args.type))}
+        lines = sum(info['lines'] for path, info in manifest['files'].items() if path in target_files)
+
+        results = {}
+        for case in args.cases:
+            result = run_case_process(case, data_dir, args.type, args.days)
+            if result['matches'] is None:
+                # main() does not return its counts, the scan matches the same lines as parse_log
+                result['matches'] = results.get('parse_log', {}).get('matches')
+            result['lines'] = lines
+            result['lines_per_sec'] = lines / result['seconds']
+            result['matches_per_sec'] = result['matches'] / result['seconds'] if result['matches'] is not None else None
+            results[case] = result
+
+    previous = None
+    if compare_path:
+        with open(compare_path) as previous_file:
+            previous_run = json.load(previous_file)
+        print(f"Comparing with {previous_run['version']} from {previous_run['date']}")
+        current_data = {key: value for key, value in manifest.items() if key not in ('files', 'end')}
+        if {key: value for key, value in previous_run['data'].items() if key != 'end'} != current_data:
+            print("Warning: the earlier run used different generated logs, the numbers are not comparable")
+        previous = previous_run['results']
+    print_results(results, previous)
+
+    with open(save_path, 'w') as save_file:
+        json.dump({
+            'version': git_version(),
+            'date': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'type': args.type,
+            'data': {key: value for key, value in manifest.items() if key != 'files'},
+            'results': results,
+        }, save_file, indent=2)
+    print(f"Results saved to {save_path}")
+
+if __name__ == "__main__":
+    main()
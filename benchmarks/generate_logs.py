@@ -0,0 +1,155 @@
+import argparse
+import gzip
+import json
+import lzma
+import os
+import random
+from datetime import datetime, timedelta
+
+# One generated log per LOG_PATTERNS timestamp style, named so the pacemaker and kernelhung
+# filelists pick them up: (relative path, style)
+LOG_FILES = [
+    ("var/log/messages", "syslog"),                # Jan 07 00:19:21 node1 ...
+    ("var/log/pacemaker/pacemaker.log", "pid"),    # Jan 07 00:19:21.123 [1850] node1 ...
+    ("var/log/cluster/corosync.log", "pid_nofrac"),  # Jan 07 00:19:21 [1501] node1 ...
+    ("var/log/ha-log", "iso"),                     # 2025-01-07T00:19:21.123456+00:00 node1 ...
+    ("var/log/kern.log", "syslog"),
+]
+
+# Rotated copies alternate between these, as logrotate leaves them
+ROTATED_COMPRESSION = ['.gz', '.xz']
+
+NOISE_MESSAGES = [
+    "kernel: [12345.678901] eth0: link up, 1000 Mbps, full duplex",
+    "systemd[1]: Started Session 42 of user root.",
+    "sshd[2211]: Accepted publickey for azureuser from 10.0.0.4 port 51234",
+    "pacemaker-controld[1850]: notice: State transition S_IDLE -> S_POLICY_ENGINE",
+    "pacemaker-based[1845]: notice: Local CIB 0.123.4 differs from node2",
+    "pacemaker-attrd[1848]: notice: Setting master-rsc_SAPHana_HDB00[node1]: 150 -> 150",
+    "corosync[1501]: [KNET  ] host: host: 2 (passive) best link: 0 (pri: 1)",
+    "chronyd[900]: Selected source 169.254.169.123",
+    "waagent[1300]: INFO ExtHandler Checking for agent updates",
+    "rsyslogd[880]: imjournal: journal files changed, reloading...",
+    "crmd[1850]:   notice: Result of monitor operation for rsc_ip_HDB_HDB00 on node1: ok",
+]
+
+# Lines matching <type>_pattern.txt, by pattern type
+HIT_MESSAGES = {
+    'pacemaker': [
+        "pacemaker-fenced[1847]: notice: cluster node node2 will be fenced: peer is no longer part of the cluster",
+        "pacemaker-controld[1850]: notice: Node node2 state is now lost",
+        "pacemaker-schedulerd[1849]: notice: Forcing rsc_SAPHana_HDB03 away from node1 after 1000000 failures",
+        "SAPHana(rsc_SAPHana_HDB_HDB00)[21210]: INFO: DEC: Finally get_role_by_landscape_status returns SFAIL",
+        "pacemaker-schedulerd[1849]: warning: Unexpected result (error) was recorded for monitor of rsc_nc_HDB",
+        "pacemaker-controld[1850]: error: Result of stop operation for rsc_SAPHana did not complete within 600s",
+    ],
+    'kernelhung': [
+        "kernel: watchdog: BUG: soft lockup - CPU#3 stuck for 22s! [ds_agent:4321]",
+        "kernel: ds_am module is lack of KernelSupport",
+        "iscsid[1120]: connection1:0: ping timeout of 5 secs expired, target did not respond",
+        "falcon-sensor[2002]: CrowdStrike(4): SSL handshake failed",
+    ],
+}
+
+# Not valid utf-8, so the utf-8 decode of the file fails and the latin-1 fallback is used
+LATIN1_MESSAGE = "useradd[3100]: new user: name=Ren\xe9e, UID=1001, GID=1001, home=/home/ren\xe9e"
+
+def format_line(style, moment, hostname, pid, message):
+    if style == "syslog":
+        return f"{moment:%b %d %H:%M:%S} {hostname} {message}"
+    if style == "pid":
+        return f"{moment:%b %d %H:%M:%S}.{moment.microsecond // 1000:03d} [{pid}] {hostname} {message}"
+    if style == "pid_nofrac":
+        return f"{moment:%b %d %H:%M:%S} [{pid}] {hostname} {message}"
+    return f"{moment:%Y-%m-%dT%H:%M:%S.%f}+00:00 {hostname} {message}"
+
+def generate_lines(rng, style, hostname, start, end, count, hit_messages, hit_ratio, latin1_ratio):
+    """
+    Yields `count` encoded lines with increasing timestamps between `start` and `end`.
+    """
+    step = (end - start) / max(count, 1)
+    for index in range(count):
+        moment = start + step * index + timedelta(microseconds=rng.randrange(1000000))
+        roll = rng.random()
+        if roll < hit_ratio:
+            message = rng.choice(hit_messages)
+        elif roll < hit_ratio + latin1_ratio:
+            message = LATIN1_MESSAGE
+        else:
+            message = rng.choice(NOISE_MESSAGES)
+        yield (format_line(style, moment, hostname, rng.randrange(1000, 30000), message) + "\n").encode('latin-1')
+
+def open_output(path):
+    if path.endswith('.gz'):
+        return gzip.open(path, 'wb')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'wb', preset=1)
+    return open(path, 'wb')
+
+def generate_tree(directory, pattern_type='pacemaker', hosts=2, lines=100000, days=7, rotations=2, hit_ratio=0.02,
+                  latin1_ratio=0.0001, seed=42, end=None):
+    """
+    Writes a synthetic sosreport-like tree, one <directory>/<hostname>/var/log per host.
+
+    Each log in LOG_FILES gets `lines` lines per host spread over the last `days` days,
+    split between the current file and `rotations` dated, compressed rotations. A
+    `hit_ratio` fraction of the lines match `pattern_type` patterns.
+    The output only depends on the arguments, `end` defaults to the current hour.
+
+    :return: A manifest dict with the arguments and the lines and bytes of each file, by relative path.
+    """
+    rng = random.Random(seed)
+    end = end or datetime.now().replace(minute=0, second=0, microsecond=0)
+    start = end - timedelta(days=days)
+    manifest = {
+        'type': pattern_type, 'hosts': hosts, 'lines': lines, 'days': days, 'rotations': rotations, 'hit_ratio': hit_ratio,
+        'latin1_ratio': latin1_ratio, 'seed': seed, 'end': end.isoformat(), 'files': {},
+    }
+
+    for host in range(hosts):
+        hostname = f"node{host + 1}"
+        for relative_path, style in LOG_FILES:
+            base_path = os.path.join(directory, hostname, relative_path)
+            os.makedirs(os.path.dirname(base_path), exist_ok=True)
+            # Oldest rotation first, the current file holds the most recent slice
+            slices = rotations + 1
+            for part in range(slices):
+                part_start = start + (end - start) * part / slices
+                part_end = start + (end - start) * (part + 1) / slices
+                count = lines // slices
+                if part == slices - 1:
+                    path = base_path
+                else:
+                    suffix = ROTATED_COMPRESSION[part % len(ROTATED_COMPRESSION)]
+                    path = f"{base_path}-{part_end:%Y%m%d}{suffix}"
+                with open_output(path) as output:
+                    lines_iter = generate_lines(rng, style, hostname, part_start, part_end, count,
+                                                HIT_MESSAGES[pattern_type], hit_ratio, latin1_ratio)
+                    output.writelines(lines_iter)
+                manifest['files'][os.path.relpath(path, directory)] = {'lines': count, 'bytes': os.path.getsize(path)}
+
+    with open(os.path.join(directory, 'manifest.json'), 'w') as manifest_file:
+        json.dump(manifest, manifest_file, indent=2)
+    return manifest
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic syslog, pacemaker and corosync logs for benchmarks")
+    parser.add_argument('-d', '--directory', required=True, help="Directory to write the logs to")
+    parser.add_argument('-t', '--type', default='pacemaker', choices=sorted(HIT_MESSAGES), help="Type of log patterns the hits match (default is pacemaker)")
+    parser.add_argument('--hosts', type=int, default=2, help="Number of hosts (default is 2)")
+    parser.add_argument('-n', '--lines', type=int, default=100000, help="Lines per log file and host, rotations included (default is 100000)")
+    parser.add_argument('--days', type=int, default=7, help="Days covered by the logs (default is 7)")
+    parser.add_argument('--rotations', type=int, default=2, help="Compressed rotations per log file (default is 2)")
+    parser.add_argument('--hit-ratio', type=float, default=0.02, help="Fraction of lines that match a pattern (default is 0.02)")
+    parser.add_argument('--latin1-ratio', type=float, default=0.0001, help="Fraction of lines that are not valid utf-8 (default is 0.0001)")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed (default is 42)")
+    args = parser.parse_args()
+
+    manifest = generate_tree(args.directory, args.type, args.hosts, args.lines, args.days, args.rotations, args.hit_ratio,
+                             args.latin1_ratio, args.seed)
+    total_lines = sum(info['lines'] for info in manifest['files'].values())
+    total_bytes = sum(info['bytes'] for info in manifest['files'].values())
+    print(f"{len(manifest['files'])} files, {total_lines:,} lines, {total_bytes / 1024 / 1024:.1f} MB written to {args.directory}")
+
+if __name__ == "__main__":
+    main()
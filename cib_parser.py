@@ -1,8 +1,15 @@
 import argparse
+import bz2
+import glob
+import gzip
+import lzma
+import math
 import os
+import re
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from xml.parsers import expat
 from datetime import datetime
-import sys
 from io import StringIO
 
 parsed_resources = set()  # To keep track of already parsed resources
@@ -23,7 +30,7 @@ def parse_operations(element, output):
             timeout = op.get('timeout')
             output.write(f"Operation: {op_name}, Interval: {interval}, Timeout: {timeout}\n")
 
-def parse_primitive_resource(resource, output):
+def parse_primitive_resource(resource, output, index=None):
     resource_id = resource.get('id')
     if resource_id in parsed_resources:
         return  # Skip already parsed resource
@@ -33,6 +40,8 @@ def parse_primitive_resource(resource, output):
     
     output.write("-" * 40 + "\n")
     output.write(f"Resource ID: {resource_id}, Resource Type: {resource_type}\n")
+    if index is not None:
+        write_resource_relations(resource_id, index, output)
     
     instance_attributes = resource.find("instance_attributes")
     for nvpair, context in parse_nvpair_elements(instance_attributes, "Parameter", output, context=resource_type):
@@ -45,17 +54,34 @@ def parse_primitive_resource(resource, output):
     operations = resource.find("operations")
     parse_operations(operations, output)
 
-def parse_group_element(group, output):
+def write_resource_relations(resource_id, index, output):
+    """
+    Writes the group, clone or master the resource belongs to and the constraints that
+    reference the resource or one of its parents.
+    """
+    resource_ids = [resource_id]
+    parent = index.parent_of(resource_id)
+    if parent is not None:
+        output.write(f"Parent: {parent.tag} {parent.get('id')}\n")
+    while parent is not None:
+        resource_ids.append(parent.get('id'))
+        parent = index.parent_of(parent.get('id'))
+    constraint_ids = dict.fromkeys(constraint.get('id') for related_id in resource_ids
+                                   for constraint in index.constraints_for(related_id))
+    if constraint_ids:
+        output.write(f"Constraints: {', '.join(constraint_ids)}\n")
+
+def parse_group_element(group, output, index=None):
     group_id = group.get('id')
     output.write("-" * 40 + "\n")
     output.write(f"Group ID: {group_id}\n")
 
     primitives = group.findall("primitive")
     for primitive in primitives:
-        for nvpair, context in parse_primitive_resource(primitive, output):
+        for nvpair, context in parse_primitive_resource(primitive, output, index):
             yield nvpair, context
 
-def parse_clone_element(clone, output):
+def parse_clone_element(clone, output, index=None):
     clone_id = clone.get('id')
     output.write("-" * 40 + "\n")
     output.write(f"Clone ID: {clone_id}\n")
@@ -66,10 +92,10 @@ def parse_clone_element(clone, output):
 
     primitives = clone.findall("primitive")
     for primitive in primitives:
-        for nvpair, context in parse_primitive_resource(primitive, output):
+        for nvpair, context in parse_primitive_resource(primitive, output, index):
             yield nvpair, context
 
-def parse_master_element(master, output):
+def parse_master_element(master, output, index=None):
     master_id = master.get('id')
     output.write("-" * 40 + "\n")
     output.write(f"Master/Slave ID: {master_id}\n")
@@ -80,7 +106,7 @@ def parse_master_element(master, output):
 
     primitive = master.find("primitive")
     if primitive is not None:
-        for nvpair, context in parse_primitive_resource(primitive, output):
+        for nvpair, context in parse_primitive_resource(primitive, output, index):
             yield nvpair, context
 
 def parse_node_element(node, output):
@@ -120,30 +146,407 @@ def parse_constraints(constraints, output):
             parsed_elements.append((constraint, "rsc_colocation"))
     return parsed_elements
 
-def parse_cib_xml(file_path, resource_types, output):
+# Resource containers whose direct primitive or group children belong to them
+RESOURCE_PARENT_TAGS = ('group', 'clone', 'master')
+# Constraint attributes that reference a resource id
+CONSTRAINT_RESOURCE_ATTRIBUTES = ('rsc', 'with-rsc', 'first', 'then')
+
+class CibIndex:
+    """
+    Index of the CIB elements the report and checks use, built in one walk of the tree.
+
+    The lists keep document order, so querying the index gives the same elements in the same
+    order as the `findall` searches it replaces.
+    """
+
+    def __init__(self, root):
+        self.primitives_by_type = {}
+        self.primitives_by_id = {}
+        self.resources_by_tag = {tag: [] for tag in RESOURCE_PARENT_TAGS}
+        # Resource id -> the group, clone or master element it is a direct child of
+        self.parents = {}
+        self.constraints = []
+        self.constraints_by_kind = {}
+        # Resource id -> constraints referencing it, directly or from a resource_set
+        self.constraints_by_resource = {}
+        self.nodes = []
+        self.rsc_defaults = []
+        self.op_defaults = []
+        self.bootstrap_options = None
+
+        # Depth first in document order, each element with its parent
+        stack = [(root, None)]
+        while stack:
+            element, parent = stack.pop()
+            tag = element.tag
+            parent_tag = parent.tag if parent is not None else None
+            stack.extend((child, element) for child in reversed(element))
+
+            if tag == 'primitive':
+                self.primitives_by_type.setdefault(element.get('type'), []).append(element)
+                self.primitives_by_id.setdefault(element.get('id'), element)
+            elif tag in RESOURCE_PARENT_TAGS:
+                self.resources_by_tag[tag].append(element)
+            elif tag == 'node':
+                self.nodes.append(element)
+            elif tag == 'meta_attributes' and parent_tag == 'rsc_defaults':
+                self.rsc_defaults.append(element)
+            elif tag == 'meta_attributes' and parent_tag == 'op_defaults':
+                self.op_defaults.append(element)
+            elif (tag == 'cluster_property_set' and element.get('id') == 'cib-bootstrap-options'
+                  and self.bootstrap_options is None):
+                self.bootstrap_options = element
+
+            if tag in ('primitive', 'group') and parent_tag in RESOURCE_PARENT_TAGS:
+                self.parents[element.get('id')] = parent
+            if parent_tag == 'constraints':
+                self.constraints.append(element)
+                self.constraints_by_kind.setdefault(tag, []).append(element)
+                resource_ids = [element.get(attribute) for attribute in CONSTRAINT_RESOURCE_ATTRIBUTES]
+                resource_ids += [resource_ref.get('id') for resource_ref in element.iterfind('resource_set/resource_ref')]
+                # A resource referenced several times by one constraint lists it once
+                for resource_id in dict.fromkeys(resource_ids):
+                    if resource_id is not None:
+                        self.constraints_by_resource.setdefault(resource_id, []).append(element)
+
+    def primitives_of_type(self, resource_type):
+        return self.primitives_by_type.get(resource_type, [])
+
+    def parent_of(self, resource_id):
+        """
+        :return: The group, clone or master element the resource is a direct child of, None for top level resources.
+        """
+        return self.parents.get(resource_id)
+
+    def constraints_for(self, resource_id):
+        """
+        :return: The constraints referencing the resource id, in document order.
+        """
+        return self.constraints_by_resource.get(resource_id, [])
+
+    def constraints_of_kind(self, kind):
+        return self.constraints_by_kind.get(kind, [])
+
+# Compressed CIBs are opened with the module for their extension
+CIB_OPENERS = {'.gz': gzip.open, '.bz2': bz2.open, '.xz': lzma.open}
+# Bytes of the CIB fed to expat at a time
+CIB_READ_SIZE = 65536
+# Longest source line kept for a warning, the elements of a longer line show their start tag
+SOURCE_LINE_LIMIT = 4096
+
+def open_cib_file(file_path):
+    opener = CIB_OPENERS.get(os.path.splitext(file_path)[1].lower(), open)
+    return opener(file_path, 'rb')
+
+class SourceLines:
+    """
+    Source lines of the CIB elements, looked up by element for the "Original line" of a warning.
+    Only the lines with the start tag of a kept element are stored, not the whole file. A line
+    longer than SOURCE_LINE_LIMIT, such as a CIB saved on one line, is not kept either, its
+    elements show their start tag instead.
+    """
+
+    def __init__(self):
+        self.line_numbers = {}
+        self.lines = {}
+        # Start tags of the elements whose line is not read yet, or is too long to keep
+        self.start_tags = {}
+        # Line number -> elements starting on it, for the lines not read yet
+        self.pending = {}
+        # Number and text so far of the line the next block continues
+        self.line_number = 1
+        self.carry = b''
+        self.carry_too_long = False
+
+    def add(self, element, line_number, start_tag):
+        self.line_numbers[element] = line_number
+        self.start_tags[element] = start_tag.decode('utf-8', 'replace') + "\n"
+        self.pending.setdefault(line_number, []).append(element)
+
+    def feed(self, block):
+        """
+        Reads the text of the pending lines that end in the block. Call it after the block was
+        parsed, so the elements starting in it are pending.
+        """
+        newlines = block.count(b'\n')
+        if newlines and self.pending and min(self.pending) < self.line_number + newlines:
+            for offset, part in enumerate(block.split(b'\n')[:-1]):
+                if self.line_number + offset in self.pending:
+                    if offset == 0:
+                        text = None if self.carry_too_long else self.carry + part
+                    else:
+                        text = part
+                    self._resolve(self.line_number + offset, text)
+
+        last_part = block[block.rfind(b'\n') + 1:]
+        if newlines:
+            self.carry = last_part
+            self.carry_too_long = False
+        elif not self.carry_too_long:
+            self.carry += last_part
+        if len(self.carry) > SOURCE_LINE_LIMIT:
+            self.carry = b''
+            self.carry_too_long = True
+        self.line_number += newlines
+
+    def finish(self):
+        # The last line has no newline
+        if self.line_number in self.pending:
+            self._resolve(self.line_number, None if self.carry_too_long else self.carry)
+        self.pending.clear()
+        self.carry = b''
+
+    def _resolve(self, line_number, text):
+        elements = self.pending.pop(line_number)
+        if text is None or len(text) > SOURCE_LINE_LIMIT:
+            return
+        self.lines[line_number] = text.rstrip(b'\r').decode('utf-8', 'replace') + "\n"
+        for element in elements:
+            del self.start_tags[element]
+
+    def write(self, output, element):
+        line_number = self.line_numbers.get(element)
+        text = self.lines.get(line_number) or self.start_tags.get(element)
+        if text is not None:
+            output.write(f"Original line {line_number}: {text}\n")
+
+# Milliseconds per unit of a CIB interval or timeout, a bare number is in seconds
+DURATION_UNITS = {'ms': 1, 'msec': 1, '': 1000, 's': 1000, 'sec': 1000, 'm': 60000, 'min': 60000, 'h': 3600000, 'hr': 3600000}
+# Pacemaker's timeout for operations that set none, in ms
+DEFAULT_OPERATION_TIMEOUT = 20000
+# Operations whose slowest run took at least this fraction of their timeout are flagged
+OPERATION_TIMEOUT_WARNING_RATIO = 0.8
+# op-status of an operation that timed out
+OPERATION_STATUS_TIMEOUT = '2'
+# rc-code of a monitor on a promoted instance, expected besides 0 when the transition-key has no target
+RC_RUNNING_PROMOTED = '8'
+
+def operation_failed(attributes):
+    """
+    :param attributes: Attributes of an lrm_rsc_op.
+    :return: True if the operation did not complete or returned another rc-code than expected.
+    """
+    if attributes.get('op-status', '0') != '0':
+        return True
+    rc_code = attributes.get('rc-code', '0')
+    # transition-key is action:transition:expected rc:uuid
+    transition_key = (attributes.get('transition-key') or '').split(':')
+    if len(transition_key) == 4 and transition_key[2].isdigit():
+        return rc_code != transition_key[2]
+    if attributes.get('operation') == 'monitor':
+        return rc_code not in ('0', RC_RUNNING_PROMOTED)
+    return rc_code != '0'
+
+def parse_duration_ms(value):
+    """
+    :param value: A CIB interval or timeout such as "60", "20s", "1m" or "500ms".
+    :return: The duration in milliseconds, None if it can not be parsed.
+    """
+    if value is None:
+        return None
+    value = value.strip().lower()
+    number = value.rstrip('abcdefghijklmnopqrstuvwxyz')
+    unit = value[len(number):]
+    if unit not in DURATION_UNITS:
+        return None
+    try:
+        return int(float(number) * DURATION_UNITS[unit])
+    except ValueError:
+        return None
+
+def percentile(sorted_values, fraction):
+    # Nearest rank, so the result is always one of the recorded values
+    return sorted_values[max(0, math.ceil(len(sorted_values) * fraction) - 1)] if sorted_values else None
+
+class OperationLatency:
+    """
+    Collects the exec-time and queue-time of the lrm_rsc_op entries in <status> while they
+    stream past, by resource, operation, interval and node.
+    """
+
+    def __init__(self):
+        self.node = None
+        self.resource = None
+        # (resource id, operation, interval ms, node) -> {'exec': [...], 'queue': [...], 'failed': n, 'timed_out': n}
+        self.operations = {}
+        # (resource id, operation, interval ms) -> configured timeout in ms
+        self.timeouts = {}
+        self.resource_types = {}
+
+    def status_element(self, tag, attributes):
+        if tag == 'node_state':
+            self.node = attributes.get('uname') or attributes.get('id')
+        elif tag == 'lrm_resource':
+            self.resource = attributes.get('id')
+            self.resource_types[self.resource] = attributes.get('type')
+        elif tag == 'lrm_rsc_op' and self.resource is not None:
+            exec_time = attributes.get('exec-time')
+            if exec_time is None or not exec_time.isdigit():
+                return
+            interval = parse_duration_ms((attributes.get('interval') or '0') + 'ms') or 0
+            key = (self.resource, attributes.get('operation'), interval, attributes.get('on_node') or self.node)
+            stats = self.operations.setdefault(key, {'exec': [], 'queue': [], 'failed': 0, 'timed_out': 0})
+            stats['exec'].append(int(exec_time))
+            queue_time = attributes.get('queue-time')
+            stats['queue'].append(int(queue_time) if queue_time and queue_time.isdigit() else 0)
+            if attributes.get('op-status') == OPERATION_STATUS_TIMEOUT:
+                stats['timed_out'] += 1
+            elif operation_failed(attributes):
+                stats['failed'] += 1
+
+    def resolve_timeouts(self, index):
+        """
+        Looks up the timeout each recorded operation runs with: its <op> in the resource's
+        <operations>, then the op_defaults timeout, then Pacemaker's default.
+
+        :param index: CibIndex of the configuration.
+        """
+        default_timeout = DEFAULT_OPERATION_TIMEOUT
+        for meta_attributes in index.op_defaults[:1]:
+            for nvpair in meta_attributes.findall("nvpair"):
+                if nvpair.get('name') == 'timeout' and parse_duration_ms(nvpair.get('value')) is not None:
+                    default_timeout = parse_duration_ms(nvpair.get('value'))
+
+        for resource_id, operation, interval, _ in self.operations:
+            # Clone instances are recorded as <id>:<instance>
+            primitive = index.primitives_by_id.get(resource_id.split(':')[0])
+            timeout = None
+            operations = primitive.find("operations") if primitive is not None else None
+            if operations is not None:
+                for op in operations.findall("op"):
+                    if op.get('name') == operation and (parse_duration_ms(op.get('interval') or '0') or 0) == interval:
+                        timeout = parse_duration_ms(op.get('timeout'))
+                        break
+            self.timeouts[(resource_id, operation, interval)] = timeout if timeout is not None else default_timeout
+
+    def report(self, deviations=None):
+        """
+        :param deviations: Set that receives a key for each kind of timeout warning, by resource agent type.
+        :return: The latency table and the warnings for operations close to their timeout, empty if <status> had no operations.
+        """
+        if deviations is None:
+            deviations = set()
+        if not self.operations:
+            return ""
+        output = StringIO()
+        output.write("\n" + "-" * 40 + "\nOperation Latency Analysis:\n\n")
+        output.write(f"{'Resource':<36} {'Operation':<18} {'Node':<16} {'Count':>5} {'p50 ms':>9} {'p95 ms':>9} "
+                     f"{'max ms':>9} {'queue max':>9} {'timeout ms':>10} {'failed':>6}\n")
+        warnings = []
+        for key in sorted(self.operations, key=lambda key: (key[0], key[1] or '', key[2], key[3] or '')):
+            resource_id, operation, interval, node = key
+            stats = self.operations[key]
+            exec_times = sorted(stats['exec'])
+            timeout = self.timeouts.get((resource_id, operation, interval))
+            operation_name = f"{operation}/{interval // 1000}s" if interval else operation
+            output.write(f"{resource_id:<36} {operation_name or '-':<18} {node or '-':<16} {len(exec_times):>5} "
+                         f"{percentile(exec_times, 0.5):>9} {percentile(exec_times, 0.95):>9} {exec_times[-1]:>9} "
+                         f"{max(stats['queue']):>9} {timeout if timeout is not None else '-':>10} "
+                         f"{stats['failed'] + stats['timed_out']:>6}\n")
+            if stats['timed_out']:
+                warnings.append(f"Warning: {resource_id} operation '{operation_name}' timed out {stats['timed_out']} time(s) on {node}"
+                                f" with a timeout of {timeout} ms.\n")
+                deviations.add(f"{self.resource_types.get(resource_id) or resource_id} operation '{operation_name}' timed out")
+            elif timeout and exec_times[-1] >= timeout * OPERATION_TIMEOUT_WARNING_RATIO:
+                warnings.append(f"Warning: {resource_id} operation '{operation_name}' took {exec_times[-1]} ms on {node},"
+                                f" {exec_times[-1] * 100 // timeout}% of its {timeout} ms timeout.\n")
+                deviations.add(f"{self.resource_types.get(resource_id) or resource_id} operation '{operation_name}' runs close to its timeout")
+        if warnings:
+            output.write("\n" + "".join(warnings))
+        report = output.getvalue()
+        output.close()
+        return report
+
+def parse_cib_tree(file_path, operation_latency=None):
+    """
+    Streams the CIB through expat into an ElementTree builder. The <status> section is
+    dropped while it streams past, so memory follows the size of <configuration> and not the
+    operation history in status. The source line of every kept element is recorded too.
+
+    :param file_path: Path of the CIB XML file, optionally compressed with gzip, bzip2 or xz.
+    :param operation_latency: OperationLatency fed the <status> elements as they stream past.
+    :return: The root element and the SourceLines of its elements.
+    """
+    builder = ET.TreeBuilder()
+    source_lines = SourceLines()
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    depth = 0
+    # Depth inside the skipped <status> element, 0 outside of it
+    skip_depth = 0
+    # The block being parsed and the one before it, to copy the start tag of an element
+    block = previous_block = b''
+    block_start = 0
+
+    def start_element(tag, attributes):
+        nonlocal depth, skip_depth
+        if skip_depth or (tag == 'status' and depth == 1):
+            skip_depth += 1
+            if operation_latency is not None:
+                operation_latency.status_element(tag, attributes)
+            return
+        depth += 1
+        index = parser.CurrentByteIndex - block_start
+        data = block
+        if index < 0:
+            # The start tag began in the previous block
+            data = previous_block + block
+            index = max(0, index + len(previous_block))
+        end = data.find(b'>', index, index + SOURCE_LINE_LIMIT)
+        start_tag = data[index:end + 1 if end >= 0 else index + SOURCE_LINE_LIMIT]
+        source_lines.add(builder.start(tag, attributes), parser.CurrentLineNumber, start_tag)
+
+    def end_element(tag):
+        nonlocal depth, skip_depth
+        if skip_depth:
+            skip_depth -= 1
+            return
+        depth -= 1
+        builder.end(tag)
+
+    def character_data(data):
+        if not skip_depth:
+            builder.data(data)
+
+    parser.StartElementHandler = start_element
+    parser.EndElementHandler = end_element
+    parser.CharacterDataHandler = character_data
+
+    with open_cib_file(file_path) as f:
+        while True:
+            previous_block = block
+            block_start += len(previous_block)
+            block = f.read(CIB_READ_SIZE)
+            if not block:
+                break
+            parser.Parse(block)
+            source_lines.feed(block)
+        parser.Parse(b'', True)
+        source_lines.finish()
+    return builder.close(), source_lines
+
+def parse_cib_xml(file_path, resource_types, output, operation_latency=None):
     no_resource_messages = []
 
     try:
-        tree = ET.parse(file_path)
-        root = tree.getroot()
-    except ET.ParseError as e:
+        root, source_lines = parse_cib_tree(file_path, operation_latency)
+    except (ET.ParseError, expat.ExpatError) as e:
         output.write(f"Error parsing XML file: {e}\n")
-        return None, no_resource_messages, []
+        return None, no_resource_messages, set(), [], SourceLines()
     except Exception as e:
         output.write(f"An error occurred while reading the XML file: {e}\n")
-        return None, no_resource_messages, []
+        return None, no_resource_messages, set(), [], SourceLines()
 
-    # Skip parsing the <status> section
-    # Remove the status element if it exists
-    status_element = root.find("status")
-    if status_element is not None:
-        root.remove(status_element)
+    # One walk of the tree, the sections below query the index instead of searching it again
+    index = CibIndex(root)
+    if operation_latency is not None:
+        operation_latency.resolve_timeouts(index)
 
     resource_types_found = set()
     parsed_elements = []
 
     for resource_type in resource_types:
-        resources = root.findall(f".//primitive[@type='{resource_type}']")
+        resources = index.primitives_of_type(resource_type)
         if not resources:
             no_resource_messages.append(f"No '{resource_type}' type resources found.\n")
             continue
@@ -154,53 +557,46 @@ def parse_cib_xml(file_path, resource_types, output):
         # Parse each primitive resource and add to parsed_elements
         for resource in resources:
             parsed_elements.append((resource, resource_type))  # Store the resource with its type as context
-            for nvpair, context in parse_primitive_resource(resource, output):
+            for nvpair, context in parse_primitive_resource(resource, output, index):
                 parsed_elements.append((nvpair, context))
 
     # Parse other elements like clones, groups, constraints, etc., as needed
-    clones = root.findall(".//clone")
-    for clone in clones:
-        for nvpair, context in parse_clone_element(clone, output):
+    for clone in index.resources_by_tag['clone']:
+        for nvpair, context in parse_clone_element(clone, output, index):
             parsed_elements.append((nvpair, context))
 
-    groups = root.findall(".//group")
-    for group in groups:
-        for nvpair, context in parse_group_element(group, output):
+    for group in index.resources_by_tag['group']:
+        for nvpair, context in parse_group_element(group, output, index):
             parsed_elements.append((nvpair, context))
 
-    masters = root.findall(".//master")
-    for master in masters:
-        for nvpair, context in parse_master_element(master, output):
+    for master in index.resources_by_tag['master']:
+        for nvpair, context in parse_master_element(master, output, index):
             parsed_elements.append((nvpair, context))
 
-    constraints = root.findall(".//constraints/*")
-    constraint_elements = parse_constraints(constraints, output)
+    constraint_elements = parse_constraints(index.constraints, output)
     parsed_elements.extend(constraint_elements)
 
-    rsc_defaults = root.findall(".//rsc_defaults/meta_attributes/nvpair")
-    if rsc_defaults:
+    if any(meta_attributes.find("nvpair") is not None for meta_attributes in index.rsc_defaults):
         output.write("-" * 40 + "\n")
         output.write("Resource Defaults:\n")
-        for nvpair, context in parse_nvpair_elements(root.find(".//rsc_defaults/meta_attributes"), "rsc_defaults", output, context="global"):
+        for nvpair, context in parse_nvpair_elements(index.rsc_defaults[0], "rsc_defaults", output, context="global"):
             parsed_elements.append((nvpair, context))
 
-    op_defaults = root.findall(".//op_defaults/meta_attributes/nvpair")
-    if op_defaults:
+    if any(meta_attributes.find("nvpair") is not None for meta_attributes in index.op_defaults):
         output.write("-" * 40 + "\n")
         output.write("Operation Defaults:\n")
-        for nvpair, context in parse_nvpair_elements(root.find(".//op_defaults/meta_attributes"), "Default Parameter", output, context="global"):
+        for nvpair, context in parse_nvpair_elements(index.op_defaults[0], "Default Parameter", output, context="global"):
             parsed_elements.append((nvpair, context))
 
-    cib_bootstrap_options = root.find(".//cluster_property_set[@id='cib-bootstrap-options']")
+    cib_bootstrap_options = index.bootstrap_options
     if cib_bootstrap_options is not None:
         output.write("-" * 40 + "\n")
         output.write("CIB Bootstrap Options:\n")
         for nvpair, context in parse_nvpair_elements(cib_bootstrap_options, "CIB Bootstrap Option", output, context="global"):
             parsed_elements.append((nvpair, context))
 
-    rsc_location_constraints = root.findall(".//rsc_location")
     cli_constraints_found = False
-    for rsc_location in rsc_location_constraints:
+    for rsc_location in index.constraints_of_kind('rsc_location'):
         if rsc_location.get('id', '').startswith('cli-'):
             cli_constraints_found = True
             output.write("-" * 40 + "\n")
@@ -213,12 +609,11 @@ def parse_cib_xml(file_path, resource_types, output):
     if not cli_constraints_found:
         no_resource_messages.append(f"No 'cli-' prefixed rsc_location constraints found.\n")
 
-    nodes = root.findall(".//node")
-    for node in nodes:
+    for node in index.nodes:
         for nvpair, context in parse_node_element(node, output):
             parsed_elements.append((nvpair, context))
 
-    return root, no_resource_messages, resource_types_found, parsed_elements
+    return index, no_resource_messages, resource_types_found, parsed_elements, source_lines
 
 def load_parameters(file_path):
     parameters = {}
@@ -250,7 +645,7 @@ def load_parameters(file_path):
         print(f"An error occurred while reading the parameters file: {e}")
     return parameters
 
-def check_operations(resource, context, parameters, analysis_output, original_lines):
+def check_operations(resource, context, parameters, analysis_output, source_lines, deviations):
     # print(f"Checking operations for resource type: {context}")
     operations = resource.find("operations")
     if operations is not None:
@@ -269,10 +664,8 @@ def check_operations(resource, context, parameters, analysis_output, original_li
                                 if value.lower() not in (ev.lower() for ev in expected_values):
                                     expected_values_str = ', '.join(expected_values)
                                     analysis_output.write(f"Warning: {context} operation '{op_name}' {property_name} is set to {value} instead of one of the best practice values: {expected_values_str}.\n")
-                                    for line in original_lines:
-                                        if f'id="{op.get("id")}"' in line and f'{property_name}="{value}"' in line:
-                                            analysis_output.write(f"Original line: {line}\n")
-                                            break
+                                    deviations.add(f"{context} operation '{op_name}' {property_name} is not a best practice value")
+                                    source_lines.write(analysis_output, op)
 
     # Check for missing operations
     defined_ops = {op.get('name') for op in operations.findall("op")} if operations else set()
@@ -281,9 +674,16 @@ def check_operations(resource, context, parameters, analysis_output, original_li
 
     for missing_op in missing_ops:
         analysis_output.write(f"Warning2: {context} operation '{missing_op}' setting is missing. It should be set to one of the best practice values.\n")
+        deviations.add(f"{context} operation '{missing_op}' is missing")
                                     
-def check_pacemaker_resource_values(parsed_elements, parameters, original_lines, resource_types_found):
+def check_pacemaker_resource_values(parsed_elements, parameters, source_lines, resource_types_found, deviations=None):
+    """
+    :param deviations: Set that receives one key per kind of warning, without the values, so the
+                       warnings of several CIBs can be counted together.
+    """
     analysis_output = StringIO()
+    if deviations is None:
+        deviations = set()
     found_parameters = {scope: {name: False for name in params} for scope, params in parameters.items()}
 
     def check_nvpair(nvpair, context):  
@@ -320,10 +720,8 @@ def check_pacemaker_resource_values(parsed_elements, parameters, original_lines,
                         filtered_expected_values = [ev for ev in expected_values if ev != "NULL"]
                         expected_values_str = ', '.join(filtered_expected_values)
                         analysis_output.write(f"Warning: {context} {name} is set to {value} instead of one of the best practice values: {expected_values_str}.\n")
-                        for line in original_lines:
-                            if f'name="{name}"' in line and f'value="{value}"' in line:
-                                analysis_output.write(f"Original line: {line}\n")
-                                break
+                        deviations.add(f"{context} {name} is not a best practice value")
+                        source_lines.write(analysis_output, nvpair)
 
     def check_constraint(constraint, context):
         # print(f"Debug Checking constraint: {constraint.tag}, ID = {constraint.get('id')}")
@@ -333,10 +731,8 @@ def check_pacemaker_resource_values(parsed_elements, parameters, original_lines,
                 param_value = param_value.strip()
             else:
                 analysis_output.write(f"Warning: {context} {param_name} is missing in constraint {constraint.get('id')}.\n")
-                for line in original_lines:
-                    if f'id="{constraint.get("id")}"' in line:
-                        analysis_output.write(f"Original line: {line}\n")
-                        break
+                deviations.add(f"{context} {param_name} is missing in a constraint")
+                source_lines.write(analysis_output, constraint)
                 continue
 
             found_parameters[context][param_name] = True
@@ -345,10 +741,8 @@ def check_pacemaker_resource_values(parsed_elements, parameters, original_lines,
             if param_value.lower() not in (ev.lower() for ev in expected_values):
                 expected_values_str = ', '.join(expected_values)
                 analysis_output.write(f"Warning: {context} {param_name} is set to {param_value} instead of one of the best practice values: {expected_values_str}.\n")
-                for line in original_lines:
-                    if f'{param_name}="{param_value}"' in line:
-                        analysis_output.write(f"Original line: {line}\n")
-                        break
+                deviations.add(f"{context} {param_name} is not a best practice value")
+                source_lines.write(analysis_output, constraint)
 
     # Iterate over parsed elements and check each
     for element, context in parsed_elements:
@@ -363,7 +757,7 @@ def check_pacemaker_resource_values(parsed_elements, parameters, original_lines,
             operations = element.find("operations")
             if operations is not None:
                 # print(f"Debug Checking operations for resource ID: {element.get('id')}")
-                check_operations(element, context, parameters, analysis_output, original_lines)
+                check_operations(element, context, parameters, analysis_output, source_lines, deviations)
         elif context == "rsc_colocation":
             # Special handling for rsc_colocation, if needed
             # print(f"Debug Checking Calling check_constraint for element ID: {element.get('id')}")
@@ -384,6 +778,7 @@ def check_pacemaker_resource_values(parsed_elements, parameters, original_lines,
                     filtered_expected_values = [ev for ev in parameters[scope][name] if ev != "NULL"]
                     expected_values_str = ', '.join(filtered_expected_values)
                     analysis_output.write(f"Warning1: {scope} {name} setting is missing. It should be set to one of the best practice values: {expected_values_str}.\n")
+                    deviations.add(f"{scope} {name} is missing")
 
     analysis_result = analysis_output.getvalue()
     analysis_output.close()
@@ -398,93 +793,249 @@ def determine_cluster_type(resource_types_found):
     
     if found_app_types:
         # If any main app types are found, return them as a statement
-        return f"This cluster is configured with application types: {', '.join(found_app_types)}."
+        return f"This cluster is configured with application types: {', '.join(sorted(found_app_types))}."
     else:
         # If none of the main app types are found, indicate it's a non-defined type
         return "This cluster is configured with non-defined application types."
         
+REPORT_TITLE = """
+##########################################
+#                                        #
+#       Pacemaker CIB Analysis Report    #
+#       From Azure Linux Team            #
+#                                        #
+##########################################
+"""
+# CIB file names picked up when a directory is given
+CIB_FILE_NAMES = ('cib.xml', 'cib.xml.gz', 'cib.xml.bz2', 'cib.xml.xz')
+
+def load_rules(script_dir):
+    """
+    Reads cib_resources.txt and cib_parameters_value.txt from the script directory.
+
+    :return: A tuple of (resource types, parameters), None if the files are missing or empty.
+    """
+    resources_file_path = os.path.join(script_dir, "cib_resources.txt")
+    if not os.path.isfile(resources_file_path):
+        print("cib_resources.txt file not found in the script directory.")
+        return None
+
+    parameters_file_path = os.path.join(script_dir, "cib_parameters_value.txt")
+    if not os.path.isfile(parameters_file_path):
+        print("cib_parameters_value.txt file not found in the script directory.")
+        return None
+
+    parameters = load_parameters(parameters_file_path)
+
+    try:
+        with open(resources_file_path, 'r') as file:
+            resource_types = [line.strip() for line in file.readlines() if line.strip()]
+    except Exception as e:
+        print(f"An error occurred while reading the resource types file: {e}")
+        return None
+
+    if not resource_types:
+        print("No resource types found in cib_resources.txt file.")
+        return None
+    return resource_types, parameters
+
+def analyze_cib(file_path, resource_types, parameters):
+    """
+    Parses and checks one CIB.
+
+    :return: A dict with the report parts ('report', 'analysis', None if the CIB could not be
+             parsed), the 'cluster_name', the configured 'nodes', the 'cluster_type' statement and
+             the set of 'deviations'.
+    """
+    # Resource ids are only reported once per CIB, not once per process
+    parsed_resources.clear()
+    output = StringIO()
+    operation_latency = OperationLatency()
+    index, no_resource_messages, resource_types_found, parsed_elements, source_lines = parse_cib_xml(file_path, resource_types, output, operation_latency)
+
+    # Determine the cluster type and add to the output
+    cluster_type_statement = determine_cluster_type(resource_types_found)
+    report = REPORT_TITLE + "\n" + cluster_type_statement + "\n\n" + "\n".join(no_resource_messages) + "\n" + output.getvalue()
+
+    analysis = None
+    cluster_name = None
+    nodes = []
+    deviations = set()
+    if index is not None:
+        analysis_output = check_pacemaker_resource_values(parsed_elements, parameters, source_lines, resource_types_found, deviations)
+        analysis_header = "\n" + "-" * 40 + "\nPacemaker Resource Analysis:\n" + "\n"
+        analysis = analysis_header + cluster_type_statement + "\n" + analysis_output + operation_latency.report(deviations)
+        if index.bootstrap_options is not None:
+            cluster_name = index.bootstrap_options.find("nvpair[@name='cluster-name']")
+            cluster_name = cluster_name.get('value') if cluster_name is not None else None
+        nodes = sorted(node.get('uname') or node.get('id') or '' for node in index.nodes)
+    return {'file_path': file_path, 'report': report, 'analysis': analysis, 'cluster_name': cluster_name, 'nodes': nodes,
+            'cluster_type': cluster_type_statement, 'deviations': deviations}
+
+def find_cib_files(inputs):
+    """
+    Expands the command line inputs into CIB files. Directories are searched recursively for
+    cib.xml and its compressed copies, glob patterns are expanded.
+
+    :return: A tuple of (CIB file paths in input order without duplicates, inputs that matched nothing).
+    """
+    file_paths = []
+    missing = []
+    for path in inputs:
+        if os.path.isdir(path):
+            found = [os.path.join(directory, file_name)
+                     for directory, _, file_names in sorted(os.walk(path))
+                     for file_name in sorted(file_names) if file_name in CIB_FILE_NAMES]
+        elif glob.has_magic(path):
+            found = [match for match in sorted(glob.glob(path, recursive=True)) if os.path.isfile(match)]
+        else:
+            found = [path] if os.path.isfile(path) else []
+        if not found:
+            missing.append(path)
+        file_paths.extend(found)
+    return list(dict.fromkeys(file_paths)), missing
+
+_worker_state = {}
+
+def init_cib_worker(resource_types, parameters):
+    _worker_state['resource_types'] = resource_types
+    _worker_state['parameters'] = parameters
+
+def analyze_cib_worker(file_path):
+    return analyze_cib(file_path, _worker_state['resource_types'], _worker_state['parameters'])
+
+def cluster_label(result):
+    # The CIB of each node of a cluster is the same, without a cluster-name its node names tell the clusters apart
+    if result['cluster_name']:
+        return result['cluster_name']
+    if result['nodes']:
+        return "nodes " + "+".join(result['nodes'])
+    return result['file_path']
+
+def format_fleet_summary(results):
+    """
+    :param results: analyze_cib results of every CIB in the batch.
+    :return: The fleet summary: the cluster type distribution and each deviation with the clusters that have it.
+    """
+    analyzed = [result for result in results if result['analysis'] is not None]
+    summary = StringIO()
+    summary.write("\n" + "#" * 42 + "\n#" + "Pacemaker CIB Fleet Summary".center(40) + "#\n" + "#" * 42 + "\n\n")
+    summary.write(f"CIB files: {len(results)}, analyzed: {len(analyzed)}, failed: {len(results) - len(analyzed)}\n")
+    summary.write(f"Clusters: {len({cluster_label(result) for result in analyzed})}\n")
+
+    # Clusters are counted once even when the CIB of several of their nodes was given
+    cluster_types = {}
+    deviations = {}
+    for result in analyzed:
+        label = cluster_label(result)
+        cluster_types.setdefault(result['cluster_type'], {})[label] = None
+        for deviation in result['deviations']:
+            deviations.setdefault(deviation, {})[label] = None
+
+    summary.write("\n" + "-" * 40 + "\nCluster Types:\n\n")
+    for cluster_type, clusters in sorted(cluster_types.items(), key=lambda item: (-len(item[1]), item[0])):
+        summary.write(f"{len(clusters):>5}  {cluster_type}\n")
+
+    summary.write("\n" + "-" * 40 + "\nDeviations:\n\n")
+    if not deviations:
+        summary.write("No deviations from the best practice values found.\n")
+    for deviation, clusters in sorted(deviations.items(), key=lambda item: (-len(item[1]), item[0])):
+        summary.write(f"{len(clusters):>5}  {deviation}\n")
+        summary.write(f"       {', '.join(clusters)}\n")
+
+    failed = [result for result in results if result['analysis'] is None]
+    if failed:
+        summary.write("\n" + "-" * 40 + "\nFailed to parse:\n\n")
+        for result in failed:
+            summary.write(f"{result['file_path']}\n")
+    return summary.getvalue()
+
+def run_batch(file_paths, resource_types, parameters, jobs, output_dir):
+    """
+    Analyzes several CIBs in a process pool with the rules loaded once, saves a report per CIB
+    and prints and saves the fleet summary.
+    """
+    timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    if jobs > 1:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_cib_worker, initargs=(resource_types, parameters)) as executor:
+            results = list(executor.map(analyze_cib_worker, file_paths))
+    else:
+        results = [analyze_cib(file_path, resource_types, parameters) for file_path in file_paths]
+
+    for number, result in enumerate(results, 1):
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', cluster_label(result)).strip('_')[-60:]
+        report_file_path = os.path.join(output_dir, f"cib-parser-{timestamp}-{number:03d}-{name}.txt")
+        with open(report_file_path, 'w') as file:
+            file.write(result['report'])
+            if result['analysis'] is not None:
+                file.write(result['analysis'] + "\n")
+                file.write("Pacemaker Resource Analysis Done\n")
+        status = f"{len(result['deviations'])} deviation types" if result['analysis'] is not None else "failed to parse"
+        print(f"{result['file_path']}: {status}, report saved to {report_file_path}")
+
+    summary = format_fleet_summary(results)
+    print(summary)
+    summary_file_path = os.path.join(output_dir, f"cib-fleet-summary-{timestamp}.txt")
+    with open(summary_file_path, 'w') as file:
+        file.write(summary)
+    print(f"Fleet summary saved to {summary_file_path}")
+
 def main():
     try:
         # Set up argument parser
         parser = argparse.ArgumentParser(description='Parse and analyze a CIB XML file.')
-        parser.add_argument('file_path', metavar='FILE_PATH', type=str, nargs='?', 
-                            help='The absolute path to the CIB XML file.')
+        parser.add_argument('file_paths', metavar='FILE_PATH', type=str, nargs='*',
+                            help='The absolute path to the CIB XML file. Several files, directories searched for cib.xml, or glob patterns run the batch mode with a fleet summary.')
+        parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of worker processes used in the batch mode (default is 1)")
+        parser.add_argument('-o', '--output-dir', help="Directory the reports are saved to (default is the script directory)")
         args = parser.parse_args()
 
+        if args.jobs < 1:
+            parser.error("--jobs must be at least 1")
+
         script_dir = os.path.dirname(os.path.abspath(__file__))
+        output_dir = args.output_dir or script_dir
 
-        if not args.file_path:
+        if not args.file_paths:
             print("Error: CIB XML file path is required.")
             print("Use -h or --help for usage information.")
             return
 
-        file_path = args.file_path
-
-        if not os.path.isfile(file_path):
-            print(f"The file {file_path} does not exist.")
-            return
-
-        resources_file_path = os.path.join(script_dir, "cib_resources.txt")
-        if not os.path.isfile(resources_file_path):
-            print("cib_resources.txt file not found in the script directory.")
-            return
-
-        parameters_file_path = os.path.join(script_dir, "cib_parameters_value.txt")
-        if not os.path.isfile(parameters_file_path):
-            print("cib_parameters_value.txt file not found in the script directory.")
-            return
-
-        parameters = load_parameters(parameters_file_path)
+        batch = len(args.file_paths) > 1 or os.path.isdir(args.file_paths[0]) or glob.has_magic(args.file_paths[0])
+        if batch:
+            file_paths, missing = find_cib_files(args.file_paths)
+            for path in missing:
+                print(f"No CIB file found for {path}.")
+            if not file_paths:
+                return
+        else:
+            file_path = args.file_paths[0]
+            if not os.path.isfile(file_path):
+                print(f"The file {file_path} does not exist.")
+                return
 
-        try:
-            with open(resources_file_path, 'r') as file:
-                resource_types = [line.strip() for line in file.readlines() if line.strip()]
-        except Exception as e:
-            print(f"An error occurred while reading the resource types file: {e}")
+        rules = load_rules(script_dir)
+        if rules is None:
             return
+        resource_types, parameters = rules
+        os.makedirs(output_dir, exist_ok=True)
 
-        if not resource_types:
-            print("No resource types found in cib_resources.txt file.")
+        if batch:
+            run_batch(file_paths, resource_types, parameters, args.jobs, output_dir)
             return
 
-        old_stdout = sys.stdout
-        sys.stdout = mystdout = StringIO()
-
-        with open(file_path, 'r') as f:
-            original_lines = f.readlines()
-
-        root, no_resource_messages, resource_types_found, parsed_elements = parse_cib_xml(file_path, resource_types, mystdout)
-
-        sys.stdout = old_stdout
-
-        output = mystdout.getvalue()
-        
-        # Determine the cluster type and add to the output
-        cluster_type_statement = determine_cluster_type(resource_types_found)
-        
-        title = """
-##########################################
-#                                        #
-#       Pacemaker CIB Analysis Report    #
-#       From Azure Linux Team            #
-#                                        #
-##########################################
-"""
-        
-        combined_output = title + "\n" + cluster_type_statement + "\n\n" + "\n".join(no_resource_messages) + "\n" + output
+        result = analyze_cib(file_path, resource_types, parameters)
+        combined_output = result['report']
 
         print(combined_output)
         
         timestamp = datetime.now().strftime('%Y%m%d-%H%M%S')
-        output_file_path = os.path.join(script_dir, f"cib-parser-{timestamp}.txt")
+        output_file_path = os.path.join(output_dir, f"cib-parser-{timestamp}.txt")
         with open(output_file_path, 'w') as file:
             file.write(combined_output)
 
-        if root is not None:
-            analysis_output = check_pacemaker_resource_values(parsed_elements, parameters, original_lines, resource_types_found)
-            
-            analysis_header = "\n" + "-" * 40 + "\nPacemaker Resource Analysis:\n" + "\n"
-            final_output = analysis_header + cluster_type_statement + "\n" + analysis_output
+        if result['analysis'] is not None:
+            final_output = result['analysis']
             
             print(final_output)
             print("\n" + "Pacemaker Resource Analysis Done\n")
@@ -1,6 +1,6 @@
 from datetime import datetime, timezone, timedelta
 import time
-from collections import defaultdict
+from collections import defaultdict, deque
 from datetime import datetime
 import os
 import re
@@ -9,6 +9,37 @@ import logging
 import argparse
 import gzip
 import lzma
+import bz2
+import io
+import hashlib
+import heapq
+import json
+import shutil
+import tempfile
+import mmap
+import struct
+import tarfile
+import csv
+import sqlite3
+import threading
+import queue
+from operator import itemgetter
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.block as lz4_block
+except ImportError:
+    lz4_block = None
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
 
 
 # Global pattern definitions
@@ -19,6 +50,32 @@ LOG_PATTERNS = [
     (r'^(\w{3} \d{2} \d{2}:\d{2}:\d{2}) \[\d+\] (\S+)', 4)
 ]
 
+# Compressed logs are streamed, zstd is only available when the zstandard module is installed
+COMPRESSED_EXTENSIONS = ('.gz', '.xz', '.bz2') + (('.zst',) if zstandard is not None else ())
+STREAM_BUFFER_SIZE = 1024 * 1024
+STREAM_LINE_LIMIT = 1024 * 1024
+OUTPUT_BUFFER_SIZE = 1024 * 1024
+FOLLOW_POLL_SECONDS = 1.0
+# Timestamp seeking stops once the search range is this small, and starts this far before the result
+SEEK_MARGIN = 64 * 1024
+SEEK_PROBE_LINES = 100
+# Plain files are memory-mapped and searched for the prefilter literals this many bytes at a time
+MAPPED_CHUNK_SIZE = 16 * 1024 * 1024
+# Decompressed chunks a ChunkReader thread may read ahead of the scan, STREAM_BUFFER_SIZE each
+READ_AHEAD_CHUNKS = 8
+NON_ASCII_BYTE_REGEX = re.compile(rb'[\x80-\xff]')
+# A line ends at \n, \r\n or a lone \r, as in universal newlines mode
+LINE_END_REGEX = re.compile(rb'\r\n?|\n')
+ARCHIVE_EXTENSIONS = ('.tar', '.zip', '.gz', '.bz2', '.xz', '.7z')
+# systemd journal files are read with JournalReader, '~' marks a journal that was not closed cleanly
+JOURNAL_EXTENSIONS = ('.journal', '.journal~')
+JOURNAL_SIGNATURE = b'LPKSHHRH'
+# The --days seek in a journal starts this many entries early, for entries logged while the clock was set back
+JOURNAL_SEEK_MARGIN = 1000
+# Length of the "%Y-%m-%d %H" and "%Y-%m-%d %H:%M" timestamp prefixes the counts are bucketed by
+HOUR_BUCKET_LENGTH = 13
+MINUTE_BUCKET_LENGTH = 16
+
 def compile_patterns(pattern_type):
     pattern_file = f"{pattern_type}_pattern.txt"
     
@@ -40,16 +97,286 @@ def compile_patterns(pattern_type):
 
     return [re.compile(pattern, re.IGNORECASE) for pattern in processed_patterns]
 
+# Inline flag groups such as (?x), (?s:...) or (?-i:...)
+INLINE_FLAGS_REGEX = re.compile(r'\(\?([aiLmsux-]+)[:)]')
+# Length of the argument of the escapes \xhh, \uhhhh and \Uhhhhhhhh
+ESCAPE_ARGUMENT_LENGTHS = {'x': 2, 'u': 4, 'U': 8}
+
+def extract_required_literal(pattern):
+    """
+    Extracts the longest plain substring that every match of `pattern` must contain.
+
+    Only top-level literal runs are considered; anything inside groups, character
+    classes or followed by an optional quantifier is skipped. Patterns using
+    alternation return None since no single literal is required.
+
+    :param pattern: The regex source string.
+    :return: The lowercased literal, or None if nothing can be extracted safely.
+    """
+    if '|' in pattern:
+        return None
+    # Inline flags other than (?i), e.g. (?x) which ignores the spaces of the literal
+    if any(set(flags) - {'i'} for flags in INLINE_FLAGS_REGEX.findall(pattern)):
+        return None
+
+    runs = []
+    current = []
+    depth = 0
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        if char == '\\':
+            escaped = pattern[i + 1:i + 2]
+            i += 2
+            if escaped and not escaped.isalnum() and depth == 0:
+                current.append(escaped)  # Escaped metacharacter, e.g. "\[" or "\("
+                continue
+            runs.append(''.join(current))  # Class, assertion or character code, e.g. "\b", "\d" or "\x41"
+            current = []
+            # Skip the argument of a character code, it is not plain text
+            if escaped in ESCAPE_ARGUMENT_LENGTHS:
+                i += ESCAPE_ARGUMENT_LENGTHS[escaped]
+            elif escaped == 'N' and pattern[i:i + 1] == '{':
+                closing = pattern.find('}', i)
+                i = closing + 1 if closing != -1 else len(pattern)
+            elif escaped.isdigit():
+                # Octal escape or group reference, at most three digits in all
+                digits = 1
+                while digits < 3 and pattern[i:i + 1].isdigit():
+                    i += 1
+                    digits += 1
+            continue
+        if char in '*?{':
+            # The preceding character is optional, so it cannot be part of the literal
+            if current:
+                current.pop()
+            runs.append(''.join(current))
+            current = []
+            if char == '{':
+                closing = pattern.find('}', i)
+                i = closing if closing != -1 else len(pattern)
+        elif char == '[':
+            runs.append(''.join(current))
+            current = []
+            # Skip the character class, a leading ']' or '^]' is part of the set
+            i += 1
+            if pattern[i:i + 1] == '^':
+                i += 1
+            if pattern[i:i + 1] == ']':
+                i += 1
+            while i < len(pattern) and pattern[i] != ']':
+                i += 2 if pattern[i] == '\\' else 1
+        elif char in '().^$+':
+            runs.append(''.join(current))
+            current = []
+            if char == '(':
+                depth += 1
+            elif char == ')':
+                depth -= 1
+        elif depth == 0:
+            current.append(char)
+        i += 1
+    runs.append(''.join(current))
+
+    literal = max(runs, key=len)
+    if not literal or not literal.isascii():
+        return None
+    return literal.lower()
+
+def literal_alternation(literals):
+    """
+    Builds one regex that finds any of `literals`, factored as a trie so that literals with a
+    common prefix share its branch. At each position the regex engine then follows a single
+    path instead of trying every literal in turn, and a match is the longest literal that
+    starts there.
+
+    :param literals: Non-empty collection of strings.
+    :return: The regex source.
+    """
+    trie = {}
+    for literal in literals:
+        node = trie
+        for char in literal:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def branch(node):
+        alternatives = [re.escape(char) + branch(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ''
+        source = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+        # A literal ends here, the longer ones that continue it are tried first
+        return f'(?:{source})?' if '' in node else source
+
+    return branch(trie)
+
+def compile_chunk_regex(literals):
+    """
+    :param literals: The lowercased prefilter literals.
+    :return: One bytes regex finding any of `literals` in an ASCII-lowercased chunk, see
+             iter_chunk_candidates, or None if there are no literals.
+    """
+    return re.compile(literal_alternation(literals).encode('ascii')) if literals else None
+
+class PatternMatcher:
+    """
+    Finds the first pattern, in pattern file order, that matches a line.
+
+    Each pattern gets a required literal from `extract_required_literal`. All literals are
+    searched with one trie-shaped alternation (see literal_alternation), which scans a line
+    once; a line is only checked with the patterns whose literal it contains. The remaining
+    candidates are checked with one combined regex whose alternatives are tried in pattern
+    order, each looking ahead for its pattern anywhere in the line, so the group that
+    matches is the first-match-wins result of searching every pattern in order.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.literals = [extract_required_literal(pattern.pattern) for pattern in patterns]
+        self.all_candidates = tuple(range(len(patterns)))
+        self.always_candidates = tuple(i for i, literal in enumerate(self.literals) if literal is None)
+        literals = {literal for literal in self.literals if literal is not None}
+        # Literal found in a line -> the patterns whose literal it contains, sorted
+        self.literal_candidates = {
+            literal: tuple(i for i, other in enumerate(self.literals) if other is not None and other in literal)
+            for literal in literals
+        }
+        self.literal_search = re.compile(literal_alternation(literals)).search if literals else None
+        self.chunk_regex = compile_chunk_regex(literals)
+        self.combined_cache = {}
+
+    def combined_regex(self, candidates):
+        if candidates in self.combined_cache:
+            return self.combined_cache[candidates]
+        combined = None
+        # Group numbers and backreferences of patterns with their own groups would change when combined
+        if not any(self.patterns[i].groups for i in candidates):
+            try:
+                combined = re.compile(
+                    '|'.join(f'(?=(?s:.*?)(?:{self.patterns[i].pattern}))(?P<p{i}>)' for i in candidates),
+                    re.IGNORECASE
+                ).match
+            except re.error:
+                # Patterns with inline flags cannot be combined
+                combined = None
+        self.combined_cache[candidates] = combined
+        return combined
+
+    def candidates(self, line):
+        # Non-ASCII text can case fold to ASCII under re.IGNORECASE (e.g. the Kelvin
+        # sign), which str.lower() does not model, so skip the prefilter for it
+        if not line.isascii():
+            return self.all_candidates
+        if self.literal_search is None:
+            return self.always_candidates
+
+        lowered = line.lower()
+        found = self.literal_search(lowered)
+        if found is None:
+            return self.always_candidates
+        candidates = set(self.always_candidates)
+        while found is not None:
+            candidates.update(self.literal_candidates[found.group()])
+            # The next literal may start inside this one
+            found = self.literal_search(lowered, found.start() + 1)
+        return tuple(sorted(candidates))
+
+    def match(self, line):
+        """
+        :param line: The log line to check.
+        :return: The compiled pattern that matched first, or None.
+        """
+        candidates = self.candidates(line)
+        if not candidates:
+            return None
+        if len(candidates) == 1:
+            pattern = self.patterns[candidates[0]]
+            return pattern if pattern.search(line) else None
+
+        combined = self.combined_regex(candidates)
+        if combined is None:
+            return next((self.patterns[i] for i in candidates if self.patterns[i].search(line)), None)
+
+        match = combined(line)
+        return self.patterns[int(match.lastgroup[1:])] if match is not None else None
+
+    def pattern_names(self):
+        """
+        :return: The name each pattern is counted and reported under, in pattern file order.
+        """
+        return [pattern.pattern for pattern in self.patterns]
+
+    def types_for(self, file_path):
+        # A single -t type has no per-type reports
+        return ()
+
+def typed_pattern_name(pattern_type, pattern):
+    return f"[{pattern_type}] {pattern}"
+
+class PatternSets:
+    """
+    The patterns of several -t types, scanned together so each file is read and decoded once.
+
+    Each type keeps its own PatternMatcher and first-match-wins order, so a line can match
+    one pattern of every type whose filelist includes the file. The prefilter attributes
+    are the union of the types', iter_candidate_lines yields every line any type can match.
+    Counts and profile timings name patterns with typed_pattern_name, split_counts turns
+    them back into the counts a scan of each type alone gives.
+    """
+
+    def __init__(self, matchers, target_keywords):
+        """
+        :param matchers: A dict of pattern type to its PatternMatcher, in -t order.
+        :param target_keywords: A dict of pattern type to its read_target_keywords list.
+        """
+        self.matchers = matchers
+        self.target_keywords = target_keywords
+        self.literals = [literal for matcher in matchers.values() for literal in matcher.literals]
+        self.always_candidates = tuple(i for i, literal in enumerate(self.literals) if literal is None)
+        self.chunk_regex = compile_chunk_regex({literal for literal in self.literals if literal is not None})
+
+    def pattern_names(self):
+        return [typed_pattern_name(pattern_type, name) for pattern_type, matcher in self.matchers.items()
+                for name in matcher.pattern_names()]
+
+    def union_keywords(self):
+        """
+        :return: The target keywords of all types, or an empty list if any type searches all files.
+        """
+        if any(not keywords for keywords in self.target_keywords.values()):
+            return []
+        return list(dict.fromkeys(keyword for keywords in self.target_keywords.values() for keyword in keywords))
+
+    def types_for(self, file_path):
+        file_name = os.path.basename(file_path)
+        return [pattern_type for pattern_type, keywords in self.target_keywords.items() if is_target_file(file_name, keywords)]
+
+    def split_counts(self, error_hourly_counts):
+        """
+        :return: A dict of pattern type to the HourlyCounts of its patterns, by their plain names.
+        """
+        counts_by_type = {pattern_type: new_error_hourly_counts(error_hourly_counts.bucket_length)
+                          for pattern_type in self.matchers}
+        for hostname, pattern, date_hour, file_path, count in error_hourly_counts:
+            pattern_type, _, name = pattern[1:].partition('] ')
+            counts_by_type[pattern_type].add(hostname, name, date_hour, file_path, count)
+        return counts_by_type
+
 def is_text_file(file_path, block_size=512):
-    if file_path.endswith(('.tar', '.zip', '.gz', '.bz2', '.xz', '.7z')):
+    if file_path.endswith(ARCHIVE_EXTENSIONS):
         return False
 
     try:
         with open(file_path, 'rb') as file:
-            block = file.read(block_size)
-            block.decode('utf-8')
-            return True
-    except (UnicodeDecodeError, FileNotFoundError):
+            return is_text_block(file.read(block_size))
+    except FileNotFoundError:
+        return False
+
+def is_text_block(block):
+    try:
+        block.decode('utf-8')
+        return True
+    except UnicodeDecodeError:
         return False
 
 def read_target_keywords(pattern_type):
@@ -130,357 +457,2846 @@ def should_parse_file(filename, days_to_analyze):
         return file_date >= cutoff_date
     return True  # If no date is found, assume it's a recent log
 
-def parse_and_format_timestamp(timestamp, current_year, days_to_analyze):
-    formats = [
-        # Pattern order matter here
-        "%b %d %H:%M:%S",     # Pattern for "Jan 07 00:19:21"
-        "%b %d %H:%M:%S.%f",  # Pattern for "Feb 16 03:20:34.165"
-        "%Y-%m-%dT%H:%M:%S.%f%z"  # Pattern for "2025-03-07T01:45:59.817699+00:00"
-    ]
-    
-    current_month = datetime.now().month
+MONTH_ABBREVIATIONS = {
+    name: number for number, name in enumerate(
+        ['jan', 'feb', 'mar', 'apr', 'may', 'jun', 'jul', 'aug', 'sep', 'oct', 'nov', 'dec'], start=1
+    )
+}
+
+# All LOG_PATTERNS are anchored at the start of the line, so one alternation tried in list
+# order picks the same pattern as matching them one by one
+LOG_LINE_REGEX = re.compile('|'.join(f'(?:{pattern})' for pattern, _ in LOG_PATTERNS))
+
+class TimestampParser:
+    """
+    Extracts and formats line timestamps against a cutoff computed once per run.
+
+    Timestamps are parsed by fixed character offsets instead of datetime.strptime, and the
+    formatted result is cached per timestamp truncated to the second, which repeats heavily
+    when a burst of matching lines is logged.
+    """
+
+    CACHE_LIMIT = 100000
 
-    for fmt in formats:
+    def __init__(self, days_to_analyze, now=None):
+        self.days_to_analyze = days_to_analyze
+        self.now = now or datetime.now()
+        self.current_year = self.now.year
+        self.current_month = self.now.month
+        self.cutoff = self.now - timedelta(days=days_to_analyze)
+        self.cutoff_aware = self.now.astimezone() - timedelta(days=days_to_analyze)
+        self.cutoff_hour = self.cutoff.strftime("%Y-%m-%d %H")
+        self.cache = {}
+
+    def parse_syslog(self, timestamp):
+        # "Jan 07 00:19:21", the year is missing and inferred from the current month
+        month = MONTH_ABBREVIATIONS.get(timestamp[:3].lower())
+        if month is None:
+            return None
+        year = self.current_year - 1 if month > self.current_month else self.current_year
+        parsed_date = datetime(year, month, int(timestamp[4:6]),
+                               int(timestamp[7:9]), int(timestamp[10:12]), int(timestamp[13:15]))
+        return parsed_date
+
+    def parse_iso(self, timestamp):
+        # "2025-03-07T01:45:59.817699+00:00", the fraction is dropped since output is per second
+        fraction, offset = timestamp[20:].split('+')
+        if len(fraction) > 6 or len(offset) != 5:
+            return None
+        tzinfo = timezone(timedelta(hours=int(offset[:2]), minutes=int(offset[3:])))
+        parsed_date = datetime(int(timestamp[:4]), int(timestamp[5:7]), int(timestamp[8:10]),
+                               int(timestamp[11:13]), int(timestamp[14:16]), int(timestamp[17:19]), tzinfo=tzinfo)
+        return parsed_date
+
+    def parse_datetime(self, timestamp):
+        """
+        :return: The timestamp as a datetime, aware for ISO timestamps, or None if it cannot be parsed.
+        """
         try:
-            parsed_date = datetime.strptime(timestamp, fmt)
-            # print(f"DEBUG: Parsed date (initial): {parsed_date}")  # Debugging output for initial parsed date
-            
-            # If the year is missing, parsed_date.year will be 1900
-            if parsed_date.year == 1900:
-                # Assign last year if the month is greater than the current month
-                if parsed_date.month > current_month:
-                    parsed_date = parsed_date.replace(year=current_year - 1)
-                    # print(f"DEBUG: Parsed date (initial): {parsed_date}")  # Debugging output for initial parsed date
-                else:
-                    parsed_date = parsed_date.replace(year=current_year)
-                    # print(f"DEBUG: Adjusted year (current year): {parsed_date}")  # Debugging output for adjusted date
-                    
-            # Make current time aware by using the parsed_date's timezone
-            now_aware = datetime.now(parsed_date.tzinfo)
-            
-            # Check if the parsed date is within the last days
-            if parsed_date < now_aware - timedelta(days=days_to_analyze):
-                # print(f"DEBUG: Parsed date is older than {DAYS_TO_ANALYZE} days: {parsed_date}")  # Debugging output for date check
-                return None
+            return self.parse_iso(timestamp) if timestamp[4:5] == '-' else self.parse_syslog(timestamp)
+        except ValueError:
+            return None
 
-            return parsed_date.strftime("%Y-%m-%d %H:%M:%S")
-        except ValueError as e:
-            # Debugging output for timestamp parsing failures, this is normal that if one previous format gives exception then it will continue
-            # print(f"DEBUG exception: Failed to parse timestamp: {timestamp} using format {fmt}. Error: {e}")
-            continue
-            
-    return None
+    def is_before_cutoff(self, parsed_date):
+        return parsed_date < (self.cutoff if parsed_date.tzinfo is None else self.cutoff_aware)
 
-def extract_timestamp_hostname(line, days_to_analyze):
-    current_year = datetime.now().year
+    def line_in_window(self, line):
+        """
+        :return: True if the line's timestamp is within --days, False if it is older, or None
+                 if the line has no parseable timestamp.
+        """
+        match = LOG_LINE_REGEX.match(line)
+        if match is None:
+            return None
+        parsed_date = self.parse_datetime(match.group(match.lastindex - 1))
+        if parsed_date is None:
+            return None
+        return not self.is_before_cutoff(parsed_date)
 
-    for pattern, _ in LOG_PATTERNS:
-        match = re.match(pattern, line)
-        if match:
-            timestamp, hostname = match.groups()
-            hostname = hostname.lower()  # Normalize to lowercase
-            formatted_timestamp = parse_and_format_timestamp(timestamp, current_year, days_to_analyze)
-            if formatted_timestamp is None:
-                # print(f"DEBUG: Failed to format timestamp: {timestamp}")
-                continue
-            return formatted_timestamp, hostname
+    def parse(self, timestamp):
+        """
+        :param timestamp: Timestamp text captured by one of the LOG_PATTERNS.
+        :return: The timestamp formatted as "%Y-%m-%d %H:%M:%S", or None if it cannot be
+                 parsed or is older than the cutoff.
+        """
+        is_iso = timestamp[4:5] == '-'
+        key = timestamp[:19] + timestamp[timestamp.find('+'):] if is_iso else timestamp[:15]
+        if key in self.cache:
+            return self.cache[key]
 
-    # print(f"DEBUG: Failed to extract timestamp/hostname from line: {line.strip()}")
-    return None, None
+        parsed_date = self.parse_datetime(timestamp)
+        if parsed_date is not None and self.is_before_cutoff(parsed_date):
+            parsed_date = None
+        formatted_timestamp = None if parsed_date is None else (
+            f"{parsed_date.year:04d}-{parsed_date.month:02d}-{parsed_date.day:02d} "
+            f"{parsed_date.hour:02d}:{parsed_date.minute:02d}:{parsed_date.second:02d}"
+        )
 
-def decompress_file(file_path):
-    decompressed_content = None
-    decompressed_file_path = None
-    
+        if len(self.cache) >= self.CACHE_LIMIT:
+            self.cache.clear()
+        self.cache[key] = formatted_timestamp
+        return formatted_timestamp
+
+    def parse_line(self, line):
+        """
+        :param line: The log line to parse.
+        :return: A tuple of (formatted timestamp, lowercased hostname, end offset of the
+                 timestamp/hostname prefix), or None if the line has no usable timestamp.
+        """
+        match = LOG_LINE_REGEX.match(line)
+        if match is None:
+            # print(f"DEBUG: Failed to extract timestamp/hostname from line: {line.strip()}")
+            return None
+        # The hostname is the last group of whichever pattern matched, the timestamp precedes it
+        timestamp, hostname = match.group(match.lastindex - 1, match.lastindex)
+        formatted_timestamp = self.parse(timestamp)
+        if formatted_timestamp is None:
+            # print(f"DEBUG: Failed to format timestamp: {timestamp}")
+            return None
+        return formatted_timestamp, hostname.lower(), match.end()
+
+    def extract(self, line):
+        parsed = self.parse_line(line)
+        if parsed is None:
+            return None, None
+        return parsed[0], parsed[1]
+
+# One parser per process and --days value, so "now" and the cutoff are computed once per run
+_timestamp_parsers = {}
+
+def get_timestamp_parser(days_to_analyze):
+    parser = _timestamp_parsers.get(days_to_analyze)
+    if parser is None:
+        parser = _timestamp_parsers[days_to_analyze] = TimestampParser(days_to_analyze)
+    return parser
+
+def reset_timestamp_parser(days_to_analyze):
+    """
+    Recomputes "now" and the cutoff, used by --follow where a run lasts for days.
+    """
+    _timestamp_parsers[days_to_analyze] = TimestampParser(days_to_analyze)
+    return _timestamp_parsers[days_to_analyze]
+
+def extract_timestamp_hostname(line, days_to_analyze):
+    return get_timestamp_parser(days_to_analyze).extract(line)
+
+def open_compressed_file(file_path, fileobj=None):
+    """
+    Opens a compressed log file as a binary stream that decompresses on demand.
+
+    :param file_path: Path to a file ending in one of COMPRESSED_EXTENSIONS.
+    :param fileobj: An already open binary stream of the compressed data, e.g. an archive member.
+    :return: A readable binary file object.
+    """
+    source = fileobj if fileobj is not None else file_path
     if file_path.endswith('.gz'):
-        decompressed_file_path = file_path[:-3]  # Remove '.gz' extension
-        with gzip.open(file_path, 'rt', encoding='utf-8') as f:
-            decompressed_content = f.read()
-    elif file_path.endswith('.xz'):
-        decompressed_file_path = file_path[:-3]  # Remove '.xz' extension
-        with lzma.open(file_path, 'rt', encoding='utf-8') as f:
-            decompressed_content = f.read()
-
-    if decompressed_content is not None and decompressed_file_path is not None:
-        # Write the decompressed content to a file
-        with open(decompressed_file_path, 'w', encoding='utf-8') as decompressed_file:
-            decompressed_file.write(decompressed_content)
-    
-    return decompressed_content
-        
-def parse_log(file_path, patterns, error_hourly_counts, days_to_analyze, output_file=None):
-    if not should_parse_file(os.path.basename(file_path), days_to_analyze):
-        logging.info(f"Skipping file {file_path} as it is older than {days_to_analyze} days.")
-        return
-    
-    if not file_path or (not is_text_file(file_path) and not file_path.endswith(('.gz', '.xz'))):
-        logging.warning(f"Skipping non-text or unreadable file: {file_path}")
+        return gzip.open(source, 'rb')
+    if file_path.endswith('.xz'):
+        return lzma.open(source, 'rb')
+    if file_path.endswith('.bz2'):
+        return bz2.open(source, 'rb')
+    if file_path.endswith('.zst') and zstandard is not None:
+        reader = zstandard.ZstdDecompressor().stream_reader(fileobj if fileobj is not None else open(file_path, 'rb'))
+        return io.BufferedReader(reader, buffer_size=STREAM_BUFFER_SIZE)
+    raise ValueError(f"Unsupported compression format: {file_path}")
+
+def iter_decoded_lines(stream, decode=None):
+    """
+    Yields decoded lines from a binary stream without reading it all into memory.
+
+    Lines are read with a bounded buffer, so a line longer than STREAM_LINE_LIMIT bytes
+    is yielded in pieces. Lines that are not valid UTF-8 are decoded as latin-1.
+
+    :param decode: Replaces decode_line, used by --profile to time decoding.
+    """
+    decode = decode or decode_line
+    for raw_line in iter(lambda: stream.readline(STREAM_LINE_LIMIT), b''):
+        yield decode(raw_line)
+
+def decode_line(raw_line):
+    try:
+        return raw_line.decode('utf-8')
+    except UnicodeDecodeError:
+        return raw_line.decode('latin-1')
+
+def iter_candidate_lines(buffer, offset, matcher, decode=None, file_stats=None):
+    """
+    Yields the decoded lines of a memory-mapped file from `offset` on that can match a pattern.
+
+    The file is cut into chunks of whole lines of about MAPPED_CHUNK_SIZE bytes, see
+    iter_chunk_candidates. Lines end at \n, \r\n or a lone \r, as in universal newlines mode,
+    and are yielded without the line end.
+
+    :param buffer: The mmap of the file.
+    :param decode: Replaces decode_line, used by --profile to time decoding.
+    :param file_stats: The ScanProfile.file() entry to count the lines and add the literal search time to.
+    """
+    end = len(buffer)
+    while offset < end:
+        line_end = LINE_END_REGEX.search(buffer, min(offset + MAPPED_CHUNK_SIZE, end) - 1)
+        chunk_end = end if line_end is None else line_end.end()
+        yield from iter_chunk_candidates(buffer[offset:chunk_end], matcher, decode, file_stats)
+        offset = chunk_end
+
+def iter_chunk_candidates(chunk, matcher, decode=None, file_stats=None):
+    """
+    Yields the decoded lines of a chunk of whole lines that can match a pattern.
+
+    The ASCII-lowercased chunk is searched once with the matcher's chunk_regex, which finds
+    any prefilter literal, and only the lines it finds one in are decoded. The search resumes
+    after the end of each such line. Lines with non-ASCII bytes are always yielded,
+    PatternMatcher.candidates checks every pattern on them; they are only looked for when
+    bytes.isascii() finds the chunk is not plain ASCII. Other lines cannot match, so matching
+    the yielded lines gives the same result as matching every line. When a pattern has no
+    literal, every line is yielded.
+    """
+    decode = decode or decode_line
+    if file_stats is not None:
+        file_stats['lines'] += count_lines(chunk)
+    if matcher.always_candidates or matcher.chunk_regex is None:
+        for raw_line in chunk.splitlines():
+            yield decode(raw_line)
         return
 
-    encodings = ['utf-8', 'latin-1']  # Add more encodings if needed
-    
-    file_content = None
-    if file_path.endswith(('.gz', '.xz')):
+    search_start = time.perf_counter() if file_stats is not None else None
+    lowered = chunk.lower()
+    line_spans = find_line_spans(lowered, matcher.chunk_regex.search)
+    if not lowered.isascii():
+        line_spans = sorted(set(line_spans + find_line_spans(lowered, NON_ASCII_BYTE_REGEX.search)))
+    if file_stats is not None:
+        file_stats['match_seconds'] += time.perf_counter() - search_start
+
+    for line_start, line_end in line_spans:
+        yield decode(chunk[line_start:line_end])
+
+def find_line_spans(chunk, search):
+    """
+    :param search: The search method of a regex.
+    :return: The (start, end) offsets of the lines `search` finds something in, without the
+             line end, in order.
+    """
+    line_spans = []
+    found = search(chunk)
+    while found is not None:
+        position = found.start()
+        newline = chunk.rfind(b'\n', 0, position)
+        line_start = max(newline, chunk.rfind(b'\r', newline + 1, position)) + 1
+        line_end = LINE_END_REGEX.search(chunk, position)
+        if line_end is None:
+            line_spans.append((line_start, len(chunk)))
+            break
+        line_spans.append((line_start, line_end.start()))
+        found = search(chunk, line_end.end())
+    return line_spans
+
+def count_lines(chunk):
+    lines = chunk.count(b'\n') + chunk.count(b'\r') - chunk.count(b'\r\n')
+    return lines + 1 if chunk and not chunk.endswith((b'\n', b'\r')) else lines
+
+class ChunkReader:
+    """
+    Reads a decompressing stream in a background thread, as chunks of whole lines for
+    iter_chunk_candidates.
+
+    gzip, lzma and bz2 release the GIL while they decompress, so the thread decompresses the
+    next chunks while the scan matches the current one. At most READ_AHEAD_CHUNKS chunks are
+    queued, the thread waits for the scan when it is that far ahead. A line longer than
+    STREAM_LINE_LIMIT bytes is split into pieces, as iter_decoded_lines does. The thread owns
+    the stream and closes it; errors reading it are raised when iterating.
+    """
+
+    def __init__(self, stream):
+        self.chunks = queue.Queue(READ_AHEAD_CHUNKS)
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.read, args=(stream,), daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        while not self.stopped.is_set():
+            try:
+                self.chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read(self, stream):
         try:
-            file_content = decompress_file(file_path)
-            if file_content is None:
-                logging.error(f"Failed to decompress {file_path}")
-                return
-            # Print header only once when file content is successfully decompressed
-            header = f"======= {file_path} ======="
-            if output_file:
-                output_file.write(header + '\n')
-            print(header)
+            with stream:
+                partial = b''
+                for block in iter(lambda: stream.read(STREAM_BUFFER_SIZE), b''):
+                    last_newline = block.rfind(b'\n')
+                    if last_newline == -1:
+                        partial += block
+                        if len(partial) >= STREAM_LINE_LIMIT:
+                            if not self.put(partial):
+                                return
+                            partial = b''
+                        continue
+                    if not self.put(partial + block[:last_newline + 1]):
+                        return
+                    partial = block[last_newline + 1:]
+                if partial and not self.put(partial):
+                    return
+            self.put(None)
         except Exception as e:
-            logging.error(f"Failed to decompress {file_path}: {e}")
+            self.put(e)
+
+    def __iter__(self):
+        try:
+            while True:
+                chunk = self.chunks.get()
+                if chunk is None:
+                    return
+                if isinstance(chunk, Exception):
+                    raise chunk
+                yield chunk
+        finally:
+            self.close()
+
+    def close(self):
+        self.stopped.set()
+        self.thread.join()
+
+class ReadAhead:
+    """
+    Starts a ChunkReader for each of the next `files` compressed files a serial scan will
+    read, so several files are decompressed at once while the scan matches the current one.
+    Memory stays bounded by `files` x READ_AHEAD_CHUNKS chunks.
+    """
+
+    def __init__(self, file_paths, days_to_analyze, files):
+        self.days_to_analyze = days_to_analyze
+        self.files = files
+        self.compressed_paths = [file_path for file_path in file_paths if file_path.endswith(COMPRESSED_EXTENSIONS)]
+        self.positions = {file_path: position for position, file_path in enumerate(self.compressed_paths)}
+        self.readers = {}
+
+    def start(self, file_path):
+        if file_path in self.readers or not is_scannable_log(file_path, self.days_to_analyze, check_text=False):
             return
+        try:
+            self.readers[file_path] = ChunkReader(open_compressed_file(file_path))
+        except Exception as e:
+            self.readers[file_path] = e
+
+    def reader(self, file_path):
+        """
+        :return: The ChunkReader of a compressed file, started now if it was not read ahead.
+        """
+        position = self.positions.get(file_path)
+        if position is not None:
+            for next_path in self.compressed_paths[position:position + self.files]:
+                self.start(next_path)
+        reader = self.readers.pop(file_path, None)
+        if reader is None:
+            return ChunkReader(open_compressed_file(file_path))
+        if isinstance(reader, Exception):
+            raise reader
+        return reader
+
+    def close(self):
+        for reader in self.readers.values():
+            if isinstance(reader, ChunkReader):
+                reader.close()
+        self.readers.clear()
+
+class JournalReader:
+    """
+    Reads the entries of a systemd journal file, so journals copied from another machine are
+    scanned without journalctl.
+
+    The header starts a chain of ENTRY_ARRAY objects listing every entry in the order it was
+    written. Each entry's items point to DATA objects holding "FIELD=value" payloads, only the
+    FIELDS payloads are kept. XZ compressed payloads are decompressed with lzma, ZSTD and LZ4
+    ones when the zstandard or lz4 module is installed, other payloads are left out of their
+    entry. DATA objects other than MESSAGE are shared by many entries and cached by offset.
+    """
+
+    OBJECT_DATA = 1
+    OBJECT_ENTRY = 3
+    OBJECT_ENTRY_ARRAY = 6
+    COMPRESSED_XZ = 1
+    COMPRESSED_LZ4 = 2
+    COMPRESSED_ZSTD = 4
+    # Header incompatible flag of journals with 32-bit object offsets, written by systemd 252 and later
+    INCOMPATIBLE_COMPACT = 16
+    FIELDS = (b'MESSAGE', b'_HOSTNAME', b'SYSLOG_IDENTIFIER', b'_COMM', b'_PID', b'SYSLOG_PID', b'_SOURCE_REALTIME_TIMESTAMP')
+    # Fields with a different value in nearly every entry, not worth caching
+    UNCACHED_FIELDS = (b'MESSAGE', b'_SOURCE_REALTIME_TIMESTAMP')
+    CACHE_LIMIT = 100000
+
+    def __init__(self, buffer):
+        """
+        :param buffer: The content of the journal file, an mmap or bytes.
+        :raise ValueError: If `buffer` does not hold a journal file.
+        """
+        if len(buffer) < 208 or buffer[:8] != JOURNAL_SIGNATURE:
+            raise ValueError("not a systemd journal file")
+        self.buffer = buffer
+        incompatible_flags, = struct.unpack_from('<I', buffer, 12)
+        self.compact = bool(incompatible_flags & self.INCOMPATIBLE_COMPACT)
+        self.n_entries, = struct.unpack_from('<Q', buffer, 152)
+        self.entry_array_offset, self.head_realtime, self.tail_realtime = struct.unpack_from('<3Q', buffer, 176)
+        self.arrays = self.read_entry_arrays()
+        self.fields = {}
+        # Payloads compressed with an algorithm whose module is not installed
+        self.skipped_payloads = 0
+
+    def read_entry_arrays(self):
+        """
+        :return: A list of (offset of the first item, number of entries) for each ENTRY_ARRAY.
+        """
+        arrays = []
+        item_size = 4 if self.compact else 8
+        offset, remaining = self.entry_array_offset, self.n_entries
+        while offset and remaining > 0:
+            object_type, _, size = struct.unpack_from('<BB6xQ', self.buffer, offset)
+            if object_type != self.OBJECT_ENTRY_ARRAY:
+                break
+            next_offset, = struct.unpack_from('<Q', self.buffer, offset + 16)
+            count = min((size - 24) // item_size, remaining)
+            arrays.append((offset + 24, count))
+            remaining -= count
+            # Arrays only ever point forward, a pointer back would loop on a corrupt file
+            offset = next_offset if next_offset > offset else 0
+        return arrays
 
-    encoding_failed = False  # Flag to indicate if decoding has failed for this file
-    for encoding in encodings:
+    def __len__(self):
+        return sum(count for _, count in self.arrays)
+
+    def entry_offsets(self, start=0):
+        item_format, item_size = ('I', 4) if self.compact else ('Q', 8)
+        for items_offset, count in self.arrays:
+            if start >= count:
+                start -= count
+                continue
+            yield from struct.unpack_from(f'<{count - start}{item_format}', self.buffer, items_offset + start * item_size)
+            start = 0
+
+    def entry_realtime(self, index):
+        item_format, item_size = ('<I', 4) if self.compact else ('<Q', 8)
+        for items_offset, count in self.arrays:
+            if index < count:
+                entry_offset, = struct.unpack_from(item_format, self.buffer, items_offset + index * item_size)
+                return struct.unpack_from('<Q', self.buffer, entry_offset + 24)[0]
+            index -= count
+        raise IndexError(index)
+
+    def find_entry(self, realtime):
+        """
+        Binary searches the entries, kept in write order, for the first one logged at or after
+        `realtime`, then moves back JOURNAL_SEEK_MARGIN entries. Older entries still scanned
+        are dropped by the timestamp check.
+
+        :param realtime: Microseconds since the epoch.
+        :return: The index of the entry to start scanning from.
+        """
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self.entry_realtime(middle) < realtime:
+                low = middle + 1
+            else:
+                high = middle
+        return max(0, low - JOURNAL_SEEK_MARGIN)
+
+    def read_field(self, offset):
+        """
+        :return: The (field, value) of the DATA object at `offset` if the field is one of FIELDS, or None.
+        """
+        object_type, flags, size = struct.unpack_from('<BB6xQ', self.buffer, offset)
+        if object_type != self.OBJECT_DATA:
+            return None
+        payload = self.buffer[offset + (72 if self.compact else 64):offset + size]
+        if flags:
+            payload = self.decompress(payload, flags)
+            if payload is None:
+                return None
+        field, _, value = payload.partition(b'=')
+        return (field, value) if field in self.FIELDS else None
+
+    def decompress(self, payload, flags):
         try:
-            if file_content is not None:
-                # Use the decompressed content
-                lines = file_content.splitlines()
+            if flags & self.COMPRESSED_XZ:
+                return lzma.decompress(payload)
+            if flags & self.COMPRESSED_ZSTD and zstandard is not None:
+                return zstandard.ZstdDecompressor().decompressobj().decompress(payload)
+            if flags & self.COMPRESSED_LZ4 and lz4_block is not None:
+                # The LZ4 block is preceded by its decompressed size
+                size, = struct.unpack_from('<Q', payload)
+                return lz4_block.decompress(payload[8:], uncompressed_size=size)
+        except Exception as e:
+            logging.debug(f"Failed to decompress a journal payload: {e}")
+            return None
+        self.skipped_payloads += 1
+        return None
+
+    def entries(self, start=0):
+        """
+        Yields (realtime in microseconds, dict of FIELDS to values) for each entry from index `start` on.
+        """
+        buffer = self.buffer
+        fields_cache = self.fields
+        for entry_offset in self.entry_offsets(start):
+            object_type, _, size = struct.unpack_from('<BB6xQ', buffer, entry_offset)
+            if object_type != self.OBJECT_ENTRY:
+                continue
+            realtime, = struct.unpack_from('<Q', buffer, entry_offset + 24)
+            if self.compact:
+                data_offsets = struct.unpack_from(f'<{(size - 64) // 4}I', buffer, entry_offset + 64)
             else:
-                # Open and read file directly
-                with open(file_path, 'r', encoding=encoding) as f:
-                    lines = f.readlines()
-                    # Print header only for non-compressed files
-                    header = f"======= {file_path} ======="
-                    if output_file:
-                        output_file.write(header + '\n')
-                    print(header)
-
-            # logging.info(f"Start parsing {file_path} with encoding {encoding}")
-                
-            for line in lines:
-                for pattern in patterns:
-                    if pattern.search(line):
-                        # Debug print(f"Pattern matched: {pattern.pattern} in {file_path}")
-                        timestamp, hostname = extract_timestamp_hostname(line, days_to_analyze)
-                        
-                        if timestamp is None or hostname is None:
-                            # Debugging output for lines with missing information
-                            # print(f"DEBUG: Skipping line due to missing timestamp or hostname: {line.strip()}")
-                            break  # Skip this line if timestamp or hostname is missing
-                        
-                        # Debug print(f"Extracted Timestamp: {timestamp}, Hostname: {hostname}")
-                        
-                        if timestamp and hostname:
-                            date_hour = timestamp[:13]  # Extract date and hour part
-                            error_hourly_counts[hostname][pattern.pattern][date_hour]['total'] += 1
-                            error_hourly_counts[hostname][pattern.pattern][date_hour]['files'][file_path] += 1
-                        
-                        # Debug print(f"Updated error_hourly_counts for {hostname}: {error_hourly_counts[hostname]}")
-                        if output_file:
-                            output_file.write(line.strip() + '\n')
-                        else:
-                            print(line.strip())
-                        break  # Stop checking other patterns if one matches
-            if output_file:
-                output_file.write('\n')
-            print('\n')
-            break  # Exit the loop if the file was successfully read
-        except UnicodeDecodeError:
-            if not encoding_failed:
-                # logging.warning(f"Failed to decode {file_path} using {encoding}, trying next encoding...")
-                encoding_failed = True  # Set the flag to avoid repeated messages
+                # Items are (offset, hash) pairs
+                data_offsets = struct.unpack_from(f'<{(size - 64) // 8}Q', buffer, entry_offset + 64)[::2]
+
+            fields = {}
+            for data_offset in data_offsets:
+                field = fields_cache.get(data_offset, False)
+                if field is False:
+                    field = self.read_field(data_offset)
+                    if field is None or field[0] not in self.UNCACHED_FIELDS:
+                        if len(fields_cache) >= self.CACHE_LIMIT:
+                            fields_cache.clear()
+                        fields_cache[data_offset] = field
+                if field is not None:
+                    fields[field[0]] = field[1]
+            yield realtime, fields
+
+def iter_journal_lines(reader, start=0, decode=None, progress=None):
+    """
+    Yields the entries of a JournalReader as `journalctl -o short` prints them, so the
+    LOG_PATTERNS timestamp and hostname and the patterns apply as to an exported journal.
+    Like journalctl, the time the sender logged an entry is preferred over the time journald
+    received it. Continuation lines of a multi-line message are yielded on their own.
+
+    :param decode: Replaces decode_line, used by --profile to time decoding.
+    :param progress: A dict whose 'offset' is advanced past each entry, used by --state.
+    """
+    decode = decode or decode_line
+    last_second = formatted_time = None
+    for realtime, fields in reader.entries(start):
+        if progress is not None:
+            progress['offset'] += 1
+        message = fields.get(b'MESSAGE')
+        if message is None:
             continue
-        except FileNotFoundError:
-            logging.error(f"File {file_path} not found.")
-            sys.exit(1)
-        except Exception as e:
-            logging.error(f"An unexpected error occurred while processing {file_path}: {e}")
-            sys.exit(1)
-    else:
-        logging.error(f"Unable to decode {file_path} with the specified encodings.")
-
-def extract_and_format_logs(log_lines):
-    current_year = datetime.now().year
-    grouped_logs = defaultdict(list)
-
-    for line in log_lines:
-        for pattern, _ in LOG_PATTERNS:
-            match = re.match(pattern, line)
-            if match:
-                timestamp, hostname = match.groups()
-                hostname = hostname.lower()  # Normalize to lowercase
-                formatted_timestamp = parse_and_format_timestamp(timestamp, current_year)
-                if formatted_timestamp is None:
-                    # print(f"DEBUG: Failed to format timestamp: {timestamp}")
-                    break
 
-                remaining_line = line[len(match.group(0)):].strip()
-                grouped_logs[hostname].append((formatted_timestamp, remaining_line))
-                break
-        else:
-            print(f"DEBUG: Failed to extract timestamp/hostname from line: {line.strip()}")
+        source_realtime = fields.get(b'_SOURCE_REALTIME_TIMESTAMP')
+        if source_realtime and source_realtime.isdigit():
+            realtime = int(source_realtime)
+        second = realtime // 1000000
+        if second != last_second:
+            last_second = second
+            formatted_time = time.strftime('%b %d %H:%M:%S', time.localtime(second)).encode('ascii')
+        prefix = formatted_time + b' ' + fields.get(b'_HOSTNAME', b'localhost')
+        identifier = fields.get(b'SYSLOG_IDENTIFIER') or fields.get(b'_COMM')
+        if identifier:
+            prefix += b' ' + identifier
+        pid = fields.get(b'_PID') or fields.get(b'SYSLOG_PID')
+        if pid:
+            prefix += b'[' + pid + b']'
 
-    for hostname in grouped_logs:
-        grouped_logs[hostname].sort(key=lambda x: x[0])
+        first_line, *continuation_lines = message.split(b'\n')
+        yield decode(prefix + b': ' + first_line + b'\n')
+        for raw_line in continuation_lines:
+            yield decode(raw_line + b'\n')
 
-    return grouped_logs
+class ScanOutput:
+    """
+    The sinks for per-file headers, matched lines and the statistics report.
 
-def print_error_statistics(error_counts, error_hourly_counts, output_file=None):
-    
-    title = """
-##########################################
-#                                        #
-#       Linux Log Analysis               #
-#       From Azure Linux Team            #
-#                                        #
-##########################################
-"""
+    `report_file` is the <type>_{timestamp}.txt report and `stdout` the terminal, either can
+    be None to drop it. Matched lines go to the report file, or to stdout when there is no
+    report file. `events_file` receives one NDJSON object per matched line for other tools
+    to consume. When several -t types are scanned together, `type_reports` holds the report
+    file of each type, which gets the headers of the files in the type's filelist and the
+    lines its patterns matched. All sinks are expected to be opened with a large buffer,
+    see open_scan_output.
+    """
 
-    # Print the title
-    print(title)
-    if output_file:
-        output_file.write(title + '\n')
-        
-    # Get the local time and timezone
-    local_time = time.localtime()
-    local_timezone = time.strftime('%Z', local_time)
-    local_utc_offset = time.strftime('%z', local_time)
+    def __init__(self, report_file=None, stdout=None, events_file=None, type_reports=None):
+        self.report_file = report_file
+        self.stdout = stdout
+        self.events_file = events_file
+        self.type_reports = type_reports or {}
+        self.file_types = ()
 
-    # Get and print the current local timestamp with timezone
-    current_timestamp = datetime.now().strftime(f"%Y-%m-%d %H:%M:%S {local_timezone}{local_utc_offset}")
-    timestamp_line = f"Report generated on: {current_timestamp}\n"
-    print(timestamp_line)
-    if output_file:
-        output_file.write(timestamp_line + '\n')
-        
-    separator = "=" * 80  # Define a separator line for clarity
-    print("\n" + separator)
-    print("Error Statistics Report")
-    print(separator)
-    
-    if output_file:
-        output_file.write("\n" + separator + "\n")
-        output_file.write("Error Statistics Report\n")
-        output_file.write(separator + "\n")
+    @classmethod
+    def buffered(cls, sinks, spool_dir):
+        """
+        Returns a ScanOutput with the same sinks enabled that writes each of them to a
+        temporary file in `spool_dir`, for a worker process. write_values copies the files
+        into the real sinks.
 
-    for hostname, patterns in error_hourly_counts.items():
-        host_header = f"\n{separator}\nError Statistics for Hostname: {hostname}\n{separator}"
-        print(host_header)
-        if output_file:
-            output_file.write(host_header + '\n')
+        :param sinks: The tuple returned by sinks() of the real ScanOutput.
+        """
+        def spool_file():
+            return tempfile.NamedTemporaryFile('w', encoding='utf-8', newline='', buffering=OUTPUT_BUFFER_SIZE,
+                                               dir=spool_dir, suffix='.txt', delete=False)
+        *enabled_sinks, pattern_types = sinks
+        return cls(*(spool_file() if enabled else None for enabled in enabled_sinks),
+                   {pattern_type: spool_file() for pattern_type in pattern_types})
 
-        for pattern, date_hourly_counts in patterns.items():
-            clean_pattern = pattern.replace(r'\b', '')
-            total_count = sum(info['total'] for info in date_hourly_counts.values())
-            result = f"\nPattern: \"{clean_pattern}\" - {total_count} occurrences"
-            print(result)
-            if output_file:
-                output_file.write(result + '\n')
+    def sinks(self):
+        return tuple(sink is not None for sink in (self.report_file, self.stdout, self.events_file)) + (tuple(self.type_reports),)
 
-            # Group occurrences by file path
-            file_grouped_data = defaultdict(list)
-            for date_hour, info in sorted(date_hourly_counts.items()):
-                for file_path, file_count in info['files'].items():
-                    file_grouped_data[file_path].append((date_hour, file_count))
+    def values(self):
+        """
+        Closes the files of a buffered() ScanOutput.
 
-            for file_path, occurrences in file_grouped_data.items():
-                print(f"\n[{file_path}]")
-                if output_file:
-                    output_file.write(f"\n[{file_path}]\n")
+        :return: The path of the file of each sink, None for the disabled ones.
+        """
+        sinks = (self.report_file, self.stdout, self.events_file)
+        for sink in (*sinks, *self.type_reports.values()):
+            if sink is not None:
+                sink.close()
+        return tuple(sink.name if sink is not None else None for sink in sinks) + (
+            {pattern_type: report.name for pattern_type, report in self.type_reports.items()},)
 
-                for date_hour, count in occurrences:
-                    if count > 0:
-                        date, hour = date_hour.split()
-                        hourly_result = f"{date} {hour}:00 ~ {hour}:59 - {count} occurrences"
-                        print(hourly_result)
-                        if output_file:
-                            output_file.write(hourly_result + '\n')
+    def write_values(self, values):
+        """
+        Copies the files returned by values() of a buffered() ScanOutput into the sinks and
+        removes them.
+        """
+        *paths, type_paths = values
+        for sink, path in zip((self.report_file, self.stdout, self.events_file), paths):
+            if path is not None:
+                self.copy_spooled(path, sink)
+        for pattern_type, path in type_paths.items():
+            self.copy_spooled(path, self.type_reports[pattern_type])
+
+    @staticmethod
+    def copy_spooled(path, sink):
+        if sink is not None:
+            with open(path, 'r', encoding='utf-8', newline='') as spooled:
+                shutil.copyfileobj(spooled, sink, OUTPUT_BUFFER_SIZE)
+        os.remove(path)
+
+    def type_output(self, pattern_type):
+        return ScanOutput(report_file=self.type_reports[pattern_type])
+
+    def write(self, text, stdout_text=None):
+        if self.report_file is not None:
+            self.report_file.write(text)
+        if self.stdout is not None:
+            self.stdout.write(text if stdout_text is None else stdout_text)
+
+    def line(self, text):
+        self.write(text + '\n')
+
+    def start_file(self, file_path, pattern_types=()):
+        """
+        Writes the header of a scanned file, also to the reports of `pattern_types`.
+        """
+        header = f"======= {file_path} ======="
+        self.file_types = [pattern_type for pattern_type in pattern_types if pattern_type in self.type_reports]
+        self.line(header)
+        for pattern_type in self.file_types:
+            self.type_reports[pattern_type].write(header + '\n')
+
+    def end_file(self):
+        # One blank line in the report, two on the terminal as print('\n') used to give
+        self.write('\n', '\n\n')
+        for pattern_type in self.file_types:
+            self.type_reports[pattern_type].write('\n')
+        self.file_types = ()
+
+    def match(self, timestamp, hostname, pattern, file_path, line):
+        if self.report_file is not None:
+            self.report_file.write(line + '\n')
+        elif self.stdout is not None:
+            self.stdout.write(line + '\n')
+        if self.events_file is not None:
+            event = {'timestamp': timestamp, 'host': hostname, 'pattern': pattern, 'file': file_path, 'line': line}
+            self.events_file.write(json.dumps(event, ensure_ascii=False) + '\n')
 
-def should_process_file(file_path, processed_files):
+    def typed_match(self, timestamp, hostname, matches, file_path, line):
+        """
+        Writes a line matched by the patterns of several types once to the report file or
+        stdout, and to the report of and as an event for each type.
+
+        :param matches: A list of (pattern type, pattern source) pairs.
+        """
+        if self.report_file is not None:
+            self.report_file.write(line + '\n')
+        elif self.stdout is not None:
+            self.stdout.write(line + '\n')
+        for pattern_type, pattern in matches:
+            type_report = self.type_reports.get(pattern_type)
+            if type_report is not None:
+                type_report.write(line + '\n')
+            if self.events_file is not None:
+                event = {'timestamp': timestamp, 'host': hostname, 'type': pattern_type, 'pattern': pattern,
+                         'file': file_path, 'line': line}
+                self.events_file.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    def stdout_only(self):
+        return ScanOutput(stdout=self.stdout)
+
+    def flush(self):
+        for sink in (self.report_file, self.stdout, self.events_file, *self.type_reports.values()):
+            if sink is not None:
+                sink.flush()
+
+    def close(self):
+        self.flush()
+        for sink in (self.report_file, self.events_file, *self.type_reports.values()):
+            if sink is not None and sink is not self.stdout:
+                sink.close()
+
+def open_scan_output(report_file_name, to_stdout, events_file_name, type_report_names=None):
     """
-    Determine if a given log file should be processed based on whether it has
-    a compressed counterpart.
+    Opens the sinks of a ScanOutput with OUTPUT_BUFFER_SIZE buffers.
 
-    :param file_path: Path to the log file.
-    :param processed_files: Set of processed file names to avoid duplicates.
-    :return: Boolean indicating if the file should be processed.
+    :param report_file_name: Path of the report file, or None for no report file.
+    :param to_stdout: Whether headers, matched lines and statistics are printed.
+    :param events_file_name: Path of the NDJSON events file, '-' for stdout, or None.
+    :param type_report_names: A dict of pattern type to the path of its own report, when
+                              several types are scanned together.
     """
-    # Check if the file is a compressed log file
-    if file_path.endswith(('.gz', '.xz')):
-        # Consider the base name without the compression extension
-        base_name = os.path.basename(file_path)[:-3]
-        if base_name in processed_files:
-            # If the base name is already in the processed files, skip this file
-            return False
-        # Otherwise, mark this compressed file as processed
-        processed_files.add(base_name)
-        return True
+    stdout = None
+    if to_stdout or events_file_name == '-':
+        sys.stdout.flush()
+        stdout = open(sys.stdout.fileno(), 'w', buffering=OUTPUT_BUFFER_SIZE, encoding=sys.stdout.encoding,
+                      errors=sys.stdout.errors, closefd=False)
+    report_file = open(report_file_name, 'w', buffering=OUTPUT_BUFFER_SIZE) if report_file_name else None
+    if events_file_name == '-':
+        events_file = stdout
+    elif events_file_name:
+        events_file = open(events_file_name, 'w', encoding='utf-8', buffering=OUTPUT_BUFFER_SIZE)
     else:
-        # For uncompressed files, only process if there's no compressed counterpart
-        compressed_name_gz = f"{file_path}.gz"
-        compressed_name_xz = f"{file_path}.xz"
-        if not os.path.exists(compressed_name_gz) and not os.path.exists(compressed_name_xz):
-            # If no compressed version exists, mark this file as processed
-            processed_files.add(os.path.basename(file_path))
-            return True
-    return False
-    
-def main():
-    parser = argparse.ArgumentParser(description="Linux Log file analyzer")
-    parser.add_argument('-d', '--directory', help="Directory containing log files", required=True)
-    parser.add_argument('-t', '--type', help="Type of log patterns to use", required=True)
-    parser.add_argument('--days', type=int, default=60, help="Number of days to look back for log analysis (default is 60)")
-    args = parser.parse_args()
+        events_file = None
+    type_reports = {
+        pattern_type: open(file_name, 'w', buffering=OUTPUT_BUFFER_SIZE)
+        for pattern_type, file_name in (type_report_names or {}).items()
+    }
+    return ScanOutput(report_file, stdout if to_stdout else None, events_file, type_reports)
 
-    # Use args.days to set the number of days to analyze
-    DAYS_TO_ANALYZE = args.days
+class ScanProfile:
+    """
+    Timings collected with --profile, per pattern and per file.
 
-    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+    To attribute time to single patterns, the prefilter candidates of each line are
+    searched one by one in pattern file order instead of with the combined regex, which
+    gives the same matches but makes the scan itself slower.
+    """
 
-    patterns = compile_patterns(args.type)
-    target_keywords = read_target_keywords(args.type)
+    # 'lines' counts every line read, 'candidates' the lines past the prefilter that the patterns are searched in
+    FILE_FIELDS = ('bytes', 'lines', 'candidates', 'matches', 'decompress_seconds', 'decode_seconds', 'match_seconds',
+                   'extract_seconds')
 
-    directory_path = args.directory
-    # logging.debug(f"Analyzing directory: {directory_path}")
+    def __init__(self, matcher):
+        # Pattern source -> [evaluations, hits, seconds]
+        self.patterns = {name: [0, 0, 0.0] for name in matcher.pattern_names()}
+        self.literals = dict(zip(matcher.pattern_names(), matcher.literals))
+        self.files = {}
 
-    if not directory_path or not os.path.isdir(directory_path):
-        # logging.error("The directory path is invalid or does not exist.")
-        sys.exit(1)
+    def file(self, file_path):
+        if file_path not in self.files:
+            self.files[file_path] = dict.fromkeys(self.FILE_FIELDS, 0)
+        return self.files[file_path]
 
-    timestamp = datetime.now().strftime('%m-%d-%H%M%S')
-    output_file_name = f'{args.type}_{timestamp}.txt'
-    output_file = open(output_file_name, 'w')
+    @staticmethod
+    def timed(function, file_stats, field):
+        def timed_function(argument):
+            start = time.perf_counter()
+            result = function(argument)
+            file_stats[field] += time.perf_counter() - start
+            return result
+        return timed_function
 
-    try:
-        error_hourly_counts = defaultdict(lambda: defaultdict(lambda: defaultdict(lambda: {'total': 0, 'files': defaultdict(int)})))
-        all_matched_lines = []
+    @staticmethod
+    def timed_decode(file_stats):
+        """
+        :return: decode_line recording the decode time and counting the lines, for readers that decode every line they read.
+        """
+        def decode(raw_line):
+            start = time.perf_counter()
+            line = decode_line(raw_line)
+            file_stats['decode_seconds'] += time.perf_counter() - start
+            file_stats['lines'] += 1
+            return line
+        return decode
 
-        processed_files = set()
+    def timed_match(self, matcher, file_stats, pattern_type=None, count_lines=True):
+        """
+        :param pattern_type: The type of `matcher` when scanning PatternSets, whose pattern names it uses.
+        :param count_lines: Whether to count the candidate lines, only one type of PatternSets does.
+        :return: A function returning the same result as matcher.match, that records the
+                 evaluations, hits and search time of each pattern.
+        """
+        patterns = matcher.patterns
+        names = matcher.pattern_names()
+        if pattern_type is not None:
+            names = [typed_pattern_name(pattern_type, name) for name in names]
+        pattern_stats = [self.patterns[name] for name in names]
+        line_count = 1 if count_lines else 0
 
-        for root, _, files in os.walk(directory_path):
-            # logging.debug(f"Checking directory: {root}")
-            for file_name in files:
-                file_path = os.path.join(root, file_name)
-                # logging.debug(f"Checking file: {file_path}")
-                if is_target_file(file_name, target_keywords) and should_process_file(file_path, processed_files):
-                    if os.path.isfile(file_path):
-                        parse_log(file_path, patterns, error_hourly_counts, DAYS_TO_ANALYZE, output_file)
+        def match(line):
+            start = time.perf_counter()
+            file_stats['candidates'] += line_count
+            matched = None
+            for i in matcher.candidates(line):
+                stats = pattern_stats[i]
+                search_start = time.perf_counter()
+                found = patterns[i].search(line)
+                stats[2] += time.perf_counter() - search_start
+                stats[0] += 1
+                if found:
+                    stats[1] += 1
+                    file_stats['matches'] += 1
+                    matched = patterns[i]
+                    break
+            file_stats['match_seconds'] += time.perf_counter() - start
+            return matched
+        return match
 
-        print_error_statistics(None, error_hourly_counts, output_file)
+    def merge(self, other):
+        for pattern, (evaluations, hits, seconds) in other.patterns.items():
+            stats = self.patterns.setdefault(pattern, [0, 0, 0.0])
+            stats[0] += evaluations
+            stats[1] += hits
+            stats[2] += seconds
+        for file_path, file_stats in other.files.items():
+            totals = self.file(file_path)
+            for field in self.FILE_FIELDS:
+                totals[field] += file_stats[field]
 
-        grouped_logs = extract_and_format_logs(all_matched_lines)
+    def totals(self):
+        return {field: sum(file_stats[field] for file_stats in self.files.values()) for field in self.FILE_FIELDS}
 
-        for hostname, logs in grouped_logs.items():
-            hostname_output_file_name = f"{hostname}_{timestamp}_sort.txt"
-            with open(hostname_output_file_name, 'w') as hostname_output_file:
-                if logs:
-                    hostname_output_file.write(f"======= Hostname: {hostname} =======\n")
-                    for log_timestamp, remaining_line in logs:
-                        hostname_output_file.write(f"{log_timestamp} | {remaining_line}\n")
-                else:
-                    hostname_output_file.write(f"======= Hostname: {hostname} =======\nNo errors captured.\n")
+    def print_summary(self, output):
+        separator = "=" * 80
+        output.line("\n" + separator)
+        output.line("Profile Report")
+        output.line(separator)
+
+        totals = self.totals()
+        file_seconds = lambda stats: sum(stats[field] for field in self.FILE_FIELDS if field.endswith('_seconds'))
+        lines_per_second = lambda stats: stats['lines'] / file_seconds(stats) if file_seconds(stats) else 0
+        output.line(f"\nScanned {totals['bytes'] / 1024 / 1024:.1f} MB, {totals['lines']} lines ({totals['candidates']} past "
+                    f"the prefilter), {totals['matches']} matches, {lines_per_second(totals):.0f} lines/sec")
+        output.line(f"Decompress {totals['decompress_seconds']:.3f}s, decode {totals['decode_seconds']:.3f}s, "
+                    f"match {totals['match_seconds']:.3f}s, timestamp/hostname extraction {totals['extract_seconds']:.3f}s")
+
+        output.line("\nPatterns by search time:")
+        output.line(f"{'seconds':>9} {'evaluations':>12} {'hits':>9} {'us/eval':>8}  {'prefilter':<20} pattern")
+        for pattern, (evaluations, hits, seconds) in sorted(self.patterns.items(), key=lambda item: -item[1][2]):
+            per_evaluation = seconds / evaluations * 1e6 if evaluations else 0
+            literal = self.literals.get(pattern)
+            literal = f'"{literal}"' if literal else '(every line)'
+            clean_pattern = pattern.replace(r'\b', '')
+            output.line(f"{seconds:>9.3f} {evaluations:>12} {hits:>9} {per_evaluation:>8.2f}  {literal[:20]:<20} {clean_pattern}")
+
+        output.line("\nFiles by scan time (decompress + decode + match + extract):")
+        output.line(f"{'MB':>8} {'lines':>10} {'candidates':>10} {'matches':>8} {'lines/sec':>10} {'decomp s':>9} "
+                    f"{'decode s':>9} {'match s':>8} {'extract s':>9}  file")
+        for file_path, stats in sorted(self.files.items(), key=lambda item: -file_seconds(item[1])):
+            output.line(f"{stats['bytes'] / 1024 / 1024:>8.1f} {stats['lines']:>10} {stats['candidates']:>10} {stats['matches']:>8} "
+                        f"{lines_per_second(stats):>10.0f} "
+                        f"{stats['decompress_seconds']:>9.3f} {stats['decode_seconds']:>9.3f} {stats['match_seconds']:>8.3f} "
+                        f"{stats['extract_seconds']:>9.3f}  {file_path}")
+
+    def save(self, path):
+        report = {
+            'totals': self.totals(),
+            'patterns': [
+                {'pattern': pattern, 'prefilter_literal': self.literals.get(pattern), 'evaluations': evaluations,
+                 'hits': hits, 'seconds': seconds}
+                for pattern, (evaluations, hits, seconds) in self.patterns.items()
+            ],
+            'files': self.files,
+        }
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+class TimedStream:
+    """
+    Wraps a decompressing stream to record the time spent in readline and the bytes read.
+    """
+
+    def __init__(self, stream, file_stats):
+        self.stream = stream
+        self.file_stats = file_stats
+
+    def readline(self, size=-1):
+        start = time.perf_counter()
+        raw_line = self.stream.readline(size)
+        self.file_stats['decompress_seconds'] += time.perf_counter() - start
+        self.file_stats['bytes'] += len(raw_line)
+        return raw_line
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+def scan_lines(lines, file_path, matcher, error_hourly_counts, days_to_analyze, output=None, timeline=None, profile=None):
+    if isinstance(matcher, PatternSets):
+        scan_typed_lines(lines, file_path, matcher, error_hourly_counts, days_to_analyze, output, timeline, profile)
+        return
+
+    timestamp_parser = get_timestamp_parser(days_to_analyze)
+    match = matcher.match
+    parse_line = timestamp_parser.parse_line
+    bucket_length = error_hourly_counts.bucket_length
+    if profile is not None:
+        file_stats = profile.file(file_path)
+        match = profile.timed_match(matcher, file_stats)
+        parse_line = profile.timed(parse_line, file_stats, 'extract_seconds')
+
+    for line in lines:
+        pattern = match(line)
+        if pattern is None:
+            continue
+
+        # Debug print(f"Pattern matched: {pattern.pattern} in {file_path}")
+        parsed = parse_line(line)
+
+        if parsed is None:
+            # Debugging output for lines with missing information
+            # print(f"DEBUG: Skipping line due to missing timestamp or hostname: {line.strip()}")
+            continue  # Skip this line if timestamp or hostname is missing
+        timestamp, hostname, prefix_end = parsed
+
+        # Debug print(f"Extracted Timestamp: {timestamp}, Hostname: {hostname}")
+
+        date_hour = timestamp[:bucket_length]  # Extract date and hour part, or date and minute
+        error_hourly_counts.add(hostname, pattern.pattern, date_hour, file_path)
+
+        # Debug print(f"Updated error_hourly_counts for {hostname}: {error_hourly_counts[hostname]}")
+        if timeline is not None:
+            timeline.add(hostname, timestamp, line[prefix_end:].strip())
+
+        if output is not None:
+            output.match(timestamp, hostname, pattern.pattern, file_path, line.strip())
+
+def scan_typed_lines(lines, file_path, pattern_sets, error_hourly_counts, days_to_analyze, output=None, timeline=None,
+                     profile=None):
+    """
+    scan_lines for PatternSets, each line is matched with the patterns of every type whose
+    filelist includes `file_path`. A line matched by several types is counted once per type
+    and added to the timeline once.
+    """
+    parse_line = get_timestamp_parser(days_to_analyze).parse_line
+    bucket_length = error_hourly_counts.bucket_length
+    pattern_types = pattern_sets.types_for(file_path)
+    type_matchers = [(pattern_type, pattern_sets.matchers[pattern_type].match) for pattern_type in pattern_types]
+    if profile is not None:
+        file_stats = profile.file(file_path)
+        type_matchers = [
+            (pattern_type, profile.timed_match(pattern_sets.matchers[pattern_type], file_stats, pattern_type, count_lines=not index))
+            for index, pattern_type in enumerate(pattern_types)
+        ]
+        parse_line = profile.timed(parse_line, file_stats, 'extract_seconds')
+
+    for line in lines:
+        matches = []
+        for pattern_type, match in type_matchers:
+            pattern = match(line)
+            if pattern is not None:
+                matches.append((pattern_type, pattern.pattern))
+        if not matches:
+            continue
+
+        parsed = parse_line(line)
+        if parsed is None:
+            continue
+        timestamp, hostname, prefix_end = parsed
+
+        date_hour = timestamp[:bucket_length]
+        for pattern_type, pattern in matches:
+            error_hourly_counts.add(hostname, typed_pattern_name(pattern_type, pattern), date_hour, file_path)
+        if timeline is not None:
+            timeline.add(hostname, timestamp, line[prefix_end:].strip())
+        if output is not None:
+            output.typed_match(timestamp, hostname, matches, file_path, line.strip())
+
+def probe_window(stream, offset, timestamp_parser):
+    """
+    Checks whether the first timestamped line at or after `offset` is within --days.
+
+    :return: True or False, or None if no timestamped line is found within SEEK_PROBE_LINES lines.
+    """
+    stream.seek(offset)
+    if offset:
+        stream.readline(STREAM_LINE_LIMIT)  # Skip the partial line the offset landed in
+    for _ in range(SEEK_PROBE_LINES):
+        raw_line = stream.readline(STREAM_LINE_LIMIT)
+        if not raw_line:
+            return None
+        in_window = timestamp_parser.line_in_window(decode_line(raw_line))
+        if in_window is not None:
+            return in_window
+    return None
+
+def find_window_start(stream, size, timestamp_parser):
+    """
+    Binary searches a plain log file for the first line within --days.
+
+    Log files are written in time order, so the lines older than the cutoff form a prefix of
+    the file. Probes that find no timestamp are treated as in window, and the result is moved
+    back by SEEK_MARGIN bytes for slightly out of order lines, so the search can only start
+    too early, never skip an in-window line. Lines before the cutoff that are still scanned
+    are dropped by the timestamp check as before.
+
+    :param stream: The log file opened in binary mode.
+    :param size: Size of the file in bytes.
+    :return: The byte offset of a line start to begin scanning from.
+    """
+    low, high = 0, size
+    while high - low > SEEK_MARGIN:
+        middle = (low + high) // 2
+        if probe_window(stream, middle, timestamp_parser) is False:
+            low = middle
+        else:
+            high = middle
+
+    offset = max(0, low - SEEK_MARGIN)
+    stream.seek(offset)
+    if offset:
+        stream.readline(STREAM_LINE_LIMIT)
+    return stream.tell()
+
+def is_scannable_log(file_path, days_to_analyze, check_text=True, mtime=None):
+    """
+    :param check_text: Skip plain files whose first block is not UTF-8, parse_log checks this
+                       itself on the file it already has open.
+    :param mtime: Modification time of an archive member, read from the file if not given.
+    """
+    # Journal names embed hex IDs that can look like dates, the header's time range is checked instead
+    if not file_path.endswith(JOURNAL_EXTENSIONS) and not should_parse_file(os.path.basename(file_path), days_to_analyze):
+        logging.info(f"Skipping file {file_path} as it is older than {days_to_analyze} days.")
+        return False
+
+    # A file last written before the cutoff cannot hold newer lines, one extra day allows
+    # for log timestamps taken in a different timezone than this machine's
+    mtime_cutoff = get_timestamp_parser(days_to_analyze).cutoff - timedelta(days=1)
+    if mtime is None and file_path and os.path.isfile(file_path):
+        mtime = os.path.getmtime(file_path)
+    if mtime is not None and datetime.fromtimestamp(mtime) < mtime_cutoff:
+        logging.info(f"Skipping file {file_path} as it was last modified more than {days_to_analyze} days ago.")
+        return False
+
+    if not file_path or (check_text and not is_text_file(file_path) and not file_path.endswith(COMPRESSED_EXTENSIONS + JOURNAL_EXTENSIONS)):
+        logging.warning(f"Skipping non-text or unreadable file: {file_path}")
+        return False
+
+    return True
+
+def parse_log(file_path, matcher, error_hourly_counts, days_to_analyze, output=None, timeline=None, profile=None,
+              read_ahead=None):
+    if output is None:
+        output = ScanOutput(stdout=sys.stdout)
+    if not is_scannable_log(file_path, days_to_analyze, check_text=False):
+        return
+
+    if file_path.endswith(JOURNAL_EXTENSIONS):
+        try:
+            with open(file_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                scan_journal(buffer, file_path, matcher, error_hourly_counts, days_to_analyze, output, timeline, profile)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Skipping unreadable journal file {file_path}: {e}")
+        return
+
+    if file_path.endswith(COMPRESSED_EXTENSIONS) and profile is None:
+        # Decompressed in a background thread, or already read ahead, while the chunks are matched
+        try:
+            reader = read_ahead.reader(file_path) if read_ahead is not None else ChunkReader(open_compressed_file(file_path))
+        except Exception as e:
+            logging.error(f"Failed to decompress {file_path}: {e}")
+            return
+
+        output.start_file(file_path, matcher.types_for(file_path))
+        try:
+            scan_lines((line for chunk in reader for line in iter_chunk_candidates(chunk, matcher)), file_path, matcher,
+                       error_hourly_counts, days_to_analyze, output, timeline)
+        except Exception as e:
+            logging.error(f"Failed to decompress {file_path}: {e}")
+        finally:
+            reader.close()
+        output.end_file()
+        return
+
+    if file_path.endswith(COMPRESSED_EXTENSIONS):
+        # --profile reads line by line in this thread, so decompression and decoding are timed apart
+        try:
+            stream = open_compressed_file(file_path)
+        except Exception as e:
+            logging.error(f"Failed to decompress {file_path}: {e}")
+            return
+
+        with stream:
+            output.start_file(file_path, matcher.types_for(file_path))
+            file_stats = profile.file(file_path)
+            stream = TimedStream(stream, file_stats)
+            decode = profile.timed_decode(file_stats)
+            try:
+                scan_lines(iter_decoded_lines(stream, decode), file_path, matcher, error_hourly_counts, days_to_analyze,
+                           output, timeline, profile)
+            except Exception as e:
+                logging.error(f"Failed to decompress {file_path}: {e}")
+        output.end_file()
+        return
+
+    # Plain files are memory-mapped so only the lines that can match are decoded
+    try:
+        with open(file_path, 'rb') as f:
+            if file_path.endswith(ARCHIVE_EXTENSIONS) or not is_text_block(f.read(512)):
+                logging.warning(f"Skipping non-text or unreadable file: {file_path}")
+                return
+            size = os.fstat(f.fileno()).st_size
+            # Jump over the lines older than --days
+            start_offset = find_window_start(f, size, get_timestamp_parser(days_to_analyze))
+            output.start_file(file_path, matcher.types_for(file_path))
+            decode = file_stats = None
+            if profile is not None:
+                file_stats = profile.file(file_path)
+                file_stats['bytes'] = size - start_offset
+                decode = profile.timed(decode_line, file_stats, 'decode_seconds')
+            if start_offset < size:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    scan_lines(iter_candidate_lines(buffer, start_offset, matcher, decode, file_stats), file_path,
+                               matcher, error_hourly_counts, days_to_analyze, output, timeline, profile)
+            output.end_file()
+    except FileNotFoundError:
+        logging.warning(f"Skipping non-text or unreadable file: {file_path}")
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while processing {file_path}: {e}")
+        sys.exit(1)
+
+def scan_journal(buffer, file_path, matcher, error_hourly_counts, days_to_analyze, output, timeline=None, profile=None,
+                 progress=None):
+    """
+    Scans the entries of a systemd journal file, starting at the first entry within --days.
+
+    :param buffer: The content of the journal file, an mmap or bytes.
+    :param progress: For --state, a dict whose 'offset' is the index of the first entry to scan,
+                     or 0 to seek to --days, and is advanced past each entry scanned.
+    """
+    try:
+        reader = JournalReader(buffer)
+    except (ValueError, struct.error) as e:
+        logging.warning(f"Skipping unreadable journal file {file_path}: {e}")
+        return
+
+    cutoff_realtime = int(get_timestamp_parser(days_to_analyze).cutoff.timestamp() * 1000000)
+    start = progress['offset'] if progress is not None else 0
+    if not start:
+        if reader.tail_realtime < cutoff_realtime:
+            logging.info(f"Skipping file {file_path} as its last entry is older than {days_to_analyze} days.")
+            return
+        start = reader.find_entry(cutoff_realtime)
+        if progress is not None:
+            progress['offset'] = start
+
+    output.start_file(file_path, matcher.types_for(file_path))
+    decode = None
+    if profile is not None:
+        file_stats = profile.file(file_path)
+        file_stats['bytes'] += len(buffer)
+        decode = profile.timed_decode(file_stats)
+    try:
+        scan_lines(iter_journal_lines(reader, start, decode, progress), file_path, matcher, error_hourly_counts,
+                   days_to_analyze, output, timeline, profile)
+    except (ValueError, struct.error) as e:
+        # A journal still being written can end in a partly written entry
+        logging.error(f"Failed to read journal entries from {file_path}: {e}")
+    output.end_file()
+    if reader.skipped_payloads:
+        logging.warning(f"Skipped {reader.skipped_payloads} compressed fields in {file_path}, "
+                        f"install the zstandard or lz4 module to read them.")
+
+def safe_hostname(hostname):
+    """
+    :return: The hostname usable as a file name prefix: characters other than letters, digits,
+             '.', '_' and '-' are replaced by '_', and '.' or '..' become underscores.
+    """
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', hostname)
+    if name in ('', '.', '..'):
+        return '_' * max(len(name), 1)
+    return name
+
+class TimelineCollector:
+    """
+    Collects matched lines per host and writes one chronological timeline file per host.
+
+    Entries are buffered as (timestamp, line without the timestamp/hostname prefix). Once the
+    buffers exceed `memory_budget` bytes, each host's buffer is sorted and spilled to a
+    temporary run file. The timeline is then produced with a heap-based k-way merge over the
+    sorted runs, so the peak memory is bounded by the budget rather than by the number of
+    matched lines. Entries with the same timestamp keep the order they were added in.
+    """
+
+    # Rough per-entry cost of the tuple and the two strings on top of the text itself
+    ENTRY_OVERHEAD = 160
+    MAX_MERGE_RUNS = 64
+
+    def __init__(self, memory_budget, temp_root=None):
+        """
+        :param memory_budget: Approximate bytes to buffer before spilling, or None to never spill.
+        :param temp_root: Directory to create the directory of the run files in, by default the
+                          system temporary directory.
+        """
+        self.memory_budget = memory_budget
+        self.temp_root = temp_root
+        self.buffers = defaultdict(list)
+        self.buffered_bytes = 0
+        self.runs = defaultdict(list)
+        self.run_count = 0
+        self.temp_dir = None
+
+    def add(self, hostname, timestamp, remaining_line):
+        self.buffers[hostname].append((timestamp, remaining_line))
+        self.buffered_bytes += len(remaining_line) + self.ENTRY_OVERHEAD
+        if self.memory_budget is not None and self.buffered_bytes > self.memory_budget:
+            self.spill()
+
+    def add_entries(self, hostname, entries):
+        for timestamp, remaining_line in entries:
+            self.add(hostname, timestamp, remaining_line)
+
+    def new_run_path(self):
+        if self.temp_dir is None:
+            self.temp_dir = tempfile.mkdtemp(prefix='linux_log_parser_', dir=self.temp_root)
+        self.run_count += 1
+        return os.path.join(self.temp_dir, f"run_{self.run_count}.txt")
+
+    def spill(self):
+        for hostname, entries in self.buffers.items():
+            if not entries:
+                continue
+            entries.sort(key=itemgetter(0))
+            run_path = self.new_run_path()
+            with open(run_path, 'w', encoding='utf-8', newline='\n') as run_file:
+                for timestamp, remaining_line in entries:
+                    run_file.write(f"{timestamp}\t{remaining_line}\n")
+            self.runs[hostname].append(run_path)
+            entries.clear()
+            if len(self.runs[hostname]) >= self.MAX_MERGE_RUNS:
+                self.compact_runs(hostname)
+        self.buffered_bytes = 0
+
+    def compact_runs(self, hostname):
+        """
+        Merges the spilled runs of `hostname` into one, so the final merge never has more
+        than MAX_MERGE_RUNS files open at once.
+        """
+        run_paths = self.runs[hostname]
+        merged_path = self.new_run_path()
+        with open(merged_path, 'w', encoding='utf-8', newline='\n') as run_file:
+            for timestamp, remaining_line in heapq.merge(*(self.read_run(run_path) for run_path in run_paths), key=itemgetter(0)):
+                run_file.write(f"{timestamp}\t{remaining_line}\n")
+        for run_path in run_paths:
+            os.remove(run_path)
+        self.runs[hostname] = [merged_path]
+
+    def spilled_runs(self):
+        """
+        Spills the buffered entries, for a worker process to hand its timeline over to the
+        parent's collector with adopt_runs.
+
+        :return: A dict of hostname to its run files, in the order they were spilled.
+        """
+        self.spill()
+        return dict(self.runs)
+
+    def adopt_runs(self, hostname, run_paths):
+        """
+        Moves the run files of another collector into this one. Their entries come after the
+        entries added so far when the timestamps are equal.
+        """
+        if self.buffers.get(hostname):
+            self.spill()
+        for run_path in run_paths:
+            adopted_path = self.new_run_path()
+            shutil.move(run_path, adopted_path)
+            self.runs[hostname].append(adopted_path)
+            if len(self.runs[hostname]) >= self.MAX_MERGE_RUNS:
+                self.compact_runs(hostname)
+
+    @staticmethod
+    def read_run(run_path):
+        with open(run_path, 'r', encoding='utf-8', newline='\n') as run_file:
+            for record in run_file:
+                timestamp, remaining_line = record.rstrip('\n').split('\t', 1)
+                yield timestamp, remaining_line
+
+    def hostnames(self):
+        # Hosts in the order they were first seen, whether their entries are buffered or spilled
+        return list(dict.fromkeys(list(self.runs) + list(self.buffers)))
+
+    def iter_host(self, hostname):
+        """
+        Yields (timestamp, remaining line) for `hostname` in time order.
+        """
+        buffered = sorted(self.buffers.get(hostname, []), key=itemgetter(0))
+        runs = [self.read_run(run_path) for run_path in self.runs.get(hostname, [])]
+        return heapq.merge(*runs, buffered, key=itemgetter(0))
+
+    def iter_all(self):
+        """
+        Yields (timestamp, hostname, remaining line) for all hosts in time order.
+        """
+        def host_entries(hostname):
+            for timestamp, remaining_line in self.iter_host(hostname):
+                yield timestamp, hostname, remaining_line
+        return heapq.merge(*(host_entries(hostname) for hostname in self.hostnames()), key=itemgetter(0))
+
+    def write_files(self, timestamp):
+        """
+        Writes `<hostname>_<timestamp>_sort.txt` for every host and removes the spilled runs.
+
+        :return: The names of the files written.
+        """
+        file_names = []
+        try:
+            for hostname in self.hostnames():
+                file_prefix = safe_hostname(hostname)
+                # Hostnames that only differ in replaced characters get numbered files
+                suffix = 1
+                hostname_output_file_name = f"{file_prefix}_{timestamp}_sort.txt"
+                while hostname_output_file_name in file_names:
+                    suffix += 1
+                    hostname_output_file_name = f"{file_prefix}_{suffix}_{timestamp}_sort.txt"
+                with open(hostname_output_file_name, 'w') as hostname_output_file:
+                    hostname_output_file.write(f"======= Hostname: {hostname} =======\n")
+                    written = 0
+                    for log_timestamp, remaining_line in self.iter_host(hostname):
+                        hostname_output_file.write(f"{log_timestamp} | {remaining_line}\n")
+                        written += 1
+                    if not written:
+                        hostname_output_file.write("No errors captured.\n")
+                file_names.append(hostname_output_file_name)
+        finally:
+            self.close()
+        return file_names
+
+    def close(self):
+        if self.temp_dir is not None:
+            shutil.rmtree(self.temp_dir, ignore_errors=True)
+            self.temp_dir = None
+        self.runs.clear()
+
+# Stages of a cluster incident as (stage, literals, regexes), matched against the lowercased
+# line. A line belongs to the first stage that one of its literals is a substring of or one of
+# its regexes matches. Each regex starts with a literal the regex engine can search for
+# quickly, combining them into one alternation would lose that.
+# Stages are tried in list order. fence_request comes first because the fence request usually
+# names its reason, e.g. "will be fenced: peer is no longer part of the cluster"
+INCIDENT_STAGES = [
+    ('fence_request', ('will be fenced', 'wants to fence'),
+     [r'requesting (?:peer )?fencing', r'scheduling node \S+ for (?:stonith|fencing)']),
+    ('membership_loss', ('is now lost', 'no longer part of the cluster', 'lack of quorum', 'is unclean', 'was not expected'),
+     [r'\[totem \] (?:a processor failed|a new membership)', r'link.* is down']),
+    ('fence_result', ('was terminated (',),
+     [r'operation \W?\w+\W? (?:\[\d+\] )?(?:of|targeting) \S+ .*(?:returned|: \w)']),
+    ('resource_failure', ('unexpected result', 'did not complete within', 'timed out after'),
+     [r'forcing \S+ away', r'failed to (?:start|stop)']),
+    ('demote', ('result of demote operation', 'initiating demote operation'), [r' demote \S+\s+\(']),
+    ('failover', ('result of promote operation', 'initiating promote operation', 'sr_takeover'),
+     [r' promote \S+\s+\(', r' move \S+\s+\(']),
+]
+INCIDENT_STAGE_SEARCHES = [(stage, literals, [re.compile(regex).search for regex in regexes])
+                           for stage, literals, regexes in INCIDENT_STAGES]
+
+def incident_stage(line):
+    """
+    :return: The INCIDENT_STAGES stage of the line, or None.
+    """
+    lowered = line.lower()
+    for stage, literals, searches in INCIDENT_STAGE_SEARCHES:
+        for literal in literals:
+            if literal in lowered:
+                return stage
+        for search in searches:
+            if search(lowered):
+                return stage
+    return None
+
+EPOCH = datetime(1970, 1, 1)
+
+class IncidentCorrelator:
+    """
+    Groups the matched lines of all hosts into incidents, such as a membership loss followed
+    by a fence request, the fence result and the promotion of the surviving node.
+
+    Lines are fed in time order across all hosts and classified into INCIDENT_STAGES, lines of
+    no stage are ignored. An incident is a session window: it stays open while each staged
+    line follows the previous one within `gap_seconds`, and is closed by the first line after
+    a longer gap. Only the open incident is kept, with per-stage counts and the first line of
+    each stage, so memory does not grow with the number of lines.
+    """
+
+    MAX_HOSTS = 64
+
+    def __init__(self, gap_seconds):
+        self.gap_seconds = gap_seconds
+        self.incident = None
+        self.last_seconds = None
+        self.hour_cache = {}
+
+    def seconds(self, timestamp):
+        # "%Y-%m-%d %H:%M:%S" as seconds since the epoch, computed once per hour
+        hour = timestamp[:13]
+        hour_seconds = self.hour_cache.get(hour)
+        if hour_seconds is None:
+            if len(self.hour_cache) >= TimestampParser.CACHE_LIMIT:
+                self.hour_cache.clear()
+            hour_date = datetime(int(hour[:4]), int(hour[5:7]), int(hour[8:10]), int(hour[11:13]))
+            hour_seconds = self.hour_cache[hour] = int((hour_date - EPOCH).total_seconds())
+        return hour_seconds + int(timestamp[14:16]) * 60 + int(timestamp[17:19])
+
+    def add(self, timestamp, hostname, line):
+        """
+        :return: The incident closed by this line, or None.
+        """
+        stage_name = incident_stage(line)
+        if stage_name is None:
+            return None
+        seconds = self.seconds(timestamp)
+        closed = None
+        if self.incident is not None and seconds - self.last_seconds > self.gap_seconds:
+            closed = self.incident
+            self.incident = None
+        if self.incident is None:
+            self.incident = {'start': timestamp, 'start_seconds': seconds, 'events': 0, 'hosts': {}, 'stages': {}}
+        self.last_seconds = seconds
+
+        incident = self.incident
+        incident['end'] = timestamp
+        incident['duration'] = seconds - incident['start_seconds']
+        incident['events'] += 1
+        if hostname in incident['hosts'] or len(incident['hosts']) < self.MAX_HOSTS:
+            incident['hosts'][hostname] = incident['hosts'].get(hostname, 0) + 1
+        stage = incident['stages'].get(stage_name)
+        if stage is None:
+            incident['stages'][stage_name] = {'first': timestamp, 'offset': seconds - incident['start_seconds'],
+                                                   'host': hostname, 'line': line, 'count': 1}
+        else:
+            stage['count'] += 1
+        return closed
+
+    def finish(self):
+        """
+        :return: The incident still open at the end of the lines, or None.
+        """
+        incident, self.incident = self.incident, None
+        return incident
+
+def format_duration(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}h {minutes:02d}m {seconds:02d}s"
+    if minutes:
+        return f"{minutes}m {seconds:02d}s"
+    return f"{seconds}s"
+
+def print_incidents(timeline, gap_seconds, output):
+    """
+    Correlates the per-host timelines into incidents and writes them in time order, each
+    with its duration, hosts and the first line of every stage it went through.
+
+    :return: The number of incidents.
+    """
+    separator = "=" * 80
+    output.line("\n" + separator)
+    output.line("Incident Report")
+    output.line(separator)
+
+    correlator = IncidentCorrelator(gap_seconds)
+    count = 0
+
+    def print_incident(incident):
+        hosts = ', '.join(incident['hosts'])
+        sequence = ' -> '.join(incident['stages'])
+        output.line(f"\nIncident {count}: {incident['start']} ~ {incident['end']} ({format_duration(incident['duration'])}), "
+                    f"{incident['events']} events on {hosts}")
+        output.line(f"  {sequence}")
+        for stage_name, stage in incident['stages'].items():
+            output.line(f"  +{format_duration(stage['offset']):<12} {stage_name:<17} {stage['count']:>6}x  "
+                        f"[{stage['host']}] {stage['line'][:160]}")
+
+    for timestamp, hostname, line in timeline.iter_all():
+        closed = correlator.add(timestamp, hostname, line)
+        if closed is not None:
+            count += 1
+            print_incident(closed)
+    last = correlator.finish()
+    if last is not None:
+        count += 1
+        print_incident(last)
+
+    if not count:
+        output.line("\nNo incidents found.")
+    return count
+
+def print_error_statistics(error_counts, error_hourly_counts, output=None):
+    if output is None:
+        output = ScanOutput(stdout=sys.stdout)
+    
+    title = """
+##########################################
+#                                        #
+#       Linux Log Analysis               #
+#       From Azure Linux Team            #
+#                                        #
+##########################################
+"""
+
+    # Print the title
+    output.line(title)
+        
+    # Get the local time and timezone
+    local_time = time.localtime()
+    local_timezone = time.strftime('%Z', local_time)
+    local_utc_offset = time.strftime('%z', local_time)
+
+    # Get and print the current local timestamp with timezone
+    current_timestamp = datetime.now().strftime(f"%Y-%m-%d %H:%M:%S {local_timezone}{local_utc_offset}")
+    timestamp_line = f"Report generated on: {current_timestamp}\n"
+    output.line(timestamp_line)
+        
+    separator = "=" * 80  # Define a separator line for clarity
+    output.line("\n" + separator)
+    output.line("Error Statistics Report")
+    output.line(separator)
+
+    for hostname, patterns in error_hourly_counts.by_host().items():
+        host_header = f"\n{separator}\nError Statistics for Hostname: {hostname}\n{separator}"
+        output.line(host_header)
+
+        for pattern, cells in patterns.items():
+            clean_pattern = pattern.replace(r'\b', '')
+            total_count = sum(count for _, _, count in cells)
+            result = f"\nPattern: \"{clean_pattern}\" - {total_count} occurrences"
+            output.line(result)
+
+            # Group occurrences by file path, the sort is stable so files keep their first-seen order within an hour
+            file_grouped_data = defaultdict(list)
+            for date_hour, file_path, file_count in sorted(cells, key=itemgetter(0)):
+                file_grouped_data[file_path].append((date_hour, file_count))
+
+            for file_path, occurrences in file_grouped_data.items():
+                output.line(f"\n[{file_path}]")
+
+                for date_hour, count in occurrences:
+                    if count > 0:
+                        date, hour = date_hour.split()
+                        if len(date_hour) == MINUTE_BUCKET_LENGTH:
+                            hourly_result = f"{date} {hour} - {count} occurrences"
+                        else:
+                            hourly_result = f"{date} {hour}:00 ~ {hour}:59 - {count} occurrences"
+                        output.line(hourly_result)
+
+def should_process_file(file_path, processed_files, existing_files=None):
+    """
+    Determine if a given log file should be processed based on whether it has
+    a compressed counterpart.
+
+    :param file_path: Path to the log file.
+    :param processed_files: Set of processed file paths to avoid duplicates. Paths rather than
+                            names, so the same rotation on another host is not a duplicate.
+    :param existing_files: Set of all file paths, e.g. the members of an archive; the file
+                           system is checked if not given.
+    :return: Boolean indicating if the file should be processed.
+    """
+    exists = os.path.exists if existing_files is None else existing_files.__contains__
+    # Check if the file is a compressed log file
+    if file_path.endswith(COMPRESSED_EXTENSIONS):
+        # Consider the path without the compression extension
+        base_name = os.path.splitext(file_path)[0]
+        if base_name in processed_files:
+            # If the base name is already in the processed files, skip this file
+            return False
+        # Otherwise, mark this compressed file as processed
+        processed_files.add(base_name)
+        return True
+    else:
+        # For uncompressed files, only process if there's no compressed counterpart
+        if not any(exists(f"{file_path}{extension}") for extension in COMPRESSED_EXTENSIONS):
+            # If no compressed version exists, mark this file as processed
+            processed_files.add(file_path)
+            return True
+    return False
+    
+class HourlyCounts:
+    """
+    Occurrence counts per hostname, pattern, date-hour and file.
+
+    Hostnames, patterns, date-hours and file paths are interned to integer IDs, so each
+    string is stored once. Each (hostname, pattern, date-hour, file) cell is a single dict
+    entry whose key packs the four IDs into one int and whose value is the count. The dict
+    keeps cells in the order they were first seen, which gives the same hostname, pattern
+    and file order as the nested dicts this replaces.
+
+    `bucket_length` is the length of the timestamp prefix each count is bucketed by,
+    HOUR_BUCKET_LENGTH for date-hours or MINUTE_BUCKET_LENGTH for date-minutes.
+    """
+
+    def __init__(self, bucket_length=HOUR_BUCKET_LENGTH):
+        self.bucket_length = bucket_length
+        self.ids = ({}, {}, {}, {})  # hostname, pattern, date-hour, file path -> ID
+        self.names = ([], [], [], [])  # ID -> hostname, pattern, date-hour, file path
+        # Bits per ID, sized so a packed key usually fits in a 60-bit int; widen() grows them
+        self.widths = [11, 12, 17, 20]
+        self.counts = {}
+
+    def intern(self, kind, name):
+        ids = self.ids[kind]
+        name_id = ids.get(name)
+        if name_id is None:
+            name_id = ids[name] = len(self.names[kind])
+            self.names[kind].append(name)
+            if name_id >> self.widths[kind]:
+                self.widen(kind)
+        return name_id
+
+    def widen(self, kind):
+        old_widths = self.widths
+        self.widths = list(old_widths)
+        self.widths[kind] += 4
+        self.counts = {self.pack(*self.unpack(key, old_widths)): count for key, count in self.counts.items()}
+
+    def pack(self, host_id, pattern_id, hour_id, file_id):
+        _, pattern_bits, hour_bits, file_bits = self.widths
+        return (((host_id << pattern_bits | pattern_id) << hour_bits | hour_id) << file_bits) | file_id
+
+    @staticmethod
+    def unpack(key, widths):
+        _, pattern_bits, hour_bits, file_bits = widths
+        file_id = key & ((1 << file_bits) - 1)
+        key >>= file_bits
+        hour_id = key & ((1 << hour_bits) - 1)
+        key >>= hour_bits
+        return key >> pattern_bits, key & ((1 << pattern_bits) - 1), hour_id, file_id
+
+    def add(self, hostname, pattern, date_hour, file_path, count=1):
+        key = self.pack(self.intern(0, hostname), self.intern(1, pattern), self.intern(2, date_hour), self.intern(3, file_path))
+        self.counts[key] = self.counts.get(key, 0) + count
+
+    def __iter__(self):
+        """
+        Yields (hostname, pattern, date_hour, file_path, count) for every cell, in first-seen order.
+        """
+        hostnames, patterns, date_hours, file_paths = self.names
+        widths = self.widths
+        for key, count in self.counts.items():
+            host_id, pattern_id, hour_id, file_id = self.unpack(key, widths)
+            yield hostnames[host_id], patterns[pattern_id], date_hours[hour_id], file_paths[file_id], count
+
+    def __len__(self):
+        return len(self.counts)
+
+    def merge(self, other):
+        """
+        Adds the counts from `other`, e.g. the partial counts of a parallel worker.
+
+        Merging partial results in file order gives the same order as a serial scan, so
+        print_error_statistics produces the same report.
+        """
+        for hostname, pattern, date_hour, file_path, count in other:
+            self.add(hostname, pattern, date_hour, file_path, count)
+
+    def by_host(self):
+        """
+        Groups the cells for reporting.
+
+        :return: A dict of hostname to a dict of pattern to a list of (date_hour, file_path, count),
+                 all in first-seen order.
+        """
+        grouped = {}
+        for hostname, pattern, date_hour, file_path, count in self:
+            grouped.setdefault(hostname, {}).setdefault(pattern, []).append((date_hour, file_path, count))
+        return grouped
+
+    def arrays(self):
+        """
+        Unpacks all cells at once, needs numpy.
+
+        :return: A tuple of numpy arrays (hostname IDs, pattern IDs, date-hour IDs, counts), one
+                 element per cell in first-seen order. The IDs index into `names`.
+        """
+        cell_count = len(self.counts)
+        counts = np.fromiter(self.counts.values(), dtype=np.int64, count=cell_count)
+        if sum(self.widths) >= 64:
+            # Packed keys wider than an int64 after widen(), unpacked one by one
+            ids = np.array([self.unpack(key, self.widths) for key in self.counts], dtype=np.int64).reshape(cell_count, 4)
+            return ids[:, 0], ids[:, 1], ids[:, 2], counts
+        keys = np.fromiter(self.counts.keys(), dtype=np.int64, count=cell_count)
+        _, pattern_bits, hour_bits, file_bits = self.widths
+        keys >>= file_bits
+        hour_ids = keys & ((1 << hour_bits) - 1)
+        keys >>= hour_bits
+        return keys >> pattern_bits, keys & ((1 << pattern_bits) - 1), hour_ids, counts
+
+def new_error_hourly_counts(bucket_length=HOUR_BUCKET_LENGTH):
+    return HourlyCounts(bucket_length)
+
+class CountMatrix:
+    """
+    The counts of an HourlyCounts as a dense numpy array for vectorized analysis, with the
+    counts of all files summed.
+
+    `counts` has one row per (hostname, pattern) that occurs and one column per bucket from
+    the first to the last bucket with a count, empty buckets included. Rows are only made for
+    the pairs that occur, so a sparse hostname x pattern grid does not allocate empty rows;
+    `host_index` and `pattern_index` give the hostname and pattern of each row, rows are
+    sorted by hostname and then pattern in first-seen order.
+    """
+
+    # Rows analysed at once, bounds the float64 temporaries for minute buckets over many days
+    ROW_BLOCK_CELLS = 4 * 1024 * 1024
+
+    def __init__(self, error_hourly_counts):
+        hostnames, patterns, buckets, _ = error_hourly_counts.names
+        self.hostnames = list(hostnames)
+        self.patterns = list(patterns)
+        self.minutes = error_hourly_counts.bucket_length == MINUTE_BUCKET_LENGTH
+        self.bucket_seconds = 60 if self.minutes else 3600
+        bucket_format = '%Y-%m-%d %H:%M' if self.minutes else '%Y-%m-%d %H'
+        bucket_numbers = np.array([int((datetime.strptime(bucket, bucket_format) - EPOCH).total_seconds()) // self.bucket_seconds
+                                   for bucket in buckets], dtype=np.int64)
+
+        host_ids, pattern_ids, bucket_ids, counts = error_hourly_counts.arrays()
+        columns = bucket_numbers[bucket_ids] if len(counts) else np.zeros(0, dtype=np.int64)
+        self.start = int(columns.min()) if len(columns) else 0
+        columns -= self.start
+        pairs, rows = np.unique(host_ids * len(self.patterns) + pattern_ids, return_inverse=True)
+        self.host_index = pairs // max(len(self.patterns), 1)
+        self.pattern_index = pairs % max(len(self.patterns), 1)
+        self.counts = np.zeros((len(pairs), int(columns.max()) + 1 if len(columns) else 0), dtype=np.int32)
+        np.add.at(self.counts, (rows, columns), counts)
+
+    def bucket_label(self, column):
+        moment = EPOCH + timedelta(seconds=(self.start + int(column)) * self.bucket_seconds)
+        return moment.strftime('%Y-%m-%d %H:%M' if self.minutes else '%Y-%m-%d %H:00')
+
+    def row_blocks(self):
+        block_rows = max(1, self.ROW_BLOCK_CELLS // max(self.counts.shape[1], 1))
+        for block_start in range(0, self.counts.shape[0], block_rows):
+            yield block_start, self.counts[block_start:block_start + block_rows]
+
+    def spikes(self, window, threshold, min_count=3):
+        """
+        Finds the buckets whose count stands out against the previous `window` buckets of the
+        same hostname and pattern, empty buckets counting as zero.
+
+        The z-score is the count minus the baseline mean, divided by the baseline standard
+        deviation but by at least 1, so a burst after a flat baseline is not infinitely far
+        off. Buckets with less than a quarter of `window` buckets of history are not scored.
+
+        :return: A list of (row, column, count, baseline mean, z-score), highest z-score first.
+        """
+        spikes = []
+        bucket_total = self.counts.shape[1]
+        columns = np.arange(bucket_total)
+        window_starts = np.maximum(columns - window, 0)
+        history = (columns - window_starts).astype(np.float64)
+        scored = history >= max(1, window // 4)
+        history[history == 0] = 1
+        for block_start, block in self.row_blocks():
+            values = block.astype(np.float64)
+            # Window sums from prefix sums, prefix[:, i] is the sum of the first i buckets
+            prefix = np.zeros((len(block), bucket_total + 1))
+            np.cumsum(values, axis=1, out=prefix[:, 1:])
+            squares = np.zeros((len(block), bucket_total + 1))
+            np.cumsum(values * values, axis=1, out=squares[:, 1:])
+            mean = (prefix[:, :-1] - prefix[:, window_starts]) / history
+            variance = (squares[:, :-1] - squares[:, window_starts]) / history - mean * mean
+            z_scores = (values - mean) / np.maximum(np.sqrt(np.maximum(variance, 0)), 1.0)
+            rows, spike_columns = np.nonzero(scored & (values >= min_count) & (z_scores >= threshold))
+            spikes.extend(zip((rows + block_start).tolist(), spike_columns.tolist(), block[rows, spike_columns].tolist(),
+                              mean[rows, spike_columns].tolist(), z_scores[rows, spike_columns].tolist()))
+        spikes.sort(key=lambda spike: -spike[4])
+        return spikes
+
+    def busiest_buckets(self, top, contributors=3):
+        """
+        :return: A list of up to `top` (column, total, [(row, count), ...]) for the buckets with
+                 the most occurrences across all hostnames and patterns, with the rows that
+                 contributed most to each.
+        """
+        totals = self.counts.sum(axis=0, dtype=np.int64)
+        busiest = []
+        for column in np.argsort(-totals, kind='stable')[:top].tolist():
+            if not totals[column]:
+                break
+            column_counts = self.counts[:, column]
+            rows = [row for row in np.argsort(-column_counts, kind='stable')[:contributors].tolist() if column_counts[row]]
+            busiest.append((column, int(totals[column]), [(row, int(column_counts[row])) for row in rows]))
+        return busiest
+
+    def grouped_activity(self, index, group_count):
+        """
+        :return: A (group_count x buckets) array of the number of rows in each group, by `index`,
+                 with a count in each bucket.
+        """
+        activity = np.zeros((group_count, self.counts.shape[1]), dtype=np.int32)
+        if not len(index):
+            return activity
+        order = np.argsort(index, kind='stable')
+        groups, starts = np.unique(index[order], return_index=True)
+        activity[groups] = np.add.reduceat((self.counts[order] > 0).astype(np.int32), starts, axis=0)
+        return activity
+
+    def host_cooccurrence(self):
+        """
+        :return: A (hostnames x hostnames) array of the number of buckets in which both hosts
+                 have a count, the diagonal holds each host's active buckets.
+        """
+        active = (self.grouped_activity(self.host_index, len(self.hostnames)) > 0).astype(np.int32)
+        return active @ active.T
+
+    def pattern_spread(self):
+        """
+        :return: A tuple of arrays by pattern ID: the number of buckets in which the pattern
+                 occurs on more than one host, and the most hosts it occurs on in one bucket.
+        """
+        host_counts = self.grouped_activity(self.pattern_index, len(self.patterns))
+        if not host_counts.shape[1]:
+            return np.zeros(len(self.patterns), dtype=np.int64), np.zeros(len(self.patterns), dtype=np.int32)
+        return (host_counts > 1).sum(axis=1), host_counts.max(axis=1)
+
+    def write_csv(self, file_name):
+        """
+        Writes the non-zero cells as `bucket,hostname,pattern,count` rows in time order.
+        """
+        columns, rows = np.nonzero(self.counts.T)
+        with open(file_name, 'w', newline='') as csv_file:
+            writer = csv.writer(csv_file)
+            writer.writerow(['bucket', 'hostname', 'pattern', 'count'])
+            label = None
+            last_column = None
+            for column, row, count in zip(columns.tolist(), rows.tolist(), self.counts.T[columns, rows].tolist()):
+                if column != last_column:
+                    label, last_column = self.bucket_label(column), column
+                writer.writerow([label, self.hostnames[self.host_index[row]], self.patterns[self.pattern_index[row]], count])
+
+def print_activity_analysis(matrix, output, window, threshold, top):
+    """
+    Writes the spikes, the busiest buckets, the hosts active in the same buckets and the
+    patterns seen on several hosts at once.
+    """
+    separator = "=" * 80
+    unit = "minutes" if matrix.minutes else "hours"
+    output.line("\n" + separator)
+    output.line("Activity Analysis")
+    output.line(separator)
+
+    clean_patterns = [pattern.replace(r'\b', '') for pattern in matrix.patterns]
+
+    def row_name(row):
+        return f"[{matrix.hostnames[matrix.host_index[row]]}] {clean_patterns[matrix.pattern_index[row]]}"
+
+    spikes = matrix.spikes(window, threshold)
+    output.line(f"\nSpikes, z-score >= {threshold:g} against the previous {window} {unit} ({len(spikes)} found):")
+    for row, column, count, mean, z_score in spikes[:top]:
+        output.line(f"  {matrix.bucket_label(column)}  z={z_score:<6.1f} {count:>6} vs {mean:.1f}  {row_name(row)}")
+
+    output.line(f"\nBusiest {unit}:")
+    for column, total, contributors in matrix.busiest_buckets(top):
+        output.line(f"  {matrix.bucket_label(column)}  {total:>8} occurrences")
+        for row, count in contributors:
+            output.line(f"      {count:>8}  {row_name(row)}")
+
+    if len(matrix.hostnames) > 1:
+        shared = matrix.host_cooccurrence()
+        first_hosts, second_hosts = np.triu_indices(len(matrix.hostnames), k=1)
+        pair_counts = shared[first_hosts, second_hosts]
+        output.line(f"\nHosts active in the same {unit}:")
+        for pair in np.argsort(-pair_counts, kind='stable')[:top].tolist():
+            if not pair_counts[pair]:
+                break
+            first, second = first_hosts[pair], second_hosts[pair]
+            output.line(f"  {matrix.hostnames[first]} & {matrix.hostnames[second]}: {pair_counts[pair]} shared of "
+                        f"{shared[first, first]} / {shared[second, second]} active {unit}")
+
+        multi_host_buckets, max_hosts = matrix.pattern_spread()
+        output.line(f"\nPatterns on several hosts in the same {unit[:-1]}:")
+        for pattern_id in np.argsort(-multi_host_buckets, kind='stable')[:top].tolist():
+            if not multi_host_buckets[pattern_id]:
+                break
+            output.line(f"  {multi_host_buckets[pattern_id]:>6} {unit}, up to {max_hosts[pattern_id]} hosts: "
+                        f"{clean_patterns[pattern_id]}")
+
+# Set in each worker process by init_scan_worker so the matcher is only sent once per process
+_worker_state = {}
+
+def init_scan_worker(matcher, days_to_analyze, output_sinks, profiling, bucket_length, spool_dir, timeline_budget):
+    _worker_state['matcher'] = matcher
+    _worker_state['days_to_analyze'] = days_to_analyze
+    _worker_state['output_sinks'] = output_sinks
+    _worker_state['profiling'] = profiling
+    _worker_state['bucket_length'] = bucket_length
+    _worker_state['spool_dir'] = spool_dir
+    _worker_state['timeline_budget'] = timeline_budget
+
+def scan_file_worker(file_path):
+    """
+    Runs parse_log for one file in a worker process.
+
+    :param file_path: Path of the log file to scan.
+    :return: A tuple of (ScanOutput.values(), partial HourlyCounts, timeline run files by hostname,
+             ScanProfile or None). The files are in the spool directory given to init_scan_worker.
+    """
+    error_hourly_counts = new_error_hourly_counts(_worker_state['bucket_length'])
+    timeline = TimelineCollector(_worker_state['timeline_budget'], temp_root=_worker_state['spool_dir'])
+    output = ScanOutput.buffered(_worker_state['output_sinks'], _worker_state['spool_dir'])
+    profile = ScanProfile(_worker_state['matcher']) if _worker_state['profiling'] else None
+    parse_log(file_path, _worker_state['matcher'], error_hourly_counts, _worker_state['days_to_analyze'],
+              output, timeline, profile)
+    return scan_result(output, error_hourly_counts, timeline, profile)
+
+def scan_result(output, error_hourly_counts, timeline, profile):
+    return output.values(), error_hourly_counts, timeline.spilled_runs(), profile
+
+def iter_pool_results(executor, function, items, max_pending):
+    """
+    Like executor.map, but submits at most `max_pending` calls ahead of the result being
+    consumed, so finished results do not pile up while an earlier, slower call runs.
+    """
+    pending = deque()
+    for item in items:
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, item))
+    while pending:
+        yield pending.popleft().result()
+
+def parse_logs_parallel(file_paths, matcher, error_hourly_counts, days_to_analyze, jobs, output=None, timeline=None,
+                        profile=None):
+    """
+    Scans `file_paths` in a pool of `jobs` worker processes.
+
+    The workers write their output and spill their timeline to files in a spool directory,
+    the budget of `timeline` is split between them. Results are collected in the order of
+    `file_paths`, with at most two files per worker in flight, so the per-file sections, the
+    merged counts and the timelines come out the same as calling parse_log on each file in turn.
+    """
+    if output is None:
+        output = ScanOutput(stdout=sys.stdout)
+    timeline_budget = timeline.memory_budget // jobs if timeline is not None and timeline.memory_budget is not None else None
+    spool_dir = tempfile.mkdtemp(prefix='linux_log_parser_')
+    initargs = (matcher, days_to_analyze, output.sinks(), profile is not None, error_hourly_counts.bucket_length,
+                spool_dir, timeline_budget)
+    try:
+        with ProcessPoolExecutor(max_workers=jobs, initializer=init_scan_worker, initargs=initargs) as executor:
+            for result in iter_pool_results(executor, scan_file_worker, file_paths, jobs * 2):
+                merge_scan_result(result, error_hourly_counts, output, timeline, profile)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def merge_scan_result(result, error_hourly_counts, output, timeline=None, profile=None):
+    """
+    Adds the result of scan_file_worker or scan_archive_member for one file.
+    """
+    output_values, partial_counts, timeline_runs, partial_profile = result
+    output.write_values(output_values)
+    if profile is not None:
+        profile.merge(partial_profile)
+    error_hourly_counts.merge(partial_counts)
+    if timeline is not None:
+        for hostname, run_paths in timeline_runs.items():
+            timeline.adopt_runs(hostname, run_paths)
+
+class ScanState:
+    """
+    Per-file scan progress persisted between runs for --state, and kept in memory between
+    polls for --follow.
+
+    Entries are keyed by device and inode, so a file renamed by logrotate keeps its entry.
+    Each entry records the size and mtime seen, the byte offset scanned so far, a hash of
+    the first HEAD_BYTES of (decompressed) content and the file's hourly counts. The head
+    hash is how a compressed rotation is matched to the plain file it was made from.
+    """
+
+    VERSION = 1
+    HEAD_BYTES = 4096
+
+    def __init__(self, path, fingerprint, files=None):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.files = files or {}
+        self.claimed = set()
+
+    @classmethod
+    def load(cls, path, fingerprint):
+        """
+        Loads the state file, or starts empty if it is missing, unreadable, or was written
+        for different patterns or --days.
+        """
+        if not os.path.isfile(path):
+            return cls(path, fingerprint)
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable state file {path}: {e}")
+            return cls(path, fingerprint)
+
+        if data.get('version') != cls.VERSION or data.get('fingerprint') != fingerprint:
+            logging.info(f"State file {path} was written for other patterns or --days, rescanning all files.")
+            return cls(path, fingerprint)
+        return cls(path, fingerprint, data.get('files', {}))
+
+    def end_pass(self, cutoff_hour):
+        """
+        Drops entries for files not seen in this pass, such as deleted rotations, and hourly
+        counts older than `cutoff_hour`, then starts a new pass.
+        """
+        self.files = {key: entry for key, entry in self.files.items() if key in self.claimed}
+        for entry in self.files.values():
+            for hostname, patterns in list(entry['counts'].items()):
+                for pattern, date_hourly_counts in list(patterns.items()):
+                    for date_hour in [date_hour for date_hour in date_hourly_counts if date_hour < cutoff_hour]:
+                        del date_hourly_counts[date_hour]
+                    if not date_hourly_counts:
+                        del patterns[pattern]
+                if not patterns:
+                    del entry['counts'][hostname]
+        self.claimed = set()
+
+    def save(self):
+        if not self.path:
+            return
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump({'version': self.VERSION, 'fingerprint': self.fingerprint, 'files': self.files}, f)
+        os.replace(temp_path, self.path)
+
+    def find_by_head(self, head):
+        """
+        Finds an unclaimed entry for a plain file whose content starts with the same head.
+
+        :param head: The first HEAD_BYTES of the new file's (decompressed) content.
+        :return: A tuple of (key, entry), or (None, None) if no entry matches.
+        """
+        for key, entry in self.files.items():
+            if key in self.claimed or entry['compressed'] or not entry['head_length']:
+                continue
+            if file_state_key(entry['path']) == key:
+                continue  # The original file is still in place and resumes under its own inode
+            if entry['head_length'] <= len(head) and entry['head_hash'] == head_hash(head, entry['head_length']):
+                return key, entry
+        return None, None
+
+def file_state_key(file_path):
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return f"{stat.st_dev}:{stat.st_ino}"
+
+def scan_state_fingerprint(matcher, days_to_analyze, bucket_length=HOUR_BUCKET_LENGTH):
+    digest = hashlib.sha1('\n'.join(matcher.pattern_names()).encode('utf-8'))
+    digest.update(f"\n{days_to_analyze}".encode('utf-8'))
+    # Hourly state files written before minute buckets existed keep matching
+    if bucket_length != HOUR_BUCKET_LENGTH:
+        digest.update(f"\n{bucket_length}".encode('utf-8'))
+    return digest.hexdigest()
+
+def head_hash(head, length):
+    return hashlib.sha1(head[:length]).hexdigest()
+
+def skip_bytes(stream, count):
+    while count > 0:
+        chunk = stream.read(min(count, STREAM_BUFFER_SIZE))
+        if not chunk:
+            break
+        count -= len(chunk)
+
+def iter_tracked_lines(stream, progress, stop_at_partial, decode=None):
+    """
+    Yields decoded lines and advances progress['offset'] past each one.
+
+    :param stop_at_partial: Stop before a final line without a newline, it may still be
+                            being written and is picked up by the next run instead.
+    :param decode: Replaces decode_line, used by --profile to time decoding.
+    """
+    decode = decode or decode_line
+    for raw_line in iter(lambda: stream.readline(STREAM_LINE_LIMIT), b''):
+        if stop_at_partial and not raw_line.endswith(b'\n') and len(raw_line) < STREAM_LINE_LIMIT:
+            break
+        progress['offset'] += len(raw_line)
+        yield decode(raw_line)
+
+def add_file_counts(file_counts, partial_counts):
+    """
+    Adds the counts parse_log collected for one file to the per-file counts kept in the state.
+    """
+    for hostname, pattern, date_hour, _, count in partial_counts:
+        pattern_counts = file_counts.setdefault(hostname, {}).setdefault(pattern, {})
+        pattern_counts[date_hour] = pattern_counts.get(date_hour, 0) + count
+
+def merge_file_counts(error_hourly_counts, file_counts, file_path, cutoff_hour):
+    for hostname, patterns in file_counts.items():
+        for pattern, date_hourly_counts in patterns.items():
+            for date_hour, count in date_hourly_counts.items():
+                if date_hour < cutoff_hour:
+                    continue
+                error_hourly_counts.add(hostname, pattern, date_hour, file_path, count)
+
+def parse_log_incremental(file_path, matcher, error_hourly_counts, days_to_analyze, state, output=None, timeline=None,
+                          profile=None):
+    """
+    Scans only the part of `file_path` that previous runs recorded in `state` have not seen.
+
+    Plain files resume from the stored offset when the inode and head hash still match.
+    A compressed file whose decompressed head matches a plain file from an earlier run
+    continues from that file's offset, so data is not counted twice after rotation.
+    Unchanged files are not read at all, their stored counts are reused. For journal files
+    the offset counts entries, and the journal's file ID stands in for the head.
+    """
+    if output is None:
+        output = ScanOutput(stdout=sys.stdout)
+    if not is_scannable_log(file_path, days_to_analyze):
+        return
+
+    try:
+        stat = os.stat(file_path)
+    except OSError as e:
+        logging.error(f"Unable to stat {file_path}: {e}")
+        return
+
+    compressed = file_path.endswith(COMPRESSED_EXTENSIONS)
+    journal = file_path.endswith(JOURNAL_EXTENSIONS)
+    key = f"{stat.st_dev}:{stat.st_ino}"
+    cutoff_hour = get_timestamp_parser(days_to_analyze).cutoff_hour
+    entry = state.files.get(key) if key not in state.claimed else None
+
+    if entry and entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime:
+        # Nothing was appended since the last run
+        state.claimed.add(key)
+        merge_file_counts(error_hourly_counts, entry['counts'], file_path, cutoff_hour)
+        return
+
+    try:
+        stream = open_compressed_file(file_path) if compressed else open(file_path, 'rb')
+    except Exception as e:
+        logging.error(f"Failed to open {file_path}: {e}")
+        return
+
+    partial_counts = new_error_hourly_counts(error_hourly_counts.bucket_length)
+    try:
+        head = stream.read(ScanState.HEAD_BYTES)
+        if journal:
+            # The rest of a journal's header changes with every entry written
+            head = head[24:40]
+        head_length = len(head)
+
+        if entry and entry['head_length'] <= head_length and entry['head_hash'] == head_hash(head, entry['head_length']) \
+                and (compressed or entry['offset'] <= stat.st_size):
+            previous_key = key
+        else:
+            # New inode, or the inode was reused or truncated; look for the content under another inode
+            previous_key, entry = state.find_by_head(head)
+        if entry is None:
+            entry = {'offset': 0, 'counts': {}}
+        state.claimed.add(key)
+        if previous_key is not None:
+            state.claimed.add(previous_key)
+            if previous_key != key:
+                logging.info(f"Resuming {file_path} from {entry['path']} at offset {entry['offset']}.")
+
+        offset = entry['offset']
+        if journal:
+            progress = {'offset': offset}
+            with mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                scan_journal(buffer, file_path, matcher, partial_counts, days_to_analyze, output, timeline, profile,
+                             progress)
+        else:
+            if not compressed:
+                if offset == 0:
+                    offset = find_window_start(stream, stat.st_size, get_timestamp_parser(days_to_analyze))
+                stream.seek(offset)
+            elif offset >= head_length:
+                skip_bytes(stream, offset - head_length)
+            else:
+                # Decompressed streams cannot seek back, reopen and skip forward
+                stream.close()
+                stream = open_compressed_file(file_path)
+                skip_bytes(stream, offset)
+
+            output.start_file(file_path, matcher.types_for(file_path))
+            progress = {'offset': offset}
+            decode = None
+            if profile is not None:
+                file_stats = profile.file(file_path)
+                decode = profile.timed_decode(file_stats)
+                if compressed:
+                    stream = TimedStream(stream, file_stats)
+                else:
+                    file_stats['bytes'] += stat.st_size - offset
+            scan_lines(iter_tracked_lines(stream, progress, stop_at_partial=not compressed, decode=decode), file_path,
+                       matcher, partial_counts, days_to_analyze, output, timeline, profile)
+            output.end_file()
+    except Exception as e:
+        logging.error(f"An unexpected error occurred while processing {file_path}: {e}")
+        return
+    finally:
+        stream.close()
+
+    file_counts = entry['counts']
+    add_file_counts(file_counts, partial_counts)
+    state.files[key] = {
+        'path': file_path,
+        'compressed': compressed,
+        'size': stat.st_size,
+        'mtime': stat.st_mtime,
+        'offset': progress['offset'],
+        'head_length': head_length,
+        'head_hash': head_hash(head, head_length),
+        'counts': file_counts,
+    }
+    merge_file_counts(error_hourly_counts, file_counts, file_path, cutoff_hour)
+
+class EventIndex:
+    """
+    SQLite index of the lines matched in a directory, built and queried with --index.
+
+    `events` holds one row per matched line and pattern: the line's file, its ordinal `seq`
+    among the matched lines of the file, its timestamp, hostname and text. `files` records
+    the size and mtime each file was scanned at and the start of the --days window the scan
+    covered, `file_types` the fingerprint of the patterns of each type it was scanned with.
+    A file is rescanned when it changed, when a report asks for an earlier window than it
+    covers or when the patterns of one of its types changed; every other report is answered
+    with GROUP BY queries instead of scanning.
+
+    Lines are identified by their ordinal rather than a byte offset, since compressed logs
+    and journals are not scanned by offset. All events of a file therefore come from one
+    scan, a rescan replaces them.
+    """
+
+    VERSION = 1
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        CREATE TABLE IF NOT EXISTS files (id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, size INTEGER, mtime REAL,
+                                          window_start TEXT);
+        CREATE TABLE IF NOT EXISTS file_types (file_id INTEGER, type TEXT, fingerprint TEXT, PRIMARY KEY (file_id, type));
+        CREATE TABLE IF NOT EXISTS hosts (id INTEGER PRIMARY KEY, name TEXT UNIQUE NOT NULL);
+        CREATE TABLE IF NOT EXISTS patterns (id INTEGER PRIMARY KEY, type TEXT NOT NULL, name TEXT NOT NULL, UNIQUE (type, name));
+        CREATE TABLE IF NOT EXISTS events (file_id INTEGER, seq INTEGER, timestamp TEXT, host_id INTEGER, pattern_id INTEGER,
+                                           line TEXT);
+        CREATE INDEX IF NOT EXISTS events_file ON events (file_id, seq);
+        CREATE INDEX IF NOT EXISTS events_time ON events (timestamp);
+        CREATE INDEX IF NOT EXISTS events_host_time ON events (host_id, timestamp);
+        CREATE INDEX IF NOT EXISTS events_pattern_time ON events (pattern_id, timestamp);
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self.connection = sqlite3.connect(path)
+            tables = {row[0] for row in self.connection.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            version = None
+            if 'meta' in tables:
+                row = self.connection.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+                version = row and int(row[0])
+            if tables and version != self.VERSION:
+                logging.info(f"Event index {path} was written by another version, rebuilding it.")
+                with self.connection:
+                    for table in tables:
+                        self.connection.execute(f'DROP TABLE "{table}"')
+            self.connection.executescript(self.SCHEMA)
+            with self.connection:
+                self.connection.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)", (str(self.VERSION),))
+        except sqlite3.DatabaseError as e:
+            logging.error(f"Cannot open event index {path}: {e}")
+            sys.exit(1)
+        self.host_ids = dict(self.connection.execute("SELECT name, id FROM hosts"))
+        self.pattern_ids = {(pattern_type, name): pattern_id
+                            for pattern_id, pattern_type, name in self.connection.execute("SELECT id, type, name FROM patterns")}
+
+    @staticmethod
+    def pattern_fingerprint(matcher):
+        return hashlib.sha1('\n'.join(matcher.pattern_names()).encode('utf-8')).hexdigest()
+
+    def stale_files(self, file_paths, type_fingerprints, types_of, window_start):
+        """
+        :param type_fingerprints: A dict of pattern type to its pattern_fingerprint.
+        :param types_of: A function returning the pattern types applied to a file path.
+        :param window_start: The start of the --days window, as "%Y-%m-%d %H:%M:%S".
+        :return: A list of (file path, size, mtime) for the files that need a scan.
+        """
+        files = {path: (file_id, size, mtime, indexed_start)
+                 for file_id, path, size, mtime, indexed_start in self.connection.execute("SELECT * FROM files")}
+        fingerprints = {(file_id, pattern_type): fingerprint
+                        for file_id, pattern_type, fingerprint in self.connection.execute("SELECT * FROM file_types")}
+        stale = []
+        for file_path in file_paths:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            indexed = files.get(file_path)
+            if indexed is None or indexed[1:3] != (stat.st_size, stat.st_mtime) or indexed[3] > window_start or any(
+                    fingerprints.get((indexed[0], pattern_type)) != type_fingerprints[pattern_type]
+                    for pattern_type in types_of(file_path)):
+                stale.append((file_path, stat.st_size, stat.st_mtime))
+        return stale
+
+    def intern(self, cache, table, key):
+        item_id = cache.get(key)
+        if item_id is None:
+            columns = 'type, name' if table == 'patterns' else 'name'
+            values = key if table == 'patterns' else (key,)
+            item_id = cache[key] = self.connection.execute(
+                f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' * len(values))})", values).lastrowid
+        return item_id
+
+    def replace_file(self, file_path, size, mtime, window_start, type_fingerprints, events_lines, pattern_types):
+        """
+        Replaces the events of a file with those of a new scan.
+
+        :param type_fingerprints: A dict of each pattern type applied to the file to its fingerprint.
+        :param events_lines: The lines of NDJSON events ScanOutput wrote while scanning the file.
+        :param pattern_types: The types of this run in -t order, events without a type field
+                              belong to the first.
+        :return: The number of events stored.
+        """
+        type_order = {pattern_type: position for position, pattern_type in enumerate(pattern_types)}
+        with self.connection:
+            row = self.connection.execute("SELECT id FROM files WHERE path = ?", (file_path,)).fetchone()
+            if row is None:
+                file_id = self.connection.execute("INSERT INTO files (path) VALUES (?)", (file_path,)).lastrowid
+            else:
+                file_id = row[0]
+                self.connection.execute("DELETE FROM events WHERE file_id = ?", (file_id,))
+                self.connection.execute("DELETE FROM file_types WHERE file_id = ?", (file_id,))
+            self.connection.execute("UPDATE files SET size = ?, mtime = ?, window_start = ? WHERE id = ?",
+                                    (size, mtime, window_start, file_id))
+            self.connection.executemany("INSERT INTO file_types VALUES (?, ?, ?)",
+                                        [(file_id, pattern_type, fingerprint) for pattern_type, fingerprint in type_fingerprints.items()])
+
+            rows = []
+            seq = -1
+            previous = None
+            for event_line in events_lines:
+                event = json.loads(event_line)
+                pattern_type = event.get('type', pattern_types[0])
+                # A line matched by several types is written once per type, in -t order
+                line_key = (event['timestamp'], event['host'], event['line'])
+                if previous is None or previous[0] != line_key or type_order[pattern_type] <= previous[1]:
+                    seq += 1
+                previous = (line_key, type_order[pattern_type])
+                rows.append((file_id, seq, event['timestamp'], self.intern(self.host_ids, 'hosts', event['host']),
+                             self.intern(self.pattern_ids, 'patterns', (pattern_type, event['pattern'])), event['line']))
+            self.connection.executemany("INSERT INTO events VALUES (?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def remove_missing(self, directory_path):
+        """
+        Drops the files under `directory_path` that no longer exist, such as deleted rotations.
+        Files of other -t types stay indexed.
+        """
+        prefix = os.path.join(directory_path, '')
+        missing = [(file_id,) for file_id, path in self.connection.execute("SELECT id, path FROM files").fetchall()
+                   if path.startswith(prefix) and not os.path.exists(path)]
+        with self.connection:
+            for statement in ("DELETE FROM events WHERE file_id = ?", "DELETE FROM file_types WHERE file_id = ?",
+                              "DELETE FROM files WHERE id = ?"):
+                self.connection.executemany(statement, missing)
+        return len(missing)
+
+    def load(self, file_paths, patterns_by_type, window_start, error_hourly_counts, timeline=None, hostnames=None,
+             pattern_filters=None):
+        """
+        Fills `error_hourly_counts` and `timeline` from the index as a scan of `file_paths`
+        would, in the same order, so the statistics come out the same.
+
+        :param patterns_by_type: A dict of each -t type to its pattern names, in -t order.
+                                 With several types, patterns are counted under typed_pattern_name.
+        :param window_start: Only lines from this "%Y-%m-%d %H:%M:%S" on are loaded.
+        :param hostnames: Only load these hostnames, if given.
+        :param pattern_filters: Only load the patterns containing one of these texts, if given.
+        :return: The number of matched lines loaded.
+        """
+        typed = len(patterns_by_type) > 1
+        selected_patterns = {}
+        for type_position, (pattern_type, names) in enumerate(patterns_by_type.items()):
+            for name in names:
+                pattern_id = self.pattern_ids.get((pattern_type, name))
+                if pattern_id is None:
+                    continue
+                if pattern_filters and not any(text.lower() in name.lower() for text in pattern_filters):
+                    continue
+                selected_patterns[pattern_id] = (typed_pattern_name(pattern_type, name) if typed else name, type_position)
+        host_names = {host_id: name for name, host_id in self.host_ids.items()}
+        if hostnames:
+            wanted = {hostname.lower() for hostname in hostnames}
+            host_names = {host_id: name for host_id, name in host_names.items() if name in wanted}
+        if not selected_patterns or not host_names:
+            return 0
+
+        # The position of each file in scan order, the files not in the index are skipped
+        self.connection.execute("CREATE TEMP TABLE IF NOT EXISTS file_order (file_id INTEGER PRIMARY KEY, position INTEGER)")
+        self.connection.execute("DELETE FROM temp.file_order")
+        file_ids = dict(self.connection.execute("SELECT path, id FROM files"))
+        positions = [(file_ids[file_path], position) for position, file_path in enumerate(file_paths) if file_path in file_ids]
+        self.connection.executemany("INSERT OR IGNORE INTO temp.file_order VALUES (?, ?)", positions)
+        file_names = {file_ids[file_path]: file_path for file_path in file_paths if file_path in file_ids}
+
+        conditions = (f"e.timestamp >= ? AND e.pattern_id IN ({', '.join('?' * len(selected_patterns))})"
+                      f" AND e.host_id IN ({', '.join('?' * len(host_names))})")
+        parameters = [window_start, *selected_patterns, *host_names]
+        cells = self.connection.execute(
+            f"SELECT o.position, MIN(e.seq), e.host_id, e.pattern_id, SUBSTR(e.timestamp, 1, ?), e.file_id, COUNT(*)"
+            f" FROM events e JOIN temp.file_order o ON o.file_id = e.file_id WHERE {conditions}"
+            f" GROUP BY e.file_id, e.host_id, e.pattern_id, SUBSTR(e.timestamp, 1, ?)",
+            [error_hourly_counts.bucket_length, *parameters, error_hourly_counts.bucket_length]).fetchall()
+        # Cells in the order a scan first sees them, by file, line and then -t type
+        cells.sort(key=lambda cell: (cell[0], cell[1], selected_patterns[cell[3]][1]))
+        for _, _, host_id, pattern_id, date_hour, file_id, count in cells:
+            error_hourly_counts.add(host_names[host_id], selected_patterns[pattern_id][0], date_hour, file_names[file_id], count)
+
+        if timeline is None:
+            return sum(cell[-1] for cell in cells)
+        lines = 0
+        rows = self.connection.execute(
+            f"SELECT e.host_id, e.timestamp, e.line FROM events e JOIN temp.file_order o ON o.file_id = e.file_id"
+            f" WHERE {conditions} GROUP BY e.file_id, e.seq ORDER BY o.position, e.seq", parameters)
+        for host_id, timestamp, line in rows:
+            # The timeline keeps the line after its timestamp and hostname, as scan_lines adds it
+            timeline.add(host_names[host_id], timestamp, line[LOG_LINE_REGEX.match(line).end():].strip())
+            lines += 1
+        return lines
+
+    def close(self):
+        self.connection.close()
+
+def refresh_event_index(index, directory_path, file_paths, matcher, pattern_types, days_to_analyze, jobs, scan=True):
+    """
+    Scans the target files the index does not cover for the current patterns and --days,
+    in `jobs` worker processes, and stores their matched lines.
+
+    :param scan: With False, as for --query, only warns about the files that need a scan.
+    :return: The number of files scanned.
+    """
+    window_start = get_timestamp_parser(days_to_analyze).cutoff.strftime('%Y-%m-%d %H:%M:%S')
+    if isinstance(matcher, PatternSets):
+        type_fingerprints = {pattern_type: index.pattern_fingerprint(type_matcher) for pattern_type, type_matcher in matcher.matchers.items()}
+        types_of = matcher.types_for
+    else:
+        type_fingerprints = {pattern_types[0]: index.pattern_fingerprint(matcher)}
+        types_of = lambda file_path: pattern_types
+
+    if not scan:
+        stale = index.stale_files(file_paths, type_fingerprints, types_of, window_start)
+        if stale:
+            logging.warning(f"{len(stale)} files are not indexed for the current patterns and --days, rerun without --query to scan them.")
+        return 0
+    removed = index.remove_missing(directory_path)
+    if removed:
+        logging.info(f"Removed {removed} files no longer present from the event index.")
+    stale = index.stale_files(file_paths, type_fingerprints, types_of, window_start)
+
+    def store(file_path, size, mtime, events_path):
+        fingerprints = {pattern_type: type_fingerprints[pattern_type] for pattern_type in types_of(file_path)}
+        with open(events_path, 'r', encoding='utf-8', newline='') as events_file:
+            index.replace_file(file_path, size, mtime, window_start, fingerprints, events_file, pattern_types)
+        os.remove(events_path)
+
+    # Only the events sink is needed, the report is answered from the index
+    sinks = (False, False, True, ())
+    spool_dir = tempfile.mkdtemp(prefix='linux_log_parser_')
+    try:
+        if jobs > 1 and len(stale) > 1:
+            initargs = (matcher, days_to_analyze, sinks, False, HOUR_BUCKET_LENGTH, spool_dir, None)
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_scan_worker, initargs=initargs) as executor:
+                results = iter_pool_results(executor, scan_file_worker, [file_path for file_path, _, _ in stale], jobs * 2)
+                for (file_path, size, mtime), (output_values, *_) in zip(stale, results):
+                    store(file_path, size, mtime, output_values[2])
+        else:
+            for file_path, size, mtime in stale:
+                output = ScanOutput.buffered(sinks, spool_dir)
+                parse_log(file_path, matcher, new_error_hourly_counts(), days_to_analyze, output)
+                store(file_path, size, mtime, output.values()[2])
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    return len(stale)
+
+def find_target_files(directory_path, target_keywords):
+    """
+    Walks `directory_path` and returns the target files to scan, in os.walk order.
+    """
+    walked_paths = []
+    for root, _, files in os.walk(directory_path):
+        # logging.debug(f"Checking directory: {root}")
+        walked_paths.extend(os.path.join(root, file_name) for file_name in files)
+
+    return [file_path for file_path in select_target_files(walked_paths, target_keywords) if os.path.isfile(file_path)]
+
+def select_target_files(file_paths, target_keywords, existing_files=None):
+    """
+    Filters `file_paths` with is_target_file and the compressed/uncompressed dedup of
+    should_process_file, keeping their order.
+    """
+    processed_files = set()
+    return [
+        file_path for file_path in file_paths
+        if is_target_file(os.path.basename(file_path), target_keywords)
+        and should_process_file(file_path, processed_files, existing_files)
+    ]
+
+def is_log_archive(path):
+    return os.path.isfile(path) and tarfile.is_tarfile(path)
+
+def scan_archive_member(stream, file_path, mtime, matcher, days_to_analyze, output_sinks, profiling, spool_dir,
+                        timeline_budget=None, bucket_length=HOUR_BUCKET_LENGTH):
+    """
+    Scans one member of a tar archive like parse_log scans a file.
+
+    Members are read sequentially from the archive stream, so plain members are decoded line
+    by line without the mmap prefilter or the --days seek, the timestamp check still drops
+    lines older than --days. Journal members are copied to a temporary file and mapped.
+
+    :param stream: The member's file object from TarFile.extractfile.
+    :param file_path: The member's path as it would be after extracting the archive.
+    :param spool_dir: Directory for the output, timeline and journal files of the member.
+    :return: A tuple in the same form as scan_file_worker returns.
+    """
+    error_hourly_counts = new_error_hourly_counts(bucket_length)
+    timeline = TimelineCollector(timeline_budget, temp_root=spool_dir)
+    output = ScanOutput.buffered(output_sinks, spool_dir)
+    profile = ScanProfile(matcher) if profiling else None
+
+    if not is_scannable_log(file_path, days_to_analyze, check_text=False, mtime=mtime):
+        return scan_result(output, error_hourly_counts, timeline, profile)
+    if file_path.endswith(JOURNAL_EXTENSIONS):
+        # Entries are found by offset, so the member is copied out of the archive stream
+        with tempfile.TemporaryFile(dir=spool_dir) as journal_file:
+            shutil.copyfileobj(stream, journal_file, MAPPED_CHUNK_SIZE)
+            journal_file.flush()
+            try:
+                with mmap.mmap(journal_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                    scan_journal(buffer, file_path, matcher, error_hourly_counts, days_to_analyze, output, timeline, profile)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Skipping unreadable journal file {file_path}: {e}")
+        return scan_result(output, error_hourly_counts, timeline, profile)
+    compressed = file_path.endswith(COMPRESSED_EXTENSIONS)
+    if not compressed and (file_path.endswith(ARCHIVE_EXTENSIONS) or not is_text_block(stream.peek(512)[:512])):
+        logging.warning(f"Skipping non-text or unreadable file: {file_path}")
+        return scan_result(output, error_hourly_counts, timeline, profile)
+
+    output.start_file(file_path, matcher.types_for(file_path))
+    try:
+        if compressed:
+            stream = open_compressed_file(file_path, stream)
+        if profile is None:
+            # The archive and the member are decompressed in a background thread while the chunks are matched
+            reader = ChunkReader(stream)
+            try:
+                scan_lines((line for chunk in reader for line in iter_chunk_candidates(chunk, matcher)), file_path,
+                           matcher, error_hourly_counts, days_to_analyze, output, timeline)
+            finally:
+                reader.close()
+        else:
+            file_stats = profile.file(file_path)
+            stream = TimedStream(stream, file_stats)
+            decode = profile.timed_decode(file_stats)
+            scan_lines(iter_decoded_lines(stream, decode), file_path, matcher, error_hourly_counts, days_to_analyze,
+                       output, timeline, profile)
+    except Exception as e:
+        logging.error(f"Failed to decompress {file_path}: {e}")
+    output.end_file()
+    return scan_result(output, error_hourly_counts, timeline, profile)
+
+def parse_archive(archive_path, target_keywords, matcher, error_hourly_counts, days_to_analyze, output=None,
+                  timeline=None, profile=None):
+    """
+    Scans the target files inside a tar archive, such as a sosreport or crm_report, without
+    extracting it.
+
+    The archive is read in one sequential pass and each target member, including nested
+    compressed logs, is scanned as it is read. Members are named as they would be after
+    extracting the archive next to itself. Whether a plain file has a compressed counterpart,
+    and the order find_target_files would pick the files of the extracted tree in, is only
+    known once all members were seen. The output and the timeline of each member are
+    therefore spooled to temporary files, and merged at the end of the archive for the files
+    find_target_files would pick, in the same order, so the report is the same.
+    """
+    if output is None:
+        output = ScanOutput(stdout=sys.stdout)
+    archive_dir = os.path.dirname(archive_path)
+    member_names = []
+    member_paths = set()
+    results = {}
+    timeline_budget = timeline.memory_budget if timeline is not None else None
+    spool_dir = tempfile.mkdtemp(prefix='linux_log_parser_')
+
+    try:
+        with tarfile.open(archive_path, 'r|*') as archive:
+            for member in archive:
+                member_names.append(member.name + '/' if member.isdir() else member.name)
+                if not member.isfile():
+                    continue
+                file_path = os.path.join(archive_dir, member.name)
+                member_paths.add(file_path)
+                if not is_target_file(os.path.basename(file_path), target_keywords):
+                    continue
+                stream = archive.extractfile(member)
+                results[file_path] = scan_archive_member(stream, file_path, member.mtime, matcher, days_to_analyze,
+                                                         output.sinks(), profile is not None, spool_dir, timeline_budget,
+                                                         error_hourly_counts.bucket_length)
+
+        walked_paths = [os.path.join(archive_dir, name) for name in walk_order(member_names)]
+        walked_paths = [file_path for file_path in walked_paths if file_path in member_paths]
+        for file_path in select_target_files(walked_paths, target_keywords, member_paths):
+            merge_scan_result(results[file_path], error_hourly_counts, output, timeline, profile)
+    finally:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+
+def walk_order(member_names):
+    """
+    Orders archive member names the way os.walk lists the extracted tree: the files of a
+    directory first, then each subdirectory in turn. Entries of one directory keep their
+    archive order, which tar takes from the directory listing.
+
+    :param member_names: Member names in archive order, directories ending with '/'.
+    """
+    tree = {'files': [], 'dirs': {}}
+    for name in member_names:
+        parts = [part for part in name.split('/') if part not in ('', '.')]
+        if not parts:
+            continue
+        node = tree
+        for part in parts[:-1]:
+            node = node['dirs'].setdefault(part, {'files': [], 'dirs': {}})
+        if name.endswith('/'):
+            node['dirs'].setdefault(parts[-1], {'files': [], 'dirs': {}})
+        else:
+            node['files'].append(name)
+
+    ordered = []
+    pending = [tree]
+    while pending:
+        node = pending.pop()
+        ordered.extend(node['files'])
+        pending.extend(reversed(list(node['dirs'].values())))
+    return ordered
+
+def follow_logs(directory_path, target_keywords, matcher, days_to_analyze, state, report_interval, output=None, timeline=None,
+                profile=None, bucket_length=HOUR_BUCKET_LENGTH):
+    """
+    Follows the target files like `tail -F` until interrupted with Ctrl+C.
+
+    Every FOLLOW_POLL_SECONDS the directory is walked again and each target file is passed to
+    parse_log_incremental, which only reads bytes appended since the previous poll and
+    follows logrotate renames and compressed rotations. The hourly counts are rebuilt from
+    the per-file counts in `state` after hours older than --days are evicted, so memory
+    stays bounded on long runs.
+
+    :return: The error_hourly_counts of the last completed poll.
+    """
+    if output is None:
+        output = ScanOutput(stdout=sys.stdout)
+    error_hourly_counts = new_error_hourly_counts(bucket_length)
+    last_report = time.monotonic()
+    try:
+        while True:
+            timestamp_parser = reset_timestamp_parser(days_to_analyze)
+            poll_counts = new_error_hourly_counts(bucket_length)
+            for file_path in find_target_files(directory_path, target_keywords):
+                parse_log_incremental(file_path, matcher, poll_counts, days_to_analyze, state, output, timeline, profile)
+            state.end_pass(timestamp_parser.cutoff_hour)
+            error_hourly_counts = poll_counts
+
+            if time.monotonic() - last_report >= report_interval:
+                print_error_statistics(None, error_hourly_counts, output.stdout_only())
+                state.save()
+                last_report = time.monotonic()
+
+            # Matched lines are buffered, show each poll's output before sleeping
+            output.flush()
+            time.sleep(FOLLOW_POLL_SECONDS)
+    except KeyboardInterrupt:
+        logging.info("Stopped following log files.")
+    state.save()
+    return error_hourly_counts
+
+def main():
+    parser = argparse.ArgumentParser(description="Linux Log file analyzer")
+    parser.add_argument('-d', '--directory', help="Directory containing log files, or a sosreport/crm_report tar archive", required=True)
+    parser.add_argument('-t', '--type', nargs='+', help="Types of log patterns to use, several types are scanned in one pass with a report per type", required=True)
+    parser.add_argument('--days', type=int, default=60, help="Number of days to look back for log analysis (default is 60)")
+    parser.add_argument('-j', '--jobs', type=int, default=1, help="Number of worker processes used to scan files (default is 1)")
+    parser.add_argument('--read-ahead', type=int, default=4, help="Number of compressed files decompressed ahead in background threads while a single process scans (default is 4)")
+    parser.add_argument('--state', help="State file recording scan progress, reruns only scan data appended since the last run")
+    parser.add_argument('-f', '--follow', action='store_true', help="Keep following the target files and print statistics periodically, stop with Ctrl+C")
+    parser.add_argument('--report-interval', type=int, default=60, help="Seconds between statistics reports in --follow mode (default is 60)")
+    parser.add_argument('--timeline-memory', type=int, default=256, help="MB of matched lines kept in memory for the per-host timelines before spilling to temporary files (default is 256)")
+    parser.add_argument('-q', '--quiet', action='store_true', help="Do not print headers, matched lines or statistics, only write the report file")
+    parser.add_argument('--no-report', action='store_true', help="Do not write the <type>_{timestamp}.txt report file, only print to stdout")
+    parser.add_argument('--events', help="Write every matched line as an NDJSON object (timestamp, host, pattern, file, line) to this file, '-' for stdout")
+    parser.add_argument('--incidents', action='store_true', help="Correlate fencing, membership and failover lines of all hosts into incidents and append them to the report")
+    parser.add_argument('--incident-gap', type=int, default=300, help="Seconds without a related line that end an incident (default is 300)")
+    parser.add_argument('--granularity', choices=['hour', 'minute'], default='hour', help="Bucket the occurrence counts by hour or by minute (default is hour)")
+    parser.add_argument('--spikes', action='store_true', help="Append an activity analysis (z-score spikes, busiest buckets, hosts and patterns active together) to the report, needs numpy")
+    parser.add_argument('--spike-window', type=int, default=24, help="Number of previous buckets the spike baseline is computed from (default is 24)")
+    parser.add_argument('--spike-z', type=float, default=3.0, help="z-score a bucket needs to be reported as a spike (default is 3.0)")
+    parser.add_argument('--top', type=int, default=10, help="Number of spikes, buckets, host pairs and patterns listed in the activity analysis (default is 10)")
+    parser.add_argument('--counts-csv', help="Write the counts as bucket,hostname,pattern,count rows to this CSV file, needs numpy")
+    parser.add_argument('--index', help="SQLite event index of the directory, files not indexed for the current patterns and --days are scanned into it and the report is answered from it")
+    parser.add_argument('--query', action='store_true', help="With --index, answer from the index without scanning changed files")
+    parser.add_argument('--host', action='append', help="With --index, only report this hostname, can be given several times")
+    parser.add_argument('--pattern', action='append', help="With --index, only report the patterns containing this text, can be given several times")
+    parser.add_argument('--profile', action='store_true', help="Time each pattern and file, append a profile table to the report and save it to <type>_{timestamp}_profile.json")
+    args = parser.parse_args()
+
+    if args.jobs < 1:
+        parser.error("--jobs must be at least 1")
+    if args.read_ahead < 0:
+        parser.error("--read-ahead must not be negative")
+    if args.events == '-' and not args.quiet:
+        parser.error("--events - needs --quiet so the events are not mixed with the report on stdout")
+    if (args.spikes or args.counts_csv) and np is None:
+        parser.error("--spikes and --counts-csv need the numpy module")
+    if args.spike_window < 1:
+        parser.error("--spike-window must be at least 1")
+    if (args.query or args.host or args.pattern) and not args.index:
+        parser.error("--query, --host and --pattern need --index")
+    if args.index and (args.follow or args.state or args.events or args.profile):
+        parser.error("--follow, --state, --events and --profile cannot be used with --index")
+    bucket_length = MINUTE_BUCKET_LENGTH if args.granularity == 'minute' else HOUR_BUCKET_LENGTH
+
+    # Use args.days to set the number of days to analyze
+    DAYS_TO_ANALYZE = args.days
+
+    logging.basicConfig(level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    # "-t pacemaker kernelhung" and "-t pacemaker,kernelhung" both scan the two types
+    pattern_types = list(dict.fromkeys(pattern_type for value in args.type for pattern_type in value.split(',') if pattern_type))
+    if len(pattern_types) == 1:
+        matcher = PatternMatcher(compile_patterns(pattern_types[0]))
+        target_keywords = read_target_keywords(pattern_types[0])
+    else:
+        matcher = PatternSets({pattern_type: PatternMatcher(compile_patterns(pattern_type)) for pattern_type in pattern_types},
+                              {pattern_type: read_target_keywords(pattern_type) for pattern_type in pattern_types})
+        target_keywords = matcher.union_keywords()
+    report_type = '+'.join(pattern_types)
+
+    directory_path = args.directory
+    # logging.debug(f"Analyzing directory: {directory_path}")
+
+    is_archive = bool(directory_path) and is_log_archive(directory_path)
+    if not directory_path or not (os.path.isdir(directory_path) or is_archive):
+        # logging.error("The directory path is invalid or does not exist.")
+        sys.exit(1)
+    if is_archive and (args.follow or args.state or args.index):
+        parser.error("--follow, --state and --index need a directory, not an archive")
+
+    timestamp = datetime.now().strftime('%m-%d-%H%M%S')
+    output_file_name = None if args.no_report else f'{report_type}_{timestamp}.txt'
+    # With several types the report above holds the combined statistics, each type also gets its own report
+    type_report_names = {} if args.no_report or len(pattern_types) == 1 else {
+        pattern_type: f'{pattern_type}_{timestamp}.txt' for pattern_type in pattern_types
+    }
+    output = open_scan_output(output_file_name, not args.quiet, args.events, type_report_names)
+    timeline = TimelineCollector(memory_budget=args.timeline_memory * 1024 * 1024)
+    profile = ScanProfile(matcher) if args.profile else None
+
+    try:
+        error_hourly_counts = new_error_hourly_counts(bucket_length)
+
+        file_paths = find_target_files(directory_path, target_keywords) if not is_archive else []
+
+        if is_archive:
+            if args.jobs > 1:
+                logging.info("Archives are read in a single sequential pass, ignoring --jobs.")
+            parse_archive(directory_path, target_keywords, matcher, error_hourly_counts, DAYS_TO_ANALYZE, output, timeline, profile)
+        elif args.index:
+            index = EventIndex(args.index)
+            try:
+                scanned = refresh_event_index(index, directory_path, file_paths, matcher, pattern_types, DAYS_TO_ANALYZE,
+                                              args.jobs, scan=not args.query)
+                if not args.query:
+                    logging.info(f"Scanned {scanned} of {len(file_paths)} files into the event index {args.index}.")
+                patterns_by_type = matcher.matchers if isinstance(matcher, PatternSets) else {pattern_types[0]: matcher}
+                index.load(file_paths, {pattern_type: type_matcher.pattern_names() for pattern_type, type_matcher in patterns_by_type.items()},
+                           get_timestamp_parser(DAYS_TO_ANALYZE).cutoff.strftime('%Y-%m-%d %H:%M:%S'), error_hourly_counts,
+                           timeline, args.host, args.pattern)
+            finally:
+                index.close()
+        elif args.follow:
+            if args.jobs > 1:
+                logging.info("--follow runs in a single process, ignoring --jobs.")
+            fingerprint = scan_state_fingerprint(matcher, DAYS_TO_ANALYZE, bucket_length)
+            state = ScanState.load(args.state, fingerprint) if args.state else ScanState(None, fingerprint)
+            error_hourly_counts = follow_logs(directory_path, target_keywords, matcher, DAYS_TO_ANALYZE, state,
+                                              args.report_interval, output, timeline, profile, bucket_length)
+        elif args.state:
+            if args.jobs > 1:
+                logging.info("Incremental scans with --state run in a single process, ignoring --jobs.")
+            state = ScanState.load(args.state, scan_state_fingerprint(matcher, DAYS_TO_ANALYZE, bucket_length))
+            for file_path in file_paths:
+                parse_log_incremental(file_path, matcher, error_hourly_counts, DAYS_TO_ANALYZE, state, output, timeline, profile)
+            state.end_pass(get_timestamp_parser(DAYS_TO_ANALYZE).cutoff_hour)
+            state.save()
+        elif args.jobs > 1 and len(file_paths) > 1:
+            parse_logs_parallel(file_paths, matcher, error_hourly_counts, DAYS_TO_ANALYZE, args.jobs, output, timeline, profile)
+        else:
+            read_ahead = ReadAhead(file_paths, DAYS_TO_ANALYZE, args.read_ahead) if profile is None else None
+            try:
+                for file_path in file_paths:
+                    parse_log(file_path, matcher, error_hourly_counts, DAYS_TO_ANALYZE, output, timeline, profile, read_ahead)
+            finally:
+                if read_ahead is not None:
+                    read_ahead.close()
+
+        print_error_statistics(None, error_hourly_counts, output)
+        if output.type_reports:
+            for pattern_type, type_counts in matcher.split_counts(error_hourly_counts).items():
+                print_error_statistics(None, type_counts, output.type_output(pattern_type))
+
+        if args.incidents:
+            print_incidents(timeline, args.incident_gap, output)
+
+        if args.spikes or args.counts_csv:
+            matrix = CountMatrix(error_hourly_counts)
+            if args.spikes:
+                print_activity_analysis(matrix, output, args.spike_window, args.spike_z, args.top)
+            if args.counts_csv:
+                matrix.write_csv(args.counts_csv)
+                logging.info(f"Counts saved to file: {args.counts_csv}")
+
+        if profile is not None:
+            profile.print_summary(output)
+            profile_file_name = f'{report_type}_{timestamp}_profile.json'
+            profile.save(profile_file_name)
+            logging.info(f"Profile saved to file: {profile_file_name}")
 
+        for hostname_output_file_name in timeline.write_files(timestamp):
             logging.info(f"Output saved to file: {hostname_output_file_name}")
 
-        logging.info(f"Output saved to file: {output_file_name}")
+        if output_file_name:
+            logging.info(f"Output saved to file: {output_file_name}")
+        for type_report_name in type_report_names.values():
+            logging.info(f"Output saved to file: {type_report_name}")
+        if args.events and args.events != '-':
+            logging.info(f"Events saved to file: {args.events}")
     finally:
-        output_file.close()
+        output.close()
+        timeline.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,251 @@
+import gzip
+import io
+import os
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from conftest import REPO_DIR
+import cib_parser
+from cib_parser import (CibIndex, OperationLatency, analyze_cib, find_cib_files, format_fleet_summary, load_rules,
+                        operation_failed, parse_cib_tree, parse_cib_xml, run_batch)
+
+CIB_TEMPLATE = """<cib crm_feature_set="3.16.2" validate-with="pacemaker-3.9" epoch="12" num_updates="3" admin_epoch="0">
+  <configuration>
+    <crm_config>
+      <cluster_property_set id="cib-bootstrap-options">
+        <nvpair id="cib-bootstrap-options-stonith-enabled" name="stonith-enabled" value="true"/>{cluster_name}
+      </cluster_property_set>
+    </crm_config>
+    <nodes>
+      <node id="1" uname="{node}1"/>
+      <node id="2" uname="{node}2"/>
+    </nodes>
+    <resources>
+      <primitive id="rsc_st_azure" class="stonith" type="fence_azure_arm">
+        <operations>
+          <op id="rsc_st_azure-monitor" name="monitor" interval="3600" timeout="120"/>
+        </operations>
+      </primitive>
+      <group id="g_ip_HDB00">
+        <primitive id="rsc_ip_HDB00" class="ocf" provider="heartbeat" type="IPaddr2">
+          <operations>
+            <op id="rsc_ip_HDB00-monitor" name="monitor" interval="10s" timeout="20s"/>
+          </operations>
+        </primitive>
+        <primitive id="rsc_nc_HDB00" class="ocf" provider="heartbeat" type="azure-lb"/>
+      </group>
+      <clone id="cln_SAPHanaTopology_HDB00">
+        <primitive id="rsc_SAPHanaTopology_HDB00" class="ocf" provider="suse" type="SAPHanaTopology"/>
+      </clone>
+      <master id="msl_SAPHana_HDB00">
+        <primitive id="rsc_SAPHana_HDB00" class="ocf" provider="suse" type="SAPHana">
+          <operations>
+            <op id="rsc_SAPHana_HDB00-start" name="start" interval="0" timeout="3600"/>
+            <op id="rsc_SAPHana_HDB00-monitor" name="monitor" interval="60" timeout="700"/>
+          </operations>
+        </primitive>
+      </master>
+    </resources>
+    <constraints>
+      <rsc_colocation id="col_saphana_ip" score="4000" rsc="g_ip_HDB00" with-rsc="msl_SAPHana_HDB00" with-rsc-role="Promoted"/>
+      <rsc_order id="ord_SAPHana" kind="Optional" first="cln_SAPHanaTopology_HDB00" then="msl_SAPHana_HDB00"/>
+      <rsc_location id="cli-prefer-msl_SAPHana_HDB00" rsc="msl_SAPHana_HDB00" role="Started" node="{node}1" score="INFINITY"/>
+    </constraints>
+    <op_defaults>
+      <meta_attributes id="op-options">
+        <nvpair id="op-options-timeout" name="timeout" value="600"/>
+      </meta_attributes>
+    </op_defaults>
+  </configuration>
+  <status>
+    <node_state id="1" uname="{node}1">
+      <lrm id="1"><lrm_resources>
+        <lrm_resource id="rsc_SAPHana_HDB00" type="SAPHana">
+          <lrm_rsc_op id="a" operation="start" interval="0" op-status="0" rc-code="0" exec-time="3000000" queue-time="5"/>
+          <lrm_rsc_op id="b" operation="monitor" interval="60000" op-status="0" rc-code="8" exec-time="900" queue-time="0"/>
+          <lrm_rsc_op id="c" operation="monitor" interval="60000" op-status="0" rc-code="7" exec-time="1100" queue-time="2"/>
+        </lrm_resource>
+        <lrm_resource id="rsc_SAPHanaTopology_HDB00:0" type="SAPHanaTopology">
+          <lrm_rsc_op id="d" operation="start" interval="0" op-status="2" rc-code="1" exec-time="600000" queue-time="0"/>
+        </lrm_resource>
+      </lrm_resources></lrm>
+    </node_state>
+  </status>
+</cib>
+"""
+
+def make_cib(node='node', cluster_name='hana1'):
+    nvpair = f'\n        <nvpair id="cib-bootstrap-options-cluster-name" name="cluster-name" value="{cluster_name}"/>'
+    return CIB_TEMPLATE.format(node=node, cluster_name=nvpair if cluster_name else '')
+
+@pytest.fixture
+def cib_path(tmp_path):
+    path = tmp_path / 'cib.xml'
+    path.write_text(make_cib())
+    return str(path)
+
+@pytest.fixture(scope='module')
+def rules():
+    return load_rules(REPO_DIR)
+
+def test_index_lists_resources_and_constraints_in_document_order(cib_path):
+    root, source_lines = parse_cib_tree(cib_path)
+    index = CibIndex(root)
+
+    # <status> is dropped while it streams past
+    assert root.find('status') is None
+    assert [primitive.get('id') for primitive in index.primitives_of_type('IPaddr2')] == ['rsc_ip_HDB00']
+    assert index.primitives_of_type('Filesystem') == []
+    assert [element.get('id') for element in index.constraints] == ['col_saphana_ip', 'ord_SAPHana', 'cli-prefer-msl_SAPHana_HDB00']
+    assert [element.get('id') for element in index.constraints_of_kind('rsc_location')] == ['cli-prefer-msl_SAPHana_HDB00']
+    assert [element.get('id') for element in index.resources_by_tag['master']] == ['msl_SAPHana_HDB00']
+    assert [node.get('uname') for node in index.nodes] == ['node1', 'node2']
+    assert index.bootstrap_options.get('id') == 'cib-bootstrap-options'
+    assert [element.get('id') for element in index.op_defaults] == ['op-options']
+
+    assert index.parent_of('rsc_ip_HDB00').get('id') == 'g_ip_HDB00'
+    assert index.parent_of('rsc_SAPHana_HDB00').tag == 'master'
+    assert index.parent_of('rsc_st_azure') is None
+    assert [element.get('id') for element in index.constraints_for('msl_SAPHana_HDB00')] == [
+        'col_saphana_ip', 'ord_SAPHana', 'cli-prefer-msl_SAPHana_HDB00']
+    assert [element.get('id') for element in index.constraints_for('g_ip_HDB00')] == ['col_saphana_ip']
+    assert index.constraints_for('rsc_ip_HDB00') == []
+
+def test_index_follows_resource_sets_and_nested_groups():
+    root = ET.fromstring("""<cib><configuration><resources>
+      <clone id="cln_nfs"><group id="g_nfs"><primitive id="rsc_fs" type="Filesystem"/><primitive id="rsc_exportfs" type="exportfs"/></group></clone>
+    </resources><constraints>
+      <rsc_order id="ord_set"><resource_set id="set1"><resource_ref id="rsc_fs"/><resource_ref id="rsc_exportfs"/><resource_ref id="rsc_fs"/></resource_set></rsc_order>
+      <rsc_colocation id="col_nfs" rsc="g_nfs" with-rsc="rsc_fs" score="INFINITY"/>
+    </constraints></configuration></cib>""")
+    index = CibIndex(root)
+    assert index.parent_of('rsc_fs').get('id') == 'g_nfs'
+    assert index.parent_of('g_nfs').get('id') == 'cln_nfs'
+    # Once per constraint, however often the constraint names the resource
+    assert [element.get('id') for element in index.constraints_for('rsc_fs')] == ['ord_set', 'col_nfs']
+    assert [element.get('id') for element in index.constraints_for('rsc_exportfs')] == ['ord_set']
+
+@pytest.mark.parametrize('read_size', [7, 64, 65536])
+def test_source_lines_are_the_lines_of_the_start_tags(cib_path, read_size, monkeypatch):
+    # Small reads split lines and start tags across blocks
+    monkeypatch.setattr(cib_parser, 'CIB_READ_SIZE', read_size)
+    with open(cib_path) as file:
+        file_lines = file.read().splitlines()
+    root, source_lines = parse_cib_tree(cib_path)
+    for element in root.iter():
+        output = io.StringIO()
+        source_lines.write(output, element)
+        line_number = source_lines.line_numbers[element]
+        assert output.getvalue() == f"Original line {line_number}: {file_lines[line_number - 1]}\n\n"
+        assert file_lines[line_number - 1].lstrip().startswith(f"<{element.tag}")
+
+def test_source_lines_of_a_one_line_cib_show_the_start_tag(tmp_path, monkeypatch):
+    monkeypatch.setattr(cib_parser, 'SOURCE_LINE_LIMIT', 200)
+    path = tmp_path / 'cib.xml'
+    path.write_text(make_cib().replace("\n", ""))
+    root, source_lines = parse_cib_tree(str(path))
+    output = io.StringIO()
+    source_lines.write(output, root.find(".//op[@id='rsc_SAPHana_HDB00-start']"))
+    assert output.getvalue() == 'Original line 1: <op id="rsc_SAPHana_HDB00-start" name="start" interval="0" timeout="3600"/>\n\n'
+
+def test_compressed_cib_gives_the_same_index(cib_path, tmp_path):
+    compressed_path = tmp_path / 'cib.xml.gz'
+    with open(cib_path, 'rb') as source, gzip.open(compressed_path, 'wb') as target:
+        target.write(source.read())
+    plain = CibIndex(parse_cib_tree(cib_path)[0])
+    compressed = CibIndex(parse_cib_tree(str(compressed_path))[0])
+    assert list(plain.primitives_by_id) == list(compressed.primitives_by_id)
+    assert list(plain.constraints_by_kind) == list(compressed.constraints_by_kind)
+
+@pytest.mark.parametrize('attributes, failed', [
+    ({'operation': 'start', 'op-status': '0', 'rc-code': '0'}, False),
+    ({'operation': 'start', 'op-status': '0', 'rc-code': '1'}, True),
+    ({'operation': 'start', 'op-status': '4', 'rc-code': '0'}, True),
+    ({'operation': 'monitor', 'op-status': '0', 'rc-code': '8'}, False),
+    ({'operation': 'monitor', 'op-status': '0', 'rc-code': '7'}, True),
+    ({'operation': 'monitor', 'op-status': '0', 'rc-code': '7', 'transition-key': '3:12:7:0b2f'}, False),
+    ({'operation': 'monitor', 'op-status': '0', 'rc-code': '8', 'transition-key': '3:12:0:0b2f'}, True),
+])
+def test_operation_failed(attributes, failed):
+    assert operation_failed(attributes) is failed
+
+def test_latency_collects_status_operations_with_their_timeouts(cib_path):
+    operation_latency = OperationLatency()
+    root, _ = parse_cib_tree(cib_path, operation_latency)
+    operation_latency.resolve_timeouts(CibIndex(root))
+
+    monitor = operation_latency.operations[('rsc_SAPHana_HDB00', 'monitor', 60000, 'node1')]
+    assert monitor['exec'] == [900, 1100]
+    assert monitor['queue'] == [0, 2]
+    assert monitor['failed'] == 1
+    topology = operation_latency.operations[('rsc_SAPHanaTopology_HDB00:0', 'start', 0, 'node1')]
+    assert topology['timed_out'] == 1
+    assert topology['failed'] == 0
+
+    # The <op> timeout, else op_defaults
+    assert operation_latency.timeouts[('rsc_SAPHana_HDB00', 'start', 0)] == 3600000
+    assert operation_latency.timeouts[('rsc_SAPHana_HDB00', 'monitor', 60000)] == 700000
+    assert operation_latency.timeouts[('rsc_SAPHanaTopology_HDB00:0', 'start', 0)] == 600000
+
+    deviations = set()
+    report = operation_latency.report(deviations)
+    assert "Warning: rsc_SAPHana_HDB00 operation 'start' took 3000000 ms on node1, 83% of its 3600000 ms timeout." in report
+    assert "Warning: rsc_SAPHanaTopology_HDB00:0 operation 'start' timed out 1 time(s) on node1" in report
+    assert deviations == {"SAPHana operation 'start' runs close to its timeout", "SAPHanaTopology operation 'start' timed out"}
+
+def test_report_lists_the_parent_and_constraints_of_each_resource(cib_path):
+    cib_parser.parsed_resources.clear()
+    output = io.StringIO()
+    index, no_resource_messages, resource_types_found, _, _ = parse_cib_xml(cib_path, ['IPaddr2', 'SAPHana', 'Filesystem'], output)
+    assert index is not None and resource_types_found == {'IPaddr2', 'SAPHana'}
+    assert no_resource_messages == ["No 'Filesystem' type resources found.\n"]
+    report = output.getvalue()
+    assert "Resource ID: rsc_ip_HDB00, Resource Type: IPaddr2\nParent: group g_ip_HDB00\nConstraints: col_saphana_ip\n" in report
+    assert ("Resource ID: rsc_SAPHana_HDB00, Resource Type: SAPHana\nParent: master msl_SAPHana_HDB00\n"
+            "Constraints: col_saphana_ip, ord_SAPHana, cli-prefer-msl_SAPHana_HDB00\n") in report
+
+def test_analysis_reports_latency_and_deviations(cib_path, rules):
+    result = analyze_cib(cib_path, *rules)
+    assert result['cluster_name'] == 'hana1'
+    assert result['nodes'] == ['node1', 'node2']
+    assert ("Resource ID: rsc_ip_HDB00, Resource Type: IPaddr2\nParent: group g_ip_HDB00\nConstraints: col_saphana_ip\n"
+            in result['report'])
+    assert "Operation Latency Analysis:" in result['analysis']
+    assert "SAPHana operation 'start' runs close to its timeout" in result['deviations']
+
+def test_batch_summary_counts_each_cluster_once(tmp_path, rules, capsys):
+    bundles = tmp_path / 'bundles'
+    # Two nodes of one named cluster, a cluster without a name and a CIB that does not parse
+    for directory, cib in [('hana1-node1', make_cib()), ('hana1-node2', make_cib()),
+                           ('nfs-node1', make_cib(node='nfs', cluster_name=None)), ('broken', "<cib><configuration>")]:
+        (bundles / directory).mkdir(parents=True)
+        (bundles / directory / 'cib.xml').write_text(cib)
+    output_dir = tmp_path / 'reports'
+    output_dir.mkdir()
+
+    file_paths, missing = find_cib_files([str(bundles), str(tmp_path / 'nothing-*.xml')])
+    assert [os.path.relpath(path, bundles) for path in file_paths] == [
+        os.path.join('broken', 'cib.xml'), os.path.join('hana1-node1', 'cib.xml'),
+        os.path.join('hana1-node2', 'cib.xml'), os.path.join('nfs-node1', 'cib.xml')]
+    assert missing == [str(tmp_path / 'nothing-*.xml')]
+
+    run_batch(file_paths, *rules, 1, str(output_dir))
+    capsys.readouterr()
+    reports = sorted(os.listdir(output_dir))
+    assert len([name for name in reports if name.startswith('cib-parser-')]) == 4
+    summary_names = [name for name in reports if name.startswith('cib-fleet-summary-')]
+    assert len(summary_names) == 1
+
+    summary = (output_dir / summary_names[0]).read_text()
+    assert "CIB files: 4, analyzed: 3, failed: 1\n" in summary
+    assert "Clusters: 2\n" in summary
+    assert "    2  SAPHana operation 'start' runs close to its timeout\n       hana1, nodes nfs1+nfs2\n" in summary
+    assert "Failed to parse:\n\n" + file_paths[0] + "\n" in summary
+
+def test_fleet_summary_without_deviations():
+    results = [{'file_path': 'cib.xml', 'analysis': "", 'cluster_name': None, 'nodes': ['a', 'b'],
+                'cluster_type': "Unknown cluster type", 'deviations': set()}]
+    summary = format_fleet_summary(results)
+    assert "Clusters: 1\n" in summary
+    assert "No deviations from the best practice values found.\n" in summary
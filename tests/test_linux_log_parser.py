@@ -0,0 +1,621 @@
+import glob
+import gzip
+import io
+import json
+import lzma
+import os
+import random
+import re
+import shutil
+import sqlite3
+import struct
+import subprocess
+import sys
+import tarfile
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import linux_log_parser
+from conftest import REPO_DIR
+from linux_log_parser import (CountMatrix, IncidentCorrelator, JournalReader, PatternMatcher, ReadAhead, ScanOutput,
+                              ScanProfile, ScanState, TimestampParser, compile_patterns, extract_required_literal,
+                              find_window_start, follow_logs, iter_candidate_lines, iter_journal_lines,
+                              new_error_hourly_counts, parse_log, read_target_keywords, scan_journal,
+                              scan_state_fingerprint)
+
+# Lines matching pacemaker_pattern.txt
+HIT_MESSAGES = [
+    "pacemaker-fenced[1847]: notice: cluster node node2 will be fenced: peer is no longer part of the cluster",
+    "pacemaker-controld[1850]: notice: Node node2 state is now lost",
+    "pacemaker-schedulerd[1849]: notice: Forcing rsc_SAPHana_HDB03 away from node1 after 1000000 failures",
+    "SAPHana(rsc_SAPHana_HDB_HDB00)[21210]: INFO: DEC: Finally get_role_by_landscape_status returns SFAIL",
+    "pacemaker-schedulerd[1849]: warning: Unexpected result (error) was recorded for monitor of rsc_nc_HDB",
+    "pacemaker-controld[1850]: error: Result of stop operation for rsc_SAPHana did not complete within 600s",
+]
+# Lines matching kernelhung_pattern.txt
+KERNELHUNG_MESSAGES = [
+    "kernel: watchdog: BUG: soft lockup - CPU#3 stuck for 22s! [ds_agent:4321]",
+    "iscsid[1120]: connection1:0: ping timeout of 5 secs expired, target did not respond",
+]
+NOISE_MESSAGES = [
+    "kernel: [12345.678901] eth0: link up, 1000 Mbps, full duplex",
+    "systemd[1]: Started Session 42 of user root.",
+    "pacemaker-controld[1850]: notice: State transition S_IDLE -> S_POLICY_ENGINE",
+    "corosync[1501]: [KNET  ] host: host: 2 (passive) best link: 0 (pri: 1)",
+    "crmd[1850]:   notice: Result of monitor operation for rsc_ip_HDB_HDB00 on node1: ok",
+]
+# Not valid UTF-8
+LATIN1_MESSAGE = "useradd[3100]: new user: name=Ren\xe9e, UID=1001, GID=1001, home=/home/ren\xe9e"
+
+# Lines that hit several patterns, differ only in case, or fold to ASCII under re.IGNORECASE
+TRICKY_MESSAGES = [
+    "pacemaker-fenced[1847]: notice: Fence (reboot) node2 'peer is no longer part of the cluster'",
+    "SAPHana(rsc_SAPHana_HDB_HDB00)[21210]: INFO: DEC: SFAIL, resource COULD NOT BE PROMOTED, will demote",
+    "pacemaker-controld[1850]: notice: node2 is unclean, lack of quorum",
+    "CROWDSTRIKE ds_agent soft lockup - CPU#1 STUCK FOR 23s",
+    "pacemaker-schedulerd[1849]: notice: Forcing rsc_ip away from node1 due to failures",
+    "corosync[1501]: [TOTEM ] A processor failed",
+    "kernel: nfs: server filer not responding, still trying",
+    "pacemaker-controld[1850]: notice: peer is no longer part of the Kluster",
+    "promoted demoted promote demote",
+    "Node node1 is now lost Node node2 is now lost",
+    "",
+]
+
+# Patterns whose escapes or inline flags the literal extraction must not misread
+ESCAPE_PATTERNS = [r'\x41BCD error', r'Abcd lost', r'\N{LATIN CAPITAL LETTER A}bcd fenced', r'\101\102cd failed',
+                   r'node (\w+) is \1 again', r'(?x) split \s brain', r'(?s)fatal.error', r'(?i)Quorum Lost',
+                   r'(?-i:Quorum) regained', r'(?m)^standby$']
+ESCAPE_MESSAGES = ["ABCD error", "bcd error", "Abcd lost", "abcd fenced", "ABcd failed", "node a is a again",
+                   "node a is b again", "splitbrain", "split brain", "fatal error", "fatal\nerror", "QUORUM LOST",
+                   "Quorum regained", "quorum regained", "standby", "node1 standby"]
+
+SECTION_RULE = "=" * 80
+HOSTS = ('node1', 'node2')
+
+def match_sequential(patterns, line):
+    """
+    :return: The first pattern in file order that the line matches, as the scan did before the matcher.
+    """
+    for pattern in patterns:
+        if pattern.search(line):
+            return pattern
+    return None
+
+@pytest.mark.parametrize('pattern_type', ['pacemaker', 'kernelhung'])
+def test_matcher_matches_like_the_per_pattern_loop(pattern_type, monkeypatch):
+    monkeypatch.chdir(REPO_DIR)
+    patterns = compile_patterns(pattern_type)
+    matcher = PatternMatcher(patterns)
+
+    messages = HIT_MESSAGES + KERNELHUNG_MESSAGES + NOISE_MESSAGES + TRICKY_MESSAGES + [LATIN1_MESSAGE]
+    # Each required literal alone and in other case, the prefilter must not drop a line the pattern matches
+    literals = [extract_required_literal(pattern.pattern) for pattern in patterns]
+    messages += [literal for literal in literals if literal] + [literal.upper() for literal in literals if literal]
+
+    for message in messages:
+        line = f"Feb 16 03:12:45 node1 {message}"
+        assert matcher.match(line) is match_sequential(patterns, line), line
+
+def test_literal_extraction_skips_escape_arguments_and_flags():
+    assert extract_required_literal(r'\x41BCD error') == 'bcd error'
+    assert extract_required_literal(r'\N{LATIN CAPITAL LETTER A}bcd fenced') == 'bcd fenced'
+    assert extract_required_literal(r'\101\102cd failed') == 'cd failed'
+    assert extract_required_literal(r'(?i)Quorum Lost') == 'quorum lost'
+    assert extract_required_literal(r'(?x) split \s brain') is None
+    assert extract_required_literal(r'(?-i:Quorum) regained') is None
+
+    patterns = [re.compile(pattern, re.IGNORECASE) for pattern in ESCAPE_PATTERNS]
+    matcher = PatternMatcher(patterns)
+    for message in ESCAPE_MESSAGES:
+        line = f"Feb 16 03:12:45 node1 {message}"
+        assert matcher.match(line) is match_sequential(patterns, line), line
+
+def log_line(style, moment, hostname, message):
+    if style == 'syslog':
+        return f"{moment:%b %d %H:%M:%S} {hostname} {message}"
+    return f"{moment.astimezone(timezone.utc):%Y-%m-%dT%H:%M:%S.%f}+00:00 {hostname} {message}"
+
+def generate_lines(rng, style, hostname, start, end, count, hit_messages=HIT_MESSAGES):
+    """
+    Yields `count` encoded lines with increasing timestamps from `start` to `end`, one in seven a hit.
+    """
+    step = (end - start) / count
+    for index in range(count):
+        roll = rng.random()
+        message = rng.choice(hit_messages) if roll < 1 / 7 else LATIN1_MESSAGE if roll < 0.16 else rng.choice(NOISE_MESSAGES)
+        yield (log_line(style, start + step * index, hostname, message) + "\n").encode('latin-1')
+
+def write_log_tree(directory, lines=300):
+    """
+    Writes var/log/messages and var/log/ha-log for each of HOSTS, with a gzip and an xz
+    rotation of ha-log from the days before. The files span the last six days and the ha-log
+    of each host starts three weeks back, so --days drops part of it.
+    """
+    now = datetime.now()
+    for host_number, hostname in enumerate(HOSTS):
+        rng = random.Random(host_number)
+        log_dir = os.path.join(directory, hostname, 'var', 'log')
+        os.makedirs(log_dir)
+        with open(os.path.join(log_dir, 'messages'), 'wb') as file:
+            file.writelines(generate_lines(rng, 'syslog', hostname, now - timedelta(days=2), now, lines))
+        with open(os.path.join(log_dir, 'ha-log'), 'wb') as file:
+            file.writelines(generate_lines(rng, 'iso', hostname, now - timedelta(days=21), now, lines))
+        for days_back, opener, extension in ((5, gzip.open, '.gz'), (4, lzma.open, '.xz')):
+            moment = now - timedelta(days=days_back)
+            with opener(os.path.join(log_dir, f"ha-log-{moment:%Y%m%d}{extension}"), 'wb') as file:
+                file.writelines(generate_lines(rng, 'iso', hostname, moment, moment + timedelta(days=1), lines))
+
+@pytest.fixture(scope='module')
+def log_tree(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('bundle') / 'logs'
+    write_log_tree(str(directory))
+    return directory
+
+def run_scan(work_dir, *args, pattern_types=('pacemaker',)):
+    """
+    Runs linux_log_parser.py in `work_dir`.
+
+    :return: A tuple of (report without its generation time, {hostname: timeline}).
+    """
+    os.makedirs(work_dir, exist_ok=True)
+    for pattern_type in pattern_types:
+        for file_name in (f'{pattern_type}_pattern.txt', f'{pattern_type}_filelist.txt'):
+            shutil.copy(os.path.join(REPO_DIR, file_name), work_dir)
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'linux_log_parser.py'), '-t', *pattern_types,
+                             '--days', '8', *map(str, args)], cwd=work_dir, capture_output=True, text=True)
+    assert result.returncode == 0, result.stderr
+
+    report_paths = glob.glob(os.path.join(work_dir, f"{'+'.join(pattern_types)}_[0-9]*.txt"))
+    assert len(report_paths) == 1
+    return read_report(report_paths[0]), read_timelines(work_dir)
+
+def read_report(report_path):
+    with open(report_path) as file:
+        return ''.join(line for line in file if not line.startswith('Report generated on:'))
+
+def read_timelines(work_dir):
+    timelines = {}
+    for timeline_path in glob.glob(os.path.join(work_dir, '*_sort.txt')):
+        with open(timeline_path) as file:
+            timelines[os.path.basename(timeline_path).rsplit('_', 2)[0]] = file.read()
+    return timelines
+
+def split_report(report):
+    """
+    :return: A tuple of (matched lines by file, statistics).
+    """
+    matched, _, statistics = report.partition(SECTION_RULE + "\n")
+    return matched, statistics
+
+def file_sections(report):
+    """
+    :return: A dict of each scanned file to its matched lines in the report.
+    """
+    sections = {}
+    lines = None
+    for line in split_report(report)[0].splitlines():
+        if line.startswith("======= ") and line.endswith(" ======="):
+            lines = sections[line[8:-8]] = []
+        elif line and lines is not None:
+            lines.append(line)
+        else:
+            lines = None
+    return sections
+
+def test_report_is_the_same_for_one_and_several_jobs(log_tree, tmp_path):
+    single = run_scan(tmp_path / 'single', '-d', log_tree, '-j', '1')
+    pooled = run_scan(tmp_path / 'pooled', '-d', log_tree, '-j', '3')
+    assert single == pooled
+    assert sorted(single[1]) == list(HOSTS)
+    # Worker timelines spilled to run files on every line merge into the same timelines
+    spilled = run_scan(tmp_path / 'spilled', '-d', log_tree, '-j', '3', '--timeline-memory', '0')
+    assert spilled == single
+
+def test_state_rerun_keeps_the_statistics_and_reports_only_new_lines(log_tree, tmp_path):
+    directory = tmp_path / 'logs'
+    shutil.copytree(log_tree, directory)
+    state_path = tmp_path / 'state.json'
+    plain = run_scan(tmp_path / 'plain', '-d', directory)
+
+    first = run_scan(tmp_path / 'first', '-d', directory, '--state', state_path)
+    assert first == plain
+
+    repeated = run_scan(tmp_path / 'repeated', '-d', directory, '--state', state_path)
+    matched, statistics = split_report(repeated[0])
+    assert statistics == split_report(first[0])[1]
+    assert "=======" not in matched
+    assert repeated[1] == {}
+
+    appended = log_line('iso', datetime.now(), 'node1', HIT_MESSAGES[1])
+    with open(directory / 'node1' / 'var' / 'log' / 'ha-log', 'a') as file:
+        file.write(appended + "\n")
+    updated = run_scan(tmp_path / 'updated', '-d', directory, '--state', state_path)
+    matched, _ = split_report(updated[0])
+    assert matched.count(appended) == 1
+    assert list(updated[1]) == ['node1']
+    assert updated[1]['node1'].count("\n") == 2
+
+@pytest.fixture
+def pacemaker_matcher(monkeypatch):
+    monkeypatch.chdir(REPO_DIR)
+    return PatternMatcher(compile_patterns('pacemaker'))
+
+def test_follow_reads_appended_and_rotated_lines_once(tmp_path, pacemaker_matcher, monkeypatch):
+    log_dir = tmp_path / 'node1'
+    log_dir.mkdir()
+    log_path = log_dir / 'ha-log'
+    first_lines = [log_line('iso', datetime.now() - timedelta(minutes=10 - index), 'node1', message)
+                   for index, message in enumerate(HIT_MESSAGES[:3] + NOISE_MESSAGES[:2])]
+    log_path.write_text("\n".join(first_lines) + "\n")
+    appended = log_line('iso', datetime.now(), 'node1', HIT_MESSAGES[3])
+    after_rotation = log_line('iso', datetime.now(), 'node1', HIT_MESSAGES[4])
+
+    polls = []
+    def poll(seconds):
+        # Between the polls, a line is appended, then the file is rotated like logrotate does
+        polls.append(seconds)
+        if len(polls) == 1:
+            with open(log_path, 'a') as file:
+                file.write(appended + "\n")
+        elif len(polls) == 2:
+            os.rename(log_path, log_dir / f"ha-log-{datetime.now():%Y%m%d}")
+            log_path.write_text(after_rotation + "\n")
+        else:
+            raise KeyboardInterrupt
+    monkeypatch.setattr(linux_log_parser.time, 'sleep', poll)
+
+    report = io.StringIO()
+    state = ScanState(None, scan_state_fingerprint(pacemaker_matcher, 8))
+    counts = follow_logs(str(tmp_path), read_target_keywords('pacemaker'), pacemaker_matcher, 8, state, 3600,
+                         ScanOutput(report_file=report))
+    text = report.getvalue()
+    for line in first_lines[:3] + [appended, after_rotation]:
+        assert text.count(line) == 1, line
+    assert sum(count for *_, count in counts) == 5
+    assert len(polls) == 3
+
+def test_window_start_skips_only_lines_older_than_days(tmp_path):
+    now = datetime.now()
+    parser = TimestampParser(8, now)
+    lines = [log_line('syslog', now - timedelta(days=30) + timedelta(minutes=10) * index, 'node1', NOISE_MESSAGES[index % 5])
+             for index in range(30 * 24 * 6)]
+    path = tmp_path / 'messages'
+    path.write_text("\n".join(lines) + "\n")
+    size = path.stat().st_size
+
+    with open(path, 'rb') as stream:
+        offset = find_window_start(stream, size, parser)
+    content = path.read_bytes()
+    first_in_window = next(index for index, line in enumerate(lines) if parser.line_in_window(line))
+    in_window_offset = content.index(lines[first_in_window].encode())
+    # A line start within the search precision plus SEEK_MARGIN before the first line inside --days
+    assert content[offset - 1:offset] == b"\n"
+    assert in_window_offset - 2 * linux_log_parser.SEEK_MARGIN - len(lines[0]) - 1 <= offset <= in_window_offset
+
+    # No timestamps to search by, the whole file is scanned
+    path.write_text("no timestamp here\n" * 20000)
+    with open(path, 'rb') as stream:
+        assert find_window_start(stream, path.stat().st_size, parser) == 0
+
+def test_quiet_scan_writes_events_for_each_matched_line(log_tree, tmp_path):
+    plain = run_scan(tmp_path / 'plain', '-d', log_tree)
+    work_dir = tmp_path / 'quiet'
+    quiet = run_scan(work_dir, '-d', log_tree, '-q', '--events', 'events.ndjson')
+    assert quiet == plain
+
+    with open(work_dir / 'events.ndjson', encoding='utf-8') as file:
+        events = [json.loads(line) for line in file]
+    sections = file_sections(plain[0])
+    assert [event['line'] for event in events] == [line for lines in sections.values() for line in lines]
+    assert [event['file'] for event in events] == [file_path for file_path, lines in sections.items() for _ in lines]
+    assert {event['host'] for event in events} == set(HOSTS)
+    assert all(event['timestamp'] and event['pattern'] for event in events)
+
+    result = subprocess.run([sys.executable, os.path.join(REPO_DIR, 'linux_log_parser.py'), '-t', 'pacemaker', '-d', log_tree,
+                             '--days', '8', '-q'], cwd=work_dir, capture_output=True, text=True)
+    assert result.returncode == 0 and result.stdout == ""
+
+def test_profile_counts_every_line_read(log_tree, pacemaker_matcher):
+    profile = ScanProfile(pacemaker_matcher)
+    output = ScanOutput(report_file=io.StringIO())
+    file_paths = sorted(glob.glob(os.path.join(log_tree, 'node1', 'var', 'log', '*')))
+    for file_path in file_paths:
+        parse_log(file_path, pacemaker_matcher, new_error_hourly_counts(), 8, output, profile=profile)
+
+    sections = file_sections(output.report_file.getvalue())
+    for file_path in file_paths:
+        opener = {'.gz': gzip.open, '.xz': lzma.open}.get(os.path.splitext(file_path)[1], open)
+        with opener(file_path, 'rb') as file:
+            content = file.read()
+        stats = profile.files[file_path]
+        # The files are smaller than SEEK_MARGIN, so the plain ones are read from the start too
+        assert stats['lines'] == content.count(b"\n")
+        # Lines older than --days still count as matches, but are not reported
+        if file_path.endswith('ha-log'):
+            assert stats['matches'] > len(sections[file_path]) > 0
+        else:
+            assert stats['matches'] == len(sections[file_path]) > 0
+        assert stats['matches'] <= stats['candidates'] <= stats['lines']
+        # Plain files are prefiltered a chunk at a time, compressed ones line by line
+        if opener is open:
+            assert stats['candidates'] < stats['lines']
+
+    summary = io.StringIO()
+    profile.print_summary(ScanOutput(report_file=summary))
+    totals = profile.totals()
+    assert f"{totals['lines']} lines ({totals['candidates']} past the prefilter), {totals['matches']} matches" in summary.getvalue()
+
+def test_chunk_prefilter_yields_the_lines_the_patterns_match(pacemaker_matcher, monkeypatch):
+    # Small chunks so lines are split across chunk boundaries
+    monkeypatch.setattr(linux_log_parser, 'MAPPED_CHUNK_SIZE', 97)
+    messages = HIT_MESSAGES + NOISE_MESSAGES + TRICKY_MESSAGES
+    lines = [log_line('syslog', datetime(2026, 2, 16, 3, 12, 45), 'node1', message) for message in messages]
+    # \n, \r\n and lone \r line ends, a non-ASCII line and an unterminated last line
+    raw = b"".join(line.encode() + (b"\n", b"\r\n", b"\r")[index % 3] for index, line in enumerate(lines))
+    raw += "Feb 16 03:12:45 node1 pacemaker-fenced: Fence für node2".encode('utf-8') + b"\n"
+    raw += lines[0].encode()
+    all_lines = raw.decode('utf-8').splitlines()
+
+    file_stats = dict.fromkeys(ScanProfile.FILE_FIELDS, 0)
+    candidates = list(iter_candidate_lines(raw, 0, pacemaker_matcher, file_stats=file_stats))
+    assert file_stats['lines'] == len(all_lines)
+    assert set(candidates) <= set(all_lines)
+    expected = [line for line in all_lines if pacemaker_matcher.match(line)]
+    assert [line for line in candidates if pacemaker_matcher.match(line)] == expected
+    assert len(candidates) < len(all_lines)
+    assert all_lines[-2] in candidates
+
+def make_archive(directory, archive_path):
+    # Members in os.walk order, as tar adds them from the directory listing
+    with tarfile.open(archive_path, 'w:gz') as archive:
+        for root, _, file_names in os.walk(directory):
+            archive.add(root, arcname=os.path.relpath(root, directory.parent), recursive=False)
+            for file_name in file_names:
+                file_path = os.path.join(root, file_name)
+                archive.add(file_path, arcname=os.path.relpath(file_path, directory.parent))
+
+def test_report_is_the_same_for_a_directory_and_its_archive(log_tree, tmp_path):
+    # Next to the directory, so the members are named as the extracted files
+    archive_path = log_tree.parent / 'logs.tar.gz'
+    make_archive(log_tree, archive_path)
+    plain = run_scan(tmp_path / 'plain', '-d', log_tree)
+    archived = run_scan(tmp_path / 'archived', '-d', archive_path, '--timeline-memory', '0')
+    assert plain == archived
+
+def test_directory_scan_dedups_rotations_per_directory(log_tree, tmp_path):
+    directory = tmp_path / 'logs'
+    shutil.copytree(log_tree, directory)
+    rotation = os.path.basename(glob.glob(os.path.join(directory, 'node1', 'var', 'log', 'ha-log-*.gz'))[0])
+    # A plain copy next to the compressed rotation is skipped
+    with gzip.open(directory / 'node1' / 'var' / 'log' / rotation, 'rb') as source:
+        (directory / 'node1' / 'var' / 'log' / rotation[:-3]).write_bytes(source.read())
+
+    report, _ = run_scan(tmp_path / 'scan', '-d', directory)
+    headers = [line for line in report.splitlines() if line.startswith("======= ")]
+    # The rotation with the same name on each host is scanned for both hosts
+    for hostname in HOSTS:
+        assert f"======= {directory / hostname / 'var' / 'log' / rotation} =======" in headers
+    assert not any(header.endswith(f"{rotation[:-3]} =======") for header in headers)
+
+def test_several_types_scan_like_one_type_each(log_tree, tmp_path):
+    directory = tmp_path / 'logs'
+    shutil.copytree(log_tree, directory)
+    now = datetime.now()
+    with open(directory / 'node2' / 'var' / 'log' / 'messages', 'ab') as file:
+        file.writelines(generate_lines(random.Random(7), 'syslog', 'node2', now - timedelta(hours=1), now, 50,
+                                       KERNELHUNG_MESSAGES))
+
+    work_dir = tmp_path / 'combined'
+    combined = run_scan(work_dir, '-d', directory, pattern_types=('pacemaker', 'kernelhung'))
+    for pattern_type in ('pacemaker', 'kernelhung'):
+        single, _ = run_scan(tmp_path / pattern_type, '-d', directory, pattern_types=(pattern_type,))
+        type_reports = glob.glob(os.path.join(work_dir, f'{pattern_type}_[0-9]*.txt'))
+        assert len(type_reports) == 1
+        assert split_report(read_report(type_reports[0]))[0] == split_report(single)[0]
+    statistics = split_report(combined[0])[1]
+    assert "[kernelhung] " in statistics and "[pacemaker] " in statistics
+
+def build_journal(entries, compact=False, array_size=2, compressed_fields=()):
+    """
+    Builds the objects of a systemd journal file that JournalReader reads: the header, a
+    DATA object per field, an ENTRY object per entry and a chain of ENTRY_ARRAY objects of
+    `array_size` items.
+
+    :param entries: A list of (realtime in microseconds, {field: value}).
+    :param compressed_fields: Fields whose DATA payload is XZ compressed.
+    """
+    header_size = 272
+    data = bytearray()
+
+    def add_object(object_type, flags, body):
+        offset = header_size + len(data)
+        data.extend(struct.pack('<BB6xQ', object_type, flags, 16 + len(body)) + body)
+        data.extend(b"\0" * (-len(data) % 8))
+        return offset
+
+    entry_offsets = []
+    for seqnum, (realtime, fields) in enumerate(entries, 1):
+        data_offsets = []
+        for field, value in fields.items():
+            payload = field + b"=" + value
+            compressed = field in compressed_fields
+            if compressed:
+                payload = lzma.compress(payload)
+            # Hash, next hash, next field, entry, entry array, n_entries (and tail/n_entry_array when compact)
+            data_offsets.append(add_object(JournalReader.OBJECT_DATA, JournalReader.COMPRESSED_XZ if compressed else 0,
+                                           b"\0" * (56 if compact else 48) + payload))
+        # seqnum, realtime, monotonic, boot ID and xor_hash, then the items
+        items = b"".join(struct.pack('<I', offset) if compact else struct.pack('<QQ', offset, 0) for offset in data_offsets)
+        entry_offsets.append(add_object(JournalReader.OBJECT_ENTRY, 0, struct.pack('<QQQ16sQ', seqnum, realtime, 0, b"", 0) + items))
+
+    item_format = '<I' if compact else '<Q'
+    chunks = [entry_offsets[start:start + array_size] for start in range(0, len(entry_offsets), array_size)]
+    array_offset = next_offset = header_size + len(data)
+    for position, chunk in enumerate(chunks):
+        body_size = 8 + len(chunk) * struct.calcsize(item_format)
+        next_offset += 16 + body_size + (-(16 + body_size) % 8)
+        items = b"".join(struct.pack(item_format, offset) for offset in chunk)
+        add_object(JournalReader.OBJECT_ENTRY_ARRAY, 0,
+                   struct.pack('<Q', next_offset if position < len(chunks) - 1 else 0) + items)
+
+    header = bytearray(header_size)
+    header[:8] = linux_log_parser.JOURNAL_SIGNATURE
+    struct.pack_into('<I', header, 12, JournalReader.INCOMPATIBLE_COMPACT if compact else 0)
+    struct.pack_into('<Q', header, 152, len(entries))
+    struct.pack_into('<3Q', header, 176, array_offset, entries[0][0], entries[-1][0])
+    return bytes(header + data)
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_journal_reader_formats_entries_like_journalctl(compact, monkeypatch):
+    now = int(time.time()) * 1000000
+    entries = [
+        (now - 3 * 86400000000, {b'MESSAGE': b"old entry", b'_HOSTNAME': b"node1", b'SYSLOG_IDENTIFIER': b"systemd", b'_PID': b"1"}),
+        (now - 7200000000, {b'MESSAGE': HIT_MESSAGES[1].split(": ", 1)[1].encode(), b'_HOSTNAME': b"node1",
+                            b'SYSLOG_IDENTIFIER': b"pacemaker-controld", b'_PID': b"1850"}),
+        # Logged by the sender before journald received it, in two lines
+        (now - 3600000000, {b'MESSAGE': b"first line\nsecond line", b'_HOSTNAME': b"node1", b'_COMM': b"corosync",
+                            b'_SOURCE_REALTIME_TIMESTAMP': str(now - 3605000000).encode()}),
+        (now, {b'MESSAGE': b"compressed message", b'_HOSTNAME': b"node2", b'SYSLOG_IDENTIFIER': b"kernel"}),
+    ]
+    reader = JournalReader(build_journal(entries, compact=compact, compressed_fields=(b'MESSAGE',)))
+    assert len(reader) == 4
+    assert [fields[b'MESSAGE'] for _, fields in reader.entries()] == [fields[b'MESSAGE'] for _, fields in entries]
+    assert [realtime for realtime, _ in reader.entries(2)] == [now - 3600000000, now]
+
+    monkeypatch.setattr(linux_log_parser, 'JOURNAL_SEEK_MARGIN', 0)
+    assert reader.find_entry(now - 7200000000) == 1
+    assert reader.find_entry(now - 7199999999) == 2
+    assert reader.find_entry(now + 1) == 4
+
+    def short_time(realtime):
+        return time.strftime('%b %d %H:%M:%S', time.localtime(realtime // 1000000))
+    assert list(iter_journal_lines(reader, 1)) == [
+        f"{short_time(now - 7200000000)} node1 {HIT_MESSAGES[1]}\n",
+        f"{short_time(now - 3605000000)} node1 corosync: first line\n",
+        "second line\n",
+        f"{short_time(now)} node2 kernel: compressed message\n",
+    ]
+
+def test_journal_scan_starts_inside_days(tmp_path, pacemaker_matcher):
+    now = int(time.time()) * 1000000
+    message = HIT_MESSAGES[1].split(": ", 1)[1].encode()
+    entries = [(now - days * 86400000000, {b'MESSAGE': message, b'_HOSTNAME': b"node1", b'SYSLOG_IDENTIFIER': b"pacemaker-controld"})
+               for days in (20, 10, 2, 1)]
+    report = io.StringIO()
+    counts = new_error_hourly_counts()
+    scan_journal(build_journal(entries), 'system.journal', pacemaker_matcher, counts, 8, ScanOutput(report_file=report))
+    assert sum(count for *_, count in counts) == 2
+    assert report.getvalue().count("pacemaker-controld: notice: Node node2 state is now lost") == 2
+
+def test_incidents_are_split_by_the_gap_between_staged_lines():
+    correlator = IncidentCorrelator(300)
+    lines = [
+        ("2026-02-16 03:12:40", 'node1', "corosync[1501]: [TOTEM ] A processor failed, forming new configuration"),
+        ("2026-02-16 03:12:45", 'node1', "pacemaker-controld[1850]: notice: Node node2 state is now lost"),
+        ("2026-02-16 03:12:46", 'node1', "systemd[1]: Started Session 42 of user root."),
+        ("2026-02-16 03:12:47", 'node1', "pacemaker-fenced[1847]: notice: node2 will be fenced: peer is no longer part of the cluster"),
+        ("2026-02-16 03:13:30", 'node1', "pacemaker-fenced[1847]: notice: Operation 'reboot' targeting node2 by node1: OK"),
+        ("2026-02-16 03:14:02", 'node1', "pacemaker-controld[1850]: notice: Result of promote operation for rsc_SAPHana on node1: ok"),
+        # More than 300 seconds later
+        ("2026-02-16 04:00:00", 'node2', "pacemaker-controld[1850]: notice: Node node1 state is now lost"),
+    ]
+    closed = [incident for incident in (correlator.add(*line) for line in lines) if incident is not None]
+    assert len(closed) == 1
+    incident = closed[0]
+    assert list(incident['stages']) == ['membership_loss', 'fence_request', 'fence_result', 'failover']
+    assert incident['stages']['membership_loss']['count'] == 2
+    assert incident['events'] == 5
+    assert (incident['start'], incident['end'], incident['duration']) == ("2026-02-16 03:12:40", "2026-02-16 03:14:02", 82)
+    assert incident['hosts'] == {'node1': 5}
+
+    last = correlator.finish()
+    assert last['hosts'] == {'node2': 1} and list(last['stages']) == ['membership_loss']
+    assert correlator.finish() is None
+
+def test_count_matrix_sums_files_and_finds_spikes(tmp_path):
+    pytest.importorskip('numpy')
+    counts = new_error_hourly_counts()
+    for hour in range(30):
+        counts.add('node1', 'lost', f"2026-02-{1 + hour // 24:02d} {hour % 24:02d}", 'messages', 1)
+    counts.add('node1', 'lost', "2026-02-02 05", 'ha-log', 40)
+    counts.add('node2', 'fenced', "2026-02-01 10", 'messages', 2)
+
+    matrix = CountMatrix(counts)
+    assert matrix.counts.shape == (2, 30)
+    assert matrix.bucket_label(0) == "2026-02-01 00:00"
+    row = [position for position in range(2) if matrix.hostnames[matrix.host_index[position]] == 'node1'][0]
+    assert matrix.counts[row, 29] == 41
+    assert int(matrix.counts.sum()) == 30 + 40 + 2
+
+    spikes = matrix.spikes(window=24, threshold=3.0)
+    assert [(spike_row, column, count) for spike_row, column, count, _, _ in spikes] == [(row, 29, 41)]
+    column, total, contributors = matrix.busiest_buckets(1)[0]
+    assert (column, total, contributors) == (29, 41, [(row, 41)])
+
+    csv_path = tmp_path / 'counts.csv'
+    matrix.write_csv(str(csv_path))
+    rows = csv_path.read_text().splitlines()
+    assert rows[0] == "bucket,hostname,pattern,count"
+    assert "2026-02-02 05:00,node1,lost,41" in rows
+    assert len(rows) == 1 + 30 + 1
+
+def test_minute_buckets_split_the_hour_and_keep_the_hourly_state_fingerprint(tmp_path, pacemaker_matcher):
+    start = datetime.now().replace(minute=10, second=0, microsecond=0) - timedelta(hours=1)
+    path = tmp_path / 'messages'
+    path.write_text("".join(log_line('syslog', start + timedelta(minutes=minutes), 'node1', HIT_MESSAGES[1]) + "\n"
+                            for minutes in (0, 1, 1)))
+
+    minute_counts = new_error_hourly_counts(linux_log_parser.MINUTE_BUCKET_LENGTH)
+    parse_log(str(path), pacemaker_matcher, minute_counts, 8, ScanOutput())
+    assert sorted((date_minute, count) for _, _, date_minute, _, count in minute_counts) == [
+        (f"{start:%Y-%m-%d %H:%M}", 1), (f"{start + timedelta(minutes=1):%Y-%m-%d %H:%M}", 2)]
+    hour_counts = new_error_hourly_counts()
+    parse_log(str(path), pacemaker_matcher, hour_counts, 8, ScanOutput())
+    assert [(date_hour, count) for _, _, date_hour, _, count in hour_counts] == [(f"{start:%Y-%m-%d %H}", 3)]
+
+    # State files written before minute buckets existed stay valid for hourly runs
+    fingerprint = scan_state_fingerprint(pacemaker_matcher, 8)
+    assert scan_state_fingerprint(pacemaker_matcher, 8, linux_log_parser.HOUR_BUCKET_LENGTH) == fingerprint
+    assert scan_state_fingerprint(pacemaker_matcher, 8, linux_log_parser.MINUTE_BUCKET_LENGTH) != fingerprint
+
+def test_index_answers_reruns_and_queries_like_a_scan(log_tree, tmp_path):
+    index_path = tmp_path / 'bundle.sqlite'
+    plain = run_scan(tmp_path / 'plain', '-d', log_tree)
+    indexed = run_scan(tmp_path / 'indexed', '-d', log_tree, '--index', index_path)
+    queried = run_scan(tmp_path / 'queried', '-d', log_tree, '--index', index_path, '--query')
+    pooled = run_scan(tmp_path / 'pooled', '-d', log_tree, '--index', tmp_path / 'pooled.sqlite', '-j', '3')
+    for report, timelines in (indexed, queried, pooled):
+        assert split_report(report)[1] == split_report(plain[0])[1]
+        assert timelines == plain[1]
+
+    connection = sqlite3.connect(index_path)
+    events = connection.execute("SELECT COUNT(*) FROM events").fetchone()[0]
+    connection.close()
+    assert events == sum(timeline.count("\n") - 1 for timeline in plain[1].values())
+
+    node2 = run_scan(tmp_path / 'node2', '-d', log_tree, '--index', index_path, '--query', '--host', 'node2')
+    assert list(node2[1]) == ['node2'] and node2[1]['node2'] == plain[1]['node2']
+
+def test_read_ahead_hands_out_whole_decompressed_files(log_tree, tmp_path):
+    compressed_paths = sorted(glob.glob(os.path.join(log_tree, '*', 'var', 'log', 'ha-log-*')))
+    broken_path = str(tmp_path / 'ha-log-broken.gz')
+    with open(broken_path, 'wb') as file:
+        file.write(b"not gzip data")
+    read_ahead = ReadAhead(compressed_paths + [broken_path], 8, 2)
+    try:
+        for file_path in compressed_paths:
+            opener = gzip.open if file_path.endswith('.gz') else lzma.open
+            with opener(file_path, 'rb') as file:
+                assert b"".join(read_ahead.reader(file_path)) == file.read()
+        # Not in the list read ahead, started on demand
+        plain_copy = tmp_path / 'ha-log-copy.gz'
+        shutil.copy(compressed_paths[0], plain_copy)
+        assert b"".join(read_ahead.reader(str(plain_copy)))
+        with pytest.raises(Exception):
+            b"".join(read_ahead.reader(broken_path))
+    finally:
+        read_ahead.close()
+    assert read_ahead.readers == {}